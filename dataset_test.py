@@ -1,6 +1,11 @@
+import os
+import sys
+import math
 from os import listdir
 import time
-from myontology import MyOWLOntology, AnnSim, AnnotationComparison
+import numpy as np
+from myontology import MyOWLOntology, AnnSim
+from ontoindex import SimilarityMatrix
 
 
 class DatasetTest():
@@ -37,9 +42,20 @@ class DatasetTest():
                 line = f.readline()
         
         return list(annotations)
+    
+    @staticmethod
+    def get_folder_annotations(folder: str, o: MyOWLOntology) -> list:
+        # every term annotated in the folder, the seeds of the module the experiment can load
+        annotations = set()
+        for concept_name in listdir(folder):
+            annotations.update(DatasetTest.get_concept_annotations(concept_name, folder, o))
+        
+        return list(annotations)
 
 
 class ComparisonResult():
+    __slots__ = ('concept_A', 'concept_B', 'similarity')
+
     def __init__(self, a: str, b: str):
         self.concept_A = a
         self.concept_B = b
@@ -69,12 +85,26 @@ class ComparisonResult():
         return False
 
 
-def run_test():
+def run_test(module: bool=False, aggregators: bool=False):
+    """
+    :param module: compute on the part of the ontology reachable from the annotated terms, extracted
+    once into ontologies/snapshots, instead of on the whole ontology
+    :param aggregators: also write results_<name>.txt for the other AnnSim.AGGREGATORS
+    """
     prefixs = ['resources/dataset3/']
     for prefix in prefixs:
         # ont_file = prefix + 'goProtein/go.owl'
         ont_file = 'ontologies/go.owl'
-        o = MyOWLOntology(ont_file, pr='http://purl.org/obo/owl/GO#')
+        if module:
+            module_file = 'ontologies/snapshots/go_' + os.path.basename(os.path.normpath(prefix)) + '_bp_annt_2008.nt'
+            if not os.path.exists(module_file):
+                os.makedirs(os.path.dirname(module_file), exist_ok=True)
+                go = MyOWLOntology(ont_file, pr='http://purl.org/obo/owl/GO#', compiled=True)
+                seeds = [c.get_uri() for c in DatasetTest.get_folder_annotations(prefix + 'bp_annt_2008', go)]
+                go.extract_module(seeds, module_file)
+                del go
+            ont_file = module_file
+        o = MyOWLOntology(ont_file, pr='http://purl.org/obo/owl/GO#', snapshot_dir='ontologies/snapshots')
 
         comparison_file = prefix + 'proteinpairs.txt'
         comparisons = DatasetTest.read_comparison_file(comparison_file)
@@ -85,39 +115,54 @@ def run_test():
             p_names = listdir(f)
             entities.update(p_names)
         
-        concept_comparisons = set()
+        annotations = {}  # (protein, annotation folder): list of annotation concepts
         for comp in comparisons:
             for file in files:
-                a = DatasetTest.get_concept_annotations(comp.get_concept_A(), file, o)
-                b = DatasetTest.get_concept_annotations(comp.get_concept_B(), file, o)
-                for c1 in a:
-                    for c2 in b:
-                        concept_comparisons.add(AnnotationComparison(c1, c2))
-        
-        cost_matrix = {}
+                for name in [comp.get_concept_A(), comp.get_concept_B()]:
+                    if (name, file) not in annotations:
+                        annotations[(name, file)] = DatasetTest.get_concept_annotations(name, file, o)
+        cost_matrix = SimilarityMatrix([c for anns in annotations.values() for c in anns])
+
+        # every unordered pair of terms compared by some protein pair, in the orientation it first appears
+        concept_comparisons = []
+        for comp in comparisons:
+            for file in files:
+                ids_a = cost_matrix.get_ids(annotations[(comp.get_concept_A(), file)])
+                ids_b = cost_matrix.get_ids(annotations[(comp.get_concept_B(), file)])
+                concept_comparisons.append(np.stack(np.meshgrid(ids_a, ids_b, indexing='ij'), axis=-1).reshape(-1, 2))
+        concept_comparisons = np.concatenate(concept_comparisons) if concept_comparisons else np.zeros((0, 2), dtype=np.int64)
+        keys = concept_comparisons.min(axis=1) * len(cost_matrix) + concept_comparisons.max(axis=1)
+        _, first = np.unique(keys, return_index=True)
+
         index = 0
         tic = time.perf_counter()
-        for comparison in list(concept_comparisons):
-            sim = comparison.get_concept_A().similarity(comparison.get_concept_B())
-            cost_matrix[comparison] = sim
+        for i, j in concept_comparisons[np.sort(first)].tolist():
+            sim = cost_matrix.terms[i].similarity(cost_matrix.terms[j])
+            cost_matrix.set(i, j, sim)
             index += 1
             if index % 100 == 0:
                 print(index, time.perf_counter() - tic)
+        # neighbors computed here are read back by the next run on the same module
+        o.save_derived_cache()
 
         bpm = AnnSim(cost_matrix)
+        # every protein pair is solved in one call, the pairs matching fails on are left out as before
+        pairs = [(comp, annotations[(comp.get_concept_A(), file)], annotations[(comp.get_concept_B(), file)])
+                 for comp in comparisons for file in files]
+        # results.txt keeps the Hungarian matching, the other aggregators reuse the same term similarities
+        names = AnnSim.AGGREGATORS if aggregators else ['hungarian']
+        sims = bpm.group_similarities([(a, b) for _, a, b in pairs], names)
 
-        with open(prefix + 'results.txt', 'wt') as f:
-            for comp in comparisons:
-                for file in files:
-                    a = DatasetTest.get_concept_annotations(comp.get_concept_A(), file, o)
-                    b = DatasetTest.get_concept_annotations(comp.get_concept_B(), file, o)
-                    try:
-                        sim = bpm.matching(a, b, None, None)
-                    except Exception:
+        for name in names:
+            out_file = prefix + ('results.txt' if name == 'hungarian' else 'results_' + name + '.txt')
+            with open(out_file, 'wt') as f:
+                for (comp, _, _), sim in zip(pairs, sims[name].tolist()):
+                    if math.isnan(sim):
                         continue
                     comp.set_similarity(sim)
                     f.write(str(comp) + '\r\n')
-                    print(comp)
+                    if name == 'hungarian':
+                        print(comp)
 
 if __name__ == '__main__':
-    run_test()
\ No newline at end of file
+    run_test(module='--module' in sys.argv[1:], aggregators='--aggregators' in sys.argv[1:])
\ No newline at end of file
@@ -10,6 +10,8 @@ from rdflib import OWL
 from rdflib.plugins.sparql import prepareQuery
 import utils
 import time
+from ontostore import parse_graph, update_store
+from ontoindex import EntityTable, HierarchyIndex, LCSEngine, ReachabilityIndex, SimilarityCache, SimilarityMatrix, UriSet
 import re
 from flask import abort
 import json
@@ -17,19 +19,22 @@ import requests
 import sys
 
 class MyOWLOntology():
-    def __init__(self, ont_file, pr: str=None):
+    def __init__(self, ont_file, pr: str=None, similarity_cache: int=64 << 20):
         self.concepts = {}  # string: owl_concept
         self._concepts = []  # URIRef
-        self.individuals = {}  # string: myowl_individual
-        self._individuals = []  # URIRef
+        self.individuals = {}  # string: myowl_individual, created when first requested
+        self._individuals = UriSet()  # uri of every individual
         self.relations = {}  # string: wol_relation
         self._relations = []  # URIRef
+        self.entities = EntityTable()  # URIRef: dense id and kind
         self.ancestors = {}  # owl_logical_entity: set of owl_class
         self.concept_distances = {}  # owl_class: dictionary of owl_class: integer
-        self.lcas = {}  # annotation_comparison: owl_concept
+        self.lcas = None  # LCSEngine, bounded cache of least common subsumers
+        self.restriction_graph = None  # ReachabilityIndex over rdfs:subClassOf / owl:someValuesFrom
         self.concept_profs = {}
         self.relation_profs = {}
         self.property_chains = {}
+        self.similarities = SimilarityCache(similarity_cache)  # symmetric memo of entity similarities, bytes capped
         self.exp_id = 0
         self.storing = True
         self.prefix = pr
@@ -70,9 +75,9 @@ class MyOWLOntology():
         print('Parsing ontology...')
         if type(ont_file) == list:  # multiple graphs
             for of in ont_file:
-                self.o.parse(of)
+                parse_graph(self.o, of)
         else:
-            self.o.parse(ont_file)
+            parse_graph(self.o, ont_file)
             # self.go = get_ontology(ont_file).load()
 
         # object_properties = list(set([s for s, _, _ in self.o.triples((None, RDF.type, OWL.ObjectProperty))]))
@@ -105,15 +110,23 @@ class MyOWLOntology():
             self.concepts[cl.n3()[1:-1]] = OWLConcept(cl, self)
         self._concepts = [con.cl for con in self.concepts.values()]
         print('Classes read')
+
+        self.hierarchy = HierarchyIndex(self._concepts, self.__get_edges('rdfs:subClassOf'), top=OWL.Thing)
+        self.property_hierarchy = HierarchyIndex(self._relations, self.__get_edges('rdfs:subPropertyOf'),
+                                                 top=OWL.topObjectProperty)
+        self.lcas = LCSEngine(self.hierarchy)
+        self.entities.update(self.hierarchy.nodes, EntityTable.CONCEPT)
+        self.entities.update(self.property_hierarchy.nodes, EntityTable.RELATION)
+        print('Hierarchy indexed')
         # print('http://research.tib.eu/p4-lucat/vocab/Patient_RT_Area', 'and', 'http://research.tib.eu/p4-lucat/vocab/Patient_RT_Intention', 'has similarity ', self.get_OWL_concept('http://research.tib.eu/p4-lucat/vocab/Patient_RT_Area').similarity_neighbors(self.get_OWL_concept('http://research.tib.eu/p4-lucat/vocab/Patient_RT_Intention')))
         # for c1, c2 in zip(list(self.concepts.values())[20:30], list(self.concepts.values())[50:60]):
         #     print(str(c1), 'and', str(c2), 'has similarity ', c1.similarity_neighbors(c2))
         # utils.similarity2csv(np.array(list(self.concepts.values()))[np.random.randint(len(classes), size=40)], np.array(list(self.concepts.values()))[np.random.randint(len(classes), size=40)], file='results/class_taxonomic_sim.csv', sim_type='similarity', cartesian=False)
 
-        indivs = set()
+        indivs = []
         offset = 0
         while True:
-            query_res = [rdflib.URIRef(v['s']) for v in QueryService.query(
+            query_res = [v['s'] for v in QueryService.query(
                 '''
                 select distinct ?s
                 where {
@@ -125,15 +138,12 @@ class MyOWLOntology():
             )]
             if len(query_res) == 0:
                 break
-            indivs.update(query_res)
+            indivs.extend(s for s in query_res if self.concepts.get(s) is None)
             offset += 1e6
             break
-        indivs.difference(classes)
-        indivs = list(indivs)
-        for ind in indivs:
-            if self.concepts.get(ind.n3()[1:-1]) is None:
-                self.individuals[ind.n3()[1:-1]] = MyOWLIndividual(ind, self)
-        self._individuals = [ind.ind for ind in self.individuals.values()]
+        # only the uris are kept, MyOWLIndividual objects are built by get_OWL_individual
+        self._individuals = UriSet(indivs)
+        del indivs
         print('Individuals read')
         # for ind1, ind2 in zip(list(self.individuals.values())[30:40], list(self.individuals.values())[50:60]):
         #     print(str(ind1), 'and', str(ind2), 'has taxonomic similarity ', ind1.similarity(ind2))
@@ -242,6 +252,29 @@ class MyOWLOntology():
         utils.generate_bigraph(patients, c_trials, edges)
         # ---------generate graph files for semEP-----------
 
+    def __get_edges(self, predicate: str, page: int=1000000):
+        edges = []
+        offset = 0
+        while True:
+            query_res = QueryService.query(
+                '''
+                select distinct ?s ?o
+                where {
+                    ?s ?p ?o.
+                    filter(!isBlank(?s) && !isBlank(?o))
+                }
+                '''.replace('?p', predicate) + ' offset {:d} limit {:d}'.format(offset, page)
+                , self.endpoint
+            )
+            if not query_res:
+                break
+            edges.extend((rdflib.URIRef(v['s']), rdflib.URIRef(v['o'])) for v in query_res)
+            if len(query_res) < page:
+                break
+            offset += page
+
+        return edges
+
     def __get_all_properties(self):
         properties = set()
         # for s, p, o in self.o.triples((None, RDF.type, OWL.ObjectProperty)):
@@ -747,7 +780,7 @@ class MyOWLOntology():
             }'''.replace('?s', ind.get_OWL_named_individual().n3())
             , self.endpoint
         ):
-            if rdflib.URIRef(v['p']) in self._relations and \
+            if self.entities.is_relation(rdflib.URIRef(v['p'])) and \
                 len(QueryService.query(
                     '''
                     select distinct ?o
@@ -762,7 +795,7 @@ class MyOWLOntology():
                         continue
                     link = OWLLink(self.get_OWL_relation(v['p']), self.get_OWL_individual(v['o']))
                     owl_links.add(link)
-            elif rdflib.URIRef(v['p']) in self._relations and \
+            elif self.entities.is_relation(rdflib.URIRef(v['p'])) and \
                 len(QueryService.query(
                     '''
                     select distinct ?s
@@ -913,46 +946,26 @@ class MyOWLOntology():
 
         return owl_links
     
-    def get_island(self, c: OWLConcept, visited: set=set()) -> set:
+    def get_island(self, c: OWLConcept) -> set:
+        # classes reachable from c through chains of existential restrictions, the edges of q1
+        if self.restriction_graph is None:
+            self.restriction_graph = ReachabilityIndex(self.__get_restriction_edges())
         island = set()
-        # q = '''
-        #     SELECT ?obj
-        #     WHERE {
-        #         ?c rdfs:subClassOf ?sc.
-        #         ?sc owl:someValuesFrom ?obj.
-        #     }  
-        #     '''.replace('?c', c.cl.n3())
-
-        # class_exps = [qres.obj for qres in self.o.query(q)]  # all super class expressions
-        # for ce in class_exps:
-        # for qres in self.o.query(q):
-        
-        for qres in self.o.query(self.prepared_queries['q1'], initBindings={'c': c.cl}):
-            ce = qres.obj
-            destiny_concept = self.get_OWL_concept(ce.n3()[1:-1])
-            if destiny_concept not in visited:
-                island.add(destiny_concept)
-                visited.add(destiny_concept)
-                island.update(self.get_island(destiny_concept, visited))
-        # for qres in QueryService.query(self.prepared_queries['q1'].replace('?c', c.cl.n3()), 'tib-lucat'):
-        #     ce = rdflib.URIRef(qres['obj'])
-        #     destiny_concept = self.get_OWL_concept(ce.n3()[1:-1])
-        #     if destiny_concept not in visited:
-        #         island.add(destiny_concept)
-        #         visited.add(destiny_concept)
-        #         island.update(self.get_island(destiny_concept, visited))
-        
-        # print(list(self.prepared_queries['q1'].execute(['owl:' + c.cl.n3()[1:-10]])))
-        # for qres in self.prepared_queries['q1'].execute([c.cl.n3()]):
-        #     print(qres)
-        #     ce = qres.obj
-        #     destiny_concept = self.get_OWL_concept(ce.n3()[1:-1])
-        #     if destiny_concept not in visited:
-        #         island.add(destiny_concept)
-        #         visited.add(destiny_concept)
-        #         island.update(self.get_island(destiny_concept, visited))
-        
+        for ce in self.restriction_graph.get_reachable(c.cl):
+            island.add(self.get_OWL_concept(ce.n3()[1:-1]))
+
         return island
+
+    def __get_restriction_edges(self) -> list:
+        edges = []
+        for s, _, sc in self.o.triples((None, RDFS.subClassOf, None)):
+            # anonymous classes never start an island, their fillers are leaves
+            if isinstance(s, rdflib.BNode):
+                continue
+            for obj in self.o.objects(sc, OWL.someValuesFrom):
+                edges.append((s, obj))
+
+        return edges
     
     def check_OWL_link(self, c1: OWLConcept, r: OWLRelation, c2: OWLConcept) -> bool:
         a = c1.get_OWL_class()
@@ -994,31 +1007,152 @@ class MyOWLOntology():
             if isinstance(e, OWLConcept):
                 concepts_E.add(e)
             else:
-                e.gei_neighbors()
+                e.get_neighbors()
         self.set_OWL_links_concepts(list(concepts_E))
     
-    def set_OWL_links_concepts(self, concepts: list):
-        axioms = {}
-        
+    def set_OWL_links_concepts(self, concepts: list=None):
+        # neighbors come from the endpoint, concept by concept
+        if concepts is None:
+            concepts = [self.get_OWL_concept(cl.n3()[1:-1]) for cl in self._concepts]
         for c in concepts:
-            potential_neighbors = self.get_island(c)
-            register = self.add_equivalent_axioms(c, potential_neighbors)
-            axioms[c] = register
-        
-        for c in axioms.keys():
-            a = c.get_OWL_class()
-            register = axioms[c]
-            links = set()
-            for test in register.keys():
-                expression = register[test]
-                links.update(self.conformed_links(a, test, expression))
-            c.set_neighbors(links)
-        
-        for c in axioms.keys():
-            register = axioms[c]
-            for test in register.keys():
-                expression = register[test]
-    
+            c.set_neighbors(self.get_concept_OWL_link(c))
+        print('Neighbors set for', len(concepts), 'concepts')
+
+    def apply_delta(self, added: list=(), removed: list=()):
+        """
+        Refresh the derived state after triples were added to or removed from the endpoint
+        The endpoint already holds the delta, only the indexes and caches built from it are updated.
+        Schema triples are mirrored into the local graph read by the restriction edges.
+        :param added: (s, p, o) triples
+        :param removed: (s, p, o) triples
+
+        :return: None
+        """
+        added, removed = list(added), list(removed)
+        schema_predicates = {RDFS.subClassOf, RDFS.subPropertyOf, RDFS.domain, RDFS.range,
+                             OWL.onProperty, OWL.someValuesFrom, OWL.propertyChain}
+        if self.restriction_graph is not None:
+            # islands behind materialized neighbors have to be memoized to tell whether they change
+            for c in self.concepts.values():
+                if c.neighbors is not None:
+                    self.restriction_graph.get_reachable(c.cl)
+        update_store(self.o, [t for t in added if t[1] in schema_predicates],
+                     [t for t in removed if t[1] in schema_predicates])
+
+        named = lambda s, o: not isinstance(s, rdflib.BNode) and not isinstance(o, rdflib.BNode)
+        edges = lambda triples, p: [(s, o) for s, q, o in triples if q == p and named(s, o)]
+        new_relations = list(dict.fromkeys(s for s, p, o in added if p == RDF.type and o == OWL.ObjectProperty
+                                           and s != OWL.topObjectProperty and s.n3()[1:-1] not in self.relations))
+        for op in new_relations:
+            self.relations[op.n3()[1:-1]] = OWLRelation(op, self)
+            self._relations.append(op)
+        new_classes = list(dict.fromkeys(o for _, p, o in added if p == RDF.type and
+                                         isinstance(o, rdflib.URIRef) and re.search('p4-lucat', o) and
+                                         o.n3()[1:-1] not in self.concepts))
+        for cl in new_classes:
+            self.concepts[cl.n3()[1:-1]] = OWLConcept(cl, self)
+            self._concepts.append(cl)
+
+        n_concepts, n_relations = len(self.hierarchy), len(self.property_hierarchy)
+        self.hierarchy, affected = self.hierarchy.update(new_classes, edges(added, RDFS.subClassOf),
+                                                         edges(removed, RDFS.subClassOf))
+        self.property_hierarchy, affected_relations = self.property_hierarchy.update(
+            new_relations, edges(added, RDFS.subPropertyOf), edges(removed, RDFS.subPropertyOf))
+        self.entities.update(self.hierarchy.nodes[n_concepts:], EntityTable.CONCEPT)
+        self.entities.update(self.property_hierarchy.nodes[n_relations:], EntityTable.RELATION)
+        self.lcas = self.lcas.update(self.hierarchy, affected)
+        affected = set(self.hierarchy.nodes[i] for i in affected.tolist())
+
+        new_individuals = [s for s, p, _ in added if p == RDF.type and not isinstance(s, rdflib.BNode)
+                           and s.n3()[1:-1] not in self.concepts and s.n3()[1:-1] not in self._individuals]
+        if len(new_individuals) > 0:
+            self._individuals = UriSet(list(self._individuals) + [s.n3()[1:-1] for s in new_individuals])
+
+        islands = set()
+        if self.restriction_graph is not None:
+            sources = set(s for s, p, _ in added + removed if p == RDFS.subClassOf and not isinstance(s, rdflib.BNode))
+            islands = self.restriction_graph.update({s: [obj for sc in self.o.objects(s, RDFS.subClassOf)
+                                                         for obj in self.o.objects(sc, OWL.someValuesFrom)]
+                                                     for s in sources})
+        # concept links aggregate the classes of the instances a relation reaches, for every class below
+        # its domain or range: a typed individual only changes the relations it takes part in
+        relations = set(p for _, p, _ in added + removed if self.entities.is_relation(p))
+        relations.update(s for s, p, _ in added + removed
+                         if p in (RDFS.domain, RDFS.range) and self.entities.is_relation(s))
+        typed = set(s for s, p, _ in added + removed if p == RDF.type and not isinstance(s, rdflib.BNode))
+        if len(typed) > 0:
+            relations.update(self.__get_incident_relations(typed))
+        if len(new_relations) > 0:
+            linked = set(self._concepts)
+        else:
+            linked = set(affected) | islands
+            for p in relations:
+                linked.update(rdflib.URIRef(v['c']) for v in QueryService.query(
+                    '''
+                    select distinct ?c
+                    where {
+                        { ?p rdfs:domain ?sc. } UNION { ?p rdfs:range ?sc. }
+                        ?c rdfs:subClassOf* ?sc.
+                    }
+                    '''.replace('?p', p.n3())
+                    , self.endpoint
+                ))
+
+        # entities outside the indexes are walked in the endpoint, their caches are dropped on any hierarchy change
+        hierarchy_changed = len(affected) > 0 or len(affected_relations) > 0
+        changed = lambda cl: cl in affected or hierarchy_changed and cl not in self.hierarchy
+        stale = set()  # classes whose memoized similarities may change
+        for c in self.concepts.values():
+            if changed(c.cl):
+                stale.add(c.cl)
+            if c.neighbors is None:
+                continue
+            # a link to a re-indexed class or through a changed relation is gone with its value set
+            if c.cl in linked or any(l.relation.p in relations or URIRef(l.destiny.uri) in affected
+                                     for l in c.neighbors):
+                c.neighbors = None
+                stale.add(c.cl)
+            elif any(changed(URIRef(l.destiny.uri)) for l in c.neighbors):
+                stale.add(c.cl)
+
+        if hierarchy_changed:
+            self.ancestors = {}
+            self.concept_distances = {}
+            self.concept_profs = {}
+            self.relation_profs = {}
+        touched = set(s for s, _, _ in added + removed) | set(o for _, _, o in added + removed)
+        for ind in self.individuals.values():
+            if ind.neighbors is not None and (ind.ind in touched or len(new_relations) > 0):
+                ind.neighbors = None
+        if len(affected_relations) > 0 or len(new_relations) > 0:
+            self.similarities.clear()
+        else:
+            # link terms are (relation, destiny) pairs, the destiny decides
+            self.similarities.evict(lambda t: (t[1] if isinstance(t, tuple) else t) in stale, ['concept', 'link'])
+            self.similarities.evict(lambda t: True, ['individual', 'individual_concept'])
+        print('Delta applied:', len(added), 'added,', len(removed), 'removed,', len(affected), 'classes re-indexed')
+
+    def __get_incident_relations(self, individuals: set) -> set:
+        # relations with one of the individuals as subject or object, asked in batches of VALUES
+        relations = set()
+        individuals = list(individuals)
+        for k in range(0, len(individuals), 100):
+            for v in QueryService.query(
+                '''
+                select distinct ?p
+                where {
+                    values ?ind { IND }
+                    { ?s ?p ?ind. } UNION { ?ind ?p ?s. }
+                }
+                '''.replace('IND', ' '.join(i.n3() for i in individuals[k:k + 100]))
+                , self.endpoint
+            ):
+                p = rdflib.URIRef(v['p'])
+                if self.entities.is_relation(p):
+                    relations.add(p)
+
+        return relations
+
     def prof_LCS(self, set_x: list, set_y: list, x: rdflib.URIRef, y: rdflib.URIRef, typeofxy=None):
         if typeofxy is None:
             if x == y:
@@ -1091,196 +1225,110 @@ class MyOWLOntology():
     def dist(self, c1, c2):
         depth = 0
         if isinstance(c1, rdflib.URIRef):
-            if c1 in self._concepts:
-                dis = self.get_distance(c1, c2)
-                if dis != -1:
-                    return dis
-                c = []  # Set of OWLClassExpression
-                c.append(c1)
-                while c2 not in c and len(c) > 0:
-                    super_classes = []  # Set of OWLClassExpression
-                    for i in c:
-                        if i.n3():
-                            super_classes.extend(self.__get_direct_superclasses(i))
-                    c = super_classes
-                    depth += 1
-                self.set_distance(c1, c2, depth)
-            elif c1 in self._relations:
-                c = []
-                c.append(c1)
-                while c2 not in c and len(c) > 0:
-                    superobject_properties = []
-                    for i in c:
-                        if i.n3():
-                            superobject_properties.extend(self.__get_direct_super_properties(i))
-                    c = superobject_properties
-                    depth += 1
-            elif c1 in self._individuals:
-                c = []
-                aux_set = self.get_types(c1, True)
-                c.extend(aux_set)
-                while c2 not in c and len(c) > 0:
-                    super_classes = []
-                    for i in c:
-                        if i.n3():
-                            super_classes.extend(self.__get_direct_superclasses(i))
-                    c = super_classes
-                    depth += 1
+            kind = self.entities.get_kind(c1)
+            if kind == EntityTable.CONCEPT:
+                depth = self.dist_class(c1, c2)
+            elif kind == EntityTable.RELATION:
+                depth = self.dist_property(c1, c2)
+            elif kind == EntityTable.INDIVIDUAL or c1 in self._individuals:
+                depth = self.dist_individual(c1, c2)
         else:
             if isinstance(c1, OWLConcept):
-                c1 = c1.get_OWL_class()
-                c2 = c2.get_OWL_class()
-                dis = self.get_distance(c1, c2)
-                if dis != -1:
-                    return dis
-                c = []  # Set of OWLClassExpression
-                c.append(c1)
-                while c2 not in c and len(c) > 0:
-                    super_classes = []  # Set of OWLClassExpression
-                    for i in c:
-                        if i.n3():
-                            super_classes.extend(self.__get_direct_superclasses(i))
-                    c = super_classes
-                    depth += 1
-                self.set_distance(c1, c2, depth)
+                depth = self.dist_class(c1.get_OWL_class(), c2.get_OWL_class())
             elif isinstance(c1, OWLRelation):
-                c1 = c1.get_OWL_object_property()
-                c2 = c2.get_OWL_object_property()
-                c = []
-                c.append(c1)
-                while c2 not in c and len(c) > 0:
-                    superobject_properties = []
-                    for i in c:
-                        if i.n3():
-                            superobject_properties.extend(self.__get_direct_super_properties(i))
-                    c = superobject_properties
-                    depth += 1
+                depth = self.dist_property(c1.get_OWL_object_property(), c2.get_OWL_object_property())
             elif isinstance(c1, MyOWLIndividual):
-                c1 = c1.get_OWL_named_individual()
-                c2 = c2.get_OWL_named_individual()
-                c = []
-                aux_set = self.get_types(c1, True)
-                c.extend(aux_set)
-                while c2 not in c and len(c) > 0:
-                    super_classes = []
-                    for i in c:
-                        if i.n3():
-                            super_classes.extend(self.__get_direct_superclasses(i))
-                    c = super_classes
-                    depth += 1
-
+                depth = self.dist_individual(c1.get_OWL_named_individual(), c2.get_OWL_named_individual())
         
         return depth
 
-    def dist_class(self, c1: rdflib.URIRef, c2: rdflib.URIRef):
+    def __search_dist(self, c: list, c2, get_direct_supers) -> int:
+        # level by level search for entities outside the indexes, each level deduplicated
         depth = 0
-        dis = self.get_distance(c1, c2)
-        if dis != -1:
-            return dis
-        c = []  # Set of OWLClassExpression
-        c.append(c1)
         while c2 not in c and len(c) > 0:
-            super_classes = []  # Set of OWLClassExpression
+            supers = set()
             for i in c:
-                if i.n3():
-                    super_classes.extend(self.__get_direct_superclasses(i))
-            c = super_classes
+                supers.update(get_direct_supers(i))
+            c = list(supers)
             depth += 1
+
+        return depth
+
+    def dist_class(self, c1: rdflib.URIRef, c2: rdflib.URIRef):
+        i = self.hierarchy.get_id(c1)
+        if i >= 0:
+            depth = self.hierarchy.distance(i, self.hierarchy.get_id(c2))
+            # an entity that does not subsume c1 is reported where the search runs out, as before
+            return depth if depth >= 0 else int(self.hierarchy.max_depth[i])
+        dis = self.get_distance(c1, c2)
+        if dis != -1:
+            return dis
+        depth = self.__search_dist([c1], c2, self.__get_direct_superclasses)
         self.set_distance(c1, c2, depth)
 
         return depth
 
     def dist_property(self, c1: rdflib.URIRef, c2: rdflib.URIRef):
-        depth = 0
-        c = []
-        c.append(c1)
-        while c2 not in c and len(c) > 0:
-            superobject_properties = []
-            for i in c:
-                if i.n3():
-                    superobject_properties.extend(self.__get_direct_super_properties(i))
-            c = superobject_properties
-            depth += 1
-        
-        return depth
+        i = self.property_hierarchy.get_id(c1)
+        if i >= 0:
+            depth = self.property_hierarchy.distance(i, self.property_hierarchy.get_id(c2))
+            return depth if depth >= 0 else int(self.property_hierarchy.max_depth[i])
+
+        return self.__search_dist([c1], c2, self.__get_direct_super_properties)
     
     def dist_individual(self, c1: rdflib.URIRef, c2: rdflib.URIRef):
-        depth = 0
-        c = []
-        aux_set = self.get_types(c1, True)
-        c.extend(aux_set)
-        while c2 not in c and len(c) > 0:
-            super_classes = []
-            for i in c:
-                if i.n3():
-                    super_classes.extend(self.__get_direct_superclasses(i))
-            c = super_classes
-            depth += 1
-        
-        return depth
+        types = self.get_types(c1, True)
+        ids = [self.hierarchy.get_id(t) for t in types]
+        if len(ids) == 0 or min(ids) < 0:
+            return self.__search_dist(types, c2, self.__get_direct_superclasses)
+        j = self.hierarchy.get_id(c2)
+        depths = [self.hierarchy.distance(i, j) for i in ids]
+        depths = [d for d in depths if d >= 0]
+        if len(depths) > 0:
+            return min(depths)
+
+        return int(max(self.hierarchy.max_depth[i] for i in ids))
     
     def prof(self, _class):
         depth = 0
         if isinstance(_class, rdflib.URIRef):
-            if _class in self._concepts:
-                if self.concept_profs.get(_class) is not None:
-                    return self.concept_profs[_class]
-                depth = self.dist_class(_class, OWL.Thing)
-                if self.storing:
-                    self.concept_profs[_class] = depth
-            elif _class in self._relations:
-                if self.relation_profs.get(_class) is not None:
-                    return self.relation_profs[_class]
-                depth = self.dist_property(_class, OWL.topObjectProperty)
-                self.relation_profs[_class] = depth
+            kind = self.entities.get_kind(_class)
+            if kind == EntityTable.CONCEPT:
+                depth = self.prof_class(_class)
+            elif kind == EntityTable.RELATION:
+                depth = self.prof_property(_class)
         else:
             if isinstance(_class, OWLConcept):
-                _class = _class.get_OWL_class()
-                if self.concept_profs.get(_class) is not None:
-                    return self.concept_profs[_class]
-                depth = self.dist(self.get_OWL_concept(_class), self.get_OWL_concept(OWL.Thing))
-                if self.storing:
-                    self.concept_profs[_class] = depth
+                depth = self.prof_class(_class)
             elif isinstance(_class, OWLRelation):
-                _class = _class.get_OWL_object_property()
-                if self.relation_profs.get(_class) is not None:
-                    return self.relation_profs[_class]
-                depth = self.dist(self.get_OWL_relation(_class), self.get_OWL_relation(OWL.topObjectProperty))
-                self.relation_profs[_class] = depth
+                depth = self.prof_property(_class)
         
         return depth
     
     def prof_class(self, _class):
-        depth = 0
-        if isinstance(_class, rdflib.URIRef):
-            if self.concept_profs.get(_class) is not None:
-                return self.concept_profs[_class]
-            depth = self.dist_class(_class, OWL.Thing)
-            if self.storing:
-                self.concept_profs[_class] = depth
-        elif isinstance(_class, OWLConcept):
+        if isinstance(_class, OWLConcept):
             _class = _class.get_OWL_class()
-            if self.concept_profs.get(_class) is not None:
-                return self.concept_profs[_class]
-            depth = self.dist(self.get_OWL_concept(_class), self.get_OWL_concept(OWL.Thing))
-            if self.storing:
-                self.concept_profs[_class] = depth
+        depth = self.hierarchy.get_depth(_class)
+        if depth >= 0:
+            return depth
+        if self.concept_profs.get(_class) is not None:
+            return self.concept_profs[_class]
+        depth = self.dist_class(_class, OWL.Thing)
+        if self.storing:
+            self.concept_profs[_class] = depth
         
         return depth
     
     def prof_property(self, _class):
-        depth = 0
-        if isinstance(_class, rdflib.URIRef):
-            if self.relation_profs.get(_class) is not None:
-                return self.relation_profs[_class]
-            depth = self.dist_property(_class, OWL.topObjectProperty)
-            self.relation_profs[_class] = depth
-        elif isinstance(_class, OWLRelation):
+        if isinstance(_class, OWLRelation):
             _class = _class.get_OWL_object_property()
-            if self.relation_profs.get(_class) is not None:
-                return self.relation_profs[_class]
-            depth = self.dist(self.get_OWL_relation(_class), self.get_OWL_relation(OWL.topObjectProperty))
-            self.relation_profs[_class] = depth
+        depth = self.property_hierarchy.get_depth(_class)
+        if depth >= 0:
+            return depth
+        if self.relation_profs.get(_class) is not None:
+            return self.relation_profs[_class]
+        depth = self.dist_property(_class, OWL.topObjectProperty)
+        self.relation_profs[_class] = depth
         
         return depth
 
@@ -1323,6 +1371,22 @@ class MyOWLOntology():
             else:
                 return d
     
+    def get_similarity(self, kind: str, a, b, compute) -> float:
+        """
+        Similarity of a and b read from the shared memo, computed and stored on a miss
+        :param kind: 'concept', 'individual', 'individual_concept', 'relation' or 'link', pairs of different kinds never meet
+        :param compute: function without arguments returning the similarity
+
+        :return: the similarity
+        """
+        sim = self.similarities.get(kind, a, b)
+        if sim is None:
+            sim = compute()
+            if self.storing:
+                self.similarities.put(kind, a, b, sim)
+
+        return sim
+
     def get_types(self, ind: rdflib.URIRef, direct: bool):
         classes = set()
         # clses = [o for _, _, o in self.o.triples((ind, RDF.type, None))]
@@ -1367,6 +1431,7 @@ class MyOWLOntology():
         if ind is None:
             ind = MyOWLIndividual(URIRef(uri), self)
             self.individuals[uri] = ind
+            self.entities.add(ind.ind, EntityTable.INDIVIDUAL)
         
         return ind
     
@@ -1374,8 +1439,11 @@ class MyOWLOntology():
         con = self.concepts.get(uri)
         if con is None:
             con = self.individuals.get(uri)
+        if con is None and uri in self._individuals:
+            con = self.get_OWL_individual(uri)
         
         return con
+
     
     def get_ontology_prefix(self) -> str:
         return self.prefix
@@ -1384,28 +1452,27 @@ class MyOWLOntology():
         pass
 
     def get_LCS(self, a: OWLConcept, b: OWLConcept) -> OWLConcept:
-        # comparison = AnnotationComparison(a, b)
-        # lcs_concept = self.lcas.get(comparison)
-        lcs_concept = None
-        if lcs_concept is None:
-            x, y = a.get_OWL_class(), b.get_OWL_class()
+        x, y = a.get_OWL_class(), b.get_OWL_class()
+        lcs = self.lcas.get_LCS(x, y)
+        if lcs is None:
             set_x = self.get_super_classes(x)
             set_x.append(x)
             set_y = self.get_super_classes(y)
             set_y.append(y)
             lcs = self.prof_LCS(set_x, set_y, x, y, typeofxy='OWLConcept')
-            lcs_concept = self.get_OWL_concept(lcs.n3()[1:-1])
-            # if self.storing:
-            #     self.lcas[comparison] = lcs_concept
         
-        return lcs_concept
+        return self.get_OWL_concept(lcs.n3()[1:-1])
 
     def dps(self, x: OWLConcept, y: OWLConcept):
-        lcs = self.get_LCS(x, y)
-
-        prof_LCS = self.prof(lcs)
-        dxa = self.dist(x, lcs)
-        dya = self.dist(y, lcs)
+        i, j = self.hierarchy.get_id(x.get_OWL_class()), self.hierarchy.get_id(y.get_OWL_class())
+        if i >= 0 and j >= 0:
+            lcs, dxa, dya = self.lcas.get_LCS_ids(i, j)
+            prof_LCS = int(self.hierarchy.depth[lcs])
+        else:
+            lcs = self.get_LCS(x, y)
+            prof_LCS = self.prof(lcs)
+            dxa = self.dist(x, lcs)
+            dya = self.dist(y, lcs)
         if prof_LCS + dxa + dya != 0:
             dps = 1.0 - prof_LCS / (prof_LCS + dxa + dya)
         else:
@@ -1419,6 +1486,35 @@ class MyOWLOntology():
 
         return dps
 
+    def taxonomic_similarity_matrix(self, list_a: list, list_b: list) -> np.ndarray:
+        """
+        Taxonomic similarity (dps) of every pair of concepts in list_a x list_b
+        :param list_a: OWLConcept or class URIs
+        :param list_b: OWLConcept or class URIs
+
+        :return: array of shape (len(list_a), len(list_b)), entry [i, j] equals taxonomic_class_similarity(a_i, b_j)
+        """
+        list_a = [c if isinstance(c, OWLConcept) else self.get_OWL_concept(c.n3()[1:-1]) for c in list_a]
+        list_b = [c if isinstance(c, OWLConcept) else self.get_OWL_concept(c.n3()[1:-1]) for c in list_b]
+        ids_a = np.array([self.hierarchy.get_id(c.get_OWL_class()) for c in list_a], dtype=np.int64)
+        ids_b = np.array([self.hierarchy.get_id(c.get_OWL_class()) for c in list_b], dtype=np.int64)
+        known_a, known_b = np.flatnonzero(ids_a >= 0), np.flatnonzero(ids_b >= 0)
+
+        sim = np.zeros((len(list_a), len(list_b)), dtype=np.float64)
+        _, prof_LCS, dist = self.lcas.get_LCS_matrix(ids_a[known_a], ids_b[known_b])
+        total = prof_LCS + dist
+        block = np.where((prof_LCS >= 0) & (total != 0), prof_LCS / np.where(total != 0, total, 1), 0.0)
+        sim[np.ix_(known_a, known_b)] = block
+        # concepts outside the named hierarchy keep the pairwise path
+        for i in np.flatnonzero(ids_a < 0).tolist():
+            for j in range(len(list_b)):
+                sim[i, j] = self.dps(list_a[i], list_b[j])
+        for j in np.flatnonzero(ids_b < 0).tolist():
+            for i in known_a.tolist():
+                sim[i, j] = self.dps(list_a[i], list_b[j])
+
+        return sim
+
     def taxonomic_individual_similarity(self, x: rdflib.URIRef, y: rdflib.URIRef):
         set_x = []
         set_y = []
@@ -1458,6 +1554,8 @@ class MyOWLOntology():
 
 
 class AnnSim():
+    AGGREGATORS = ('bma', 'max', 'average', 'hungarian')  # group similarities of AnnSim.aggregate
+
     def __init__(self, matrix=None):
         self.v1 = None
         self.v2 = None
@@ -1480,6 +1578,12 @@ class AnnSim():
                 for i, s1 in enumerate(self.v1):
                     for j, s2 in enumerate(self.v2):
                         self.cost_matrix[i, j] = 1 - s1.similarity(s2, orig, des)
+            elif isinstance(self.map_comparisons, SimilarityMatrix):
+                # one gather over the interned ids replaces a dict lookup per cell
+                block = self.map_comparisons.get_block(self.v1, self.v2)
+                if np.isnan(block).any():
+                    raise KeyError('Similarity missing for a pair of ' + str(self.v1) + ' and ' + str(self.v2))
+                self.cost_matrix = 1 - block
             else:
                 for i, s1 in enumerate(self.v1):
                     for j, s2 in enumerate(self.v2):
@@ -1495,6 +1599,89 @@ class AnnSim():
                     sim += 1 - self.cost_matrix[i, aux]
             
             return 2 * sim / (len(self.v1) + len(self.v2))
+
+    def matching_batch(self, pairs: list) -> np.array:
+        """
+        Similarities of many pairs of annotation lists, the assignments of equally shaped cost matrices are
+        solved together by HungarianAlgorithm.execute_batch
+        :param pairs: (a, b) lists of annotations, as given to matching
+
+        :return: similarity of each pair, nan where matching fails on the pair
+        """
+        return self.group_similarities(pairs, ['hungarian'])['hungarian']
+
+    def group_similarities(self, pairs: list, aggregators: list=AGGREGATORS) -> dict:
+        """
+        Similarities of many pairs of annotation lists under several aggregators, the term similarities of
+        each pair are looked up once and shared by all of them
+        :param pairs: (a, b) lists of annotations, as given to matching
+        :param aggregators: names among AnnSim.AGGREGATORS
+
+        :return: aggregator: similarity of each pair, nan where matching fails on the pair
+        """
+        sims = {name: np.full(len(pairs), np.nan) for name in aggregators}
+        groups = {}  # shape: list of (position in pairs, similarity matrix)
+        for k, (a, b) in enumerate(pairs):
+            if len(a) == 0 or len(b) == 0 or type(a[0]) != type(b[0]):
+                continue
+            if a == b:
+                for name in aggregators:
+                    sims[name][k] = 1.0
+                continue
+            if self.map_comparisons is None:
+                sim = [[s1.similarity(s2, None, None) for s2 in b] for s1 in a]
+            else:
+                if isinstance(self.map_comparisons, SimilarityMatrix):
+                    sim = self.map_comparisons.get_block(a, b)
+                else:
+                    sim = np.array([[self.map_comparisons.get(AnnotationComparison(s1, s2), np.nan) for s2 in b]
+                                    for s1 in a], dtype=np.float64)
+                # a missing comparison leaves the pair at nan instead of failing the batch
+                if np.isnan(sim).any():
+                    continue
+            groups.setdefault((len(a), len(b)), []).append((k, sim))
+
+        for group in groups.values():
+            positions = [k for k, _ in group]
+            for name, values in AnnSim.aggregate(np.array([sim for _, sim in group]), aggregators).items():
+                sims[name][positions] = values
+
+        return sims
+
+    @staticmethod
+    def aggregate(sim_matrices: np.array, aggregators: list=AGGREGATORS) -> dict:
+        """
+        Group similarities of a stack of equally shaped term similarity matrices, one reduction per aggregator
+        bma: best match average, the row and column maxima averaged together as maximum_matching does
+        max: the best single match
+        average: the mean over every pair of terms
+        hungarian: the one-to-one assignment of maximum similarity normalized by both sizes as matching does
+        :param sim_matrices: batch x rows x cols similarities
+        :param aggregators: names among AnnSim.AGGREGATORS
+
+        :return: aggregator: similarity of each matrix
+        """
+        sim_matrices = np.asarray(sim_matrices, dtype=np.float64)
+        _, rows, cols = sim_matrices.shape
+        sims = {}
+        if 'bma' in aggregators or 'max' in aggregators:
+            # maxima start from 0 as in maximum_matching
+            row_max = np.maximum(sim_matrices.max(axis=2), 0)
+            col_max = np.maximum(sim_matrices.max(axis=1), 0)
+            if 'bma' in aggregators:
+                # cumulative sums add the maxima in the order the loops of maximum_matching do
+                sims['bma'] = np.cumsum(np.concatenate([row_max, col_max], axis=1), axis=1)[:, -1] / (rows + cols)
+            if 'max' in aggregators:
+                sims['max'] = row_max.max(axis=1)
+        if 'average' in aggregators:
+            sims['average'] = sim_matrices.mean(axis=(1, 2))
+        if 'hungarian' in aggregators:
+            cost_matrices = 1 - sim_matrices
+            assignment = HungarianAlgorithm.execute_batch(cost_matrices)
+            matched = np.take_along_axis(cost_matrices, np.maximum(assignment, 0)[:, :, None], axis=2)[:, :, 0]
+            sims['hungarian'] = 2 * np.cumsum(np.where(assignment >= 0, 1 - matched, 0), axis=1)[:, -1] / (rows + cols)
+
+        return sims
     
     def maximum_matching(self, a: set, b: set, orig: MyOWLLogicalEntity, des: MyOWLLogicalEntity):
         if type(a) != type(b) and len(a) == 0 and len(b) == 0:
@@ -1511,6 +1698,8 @@ class AnnSim():
                 for i, s1 in enumerate(self.v1):
                     for j, s2 in enumerate(self.v2):
                         self.cost_matrix[i, j] = s1.similarity(s2, orig, des)
+            elif isinstance(self.map_comparisons, SimilarityMatrix):
+                self.cost_matrix = np.nan_to_num(self.map_comparisons.get_block(self.v1, self.v2), nan=0.0)
             else:
                 for i, s1 in enumerate(self.v1):
                     for j, s2 in enumerate(self.v2):
@@ -1519,23 +1708,12 @@ class AnnSim():
                             value = 0.0
                         self.cost_matrix[i, j] = value
             
-            sim = 0
-            for i in range(len(self.v1)):
-                max_row = 0
-                for j in range(len(self.v2)):
-                    if max_row < self.cost_matrix[i, j]:
-                        max_row = self.cost_matrix[i, j]
-                sim += max_row
-            for j in range(len(self.v2)):
-                max_col = 0
-                for i in range(len(self.v1)):
-                    if max_col < self.cost_matrix[i, j]:
-                        max_col = self.cost_matrix[i, j]
-                sim += max_col
-            return sim / (len(a) + len(b))
+            return float(AnnSim.aggregate(self.cost_matrix[None], ['bma'])['bma'][0])
 
 
 class OWLRelation():
+    __slots__ = ('o', 'p', 'neighbors', 'uri')
+
     def __init__(self, property: rdflib.URIRef, onto: MyOWLOntology):
         self.o = onto
         self.p = property
@@ -1577,10 +1755,13 @@ class OWLRelation():
         return 0.0
     
     def similarity(self, r: OWLRelation):
-        return (self.taxonomic_similarity(r) + self.similarity_neighbors(r)) / 2
+        return self.o.get_similarity('relation', self.p, r.p,
+                                     lambda: (self.taxonomic_similarity(r) + self.similarity_neighbors(r)) / 2)
 
 
 class OWLLink():
+    __slots__ = ('relation', 'destiny', 'explanations')
+
     def __init__(self, r: OWLRelation, b: MyOWLLogicalEntity, exp: list=None):
         self.relation = r
         self.destiny = b
@@ -1599,6 +1780,13 @@ class OWLLink():
         return self.destiny
     
     def similarity(self, a: OWLLink, concept_a: MyOWLLogicalEntity, concept_b: MyOWLLogicalEntity):
+        if None in (self.relation, self.destiny, a.relation, a.destiny):
+            return self.__similarity(a)
+        # a link is identified by its relation and its destiny, both URIRef like the other memo terms
+        return self.relation.o.get_similarity('link', (self.relation.p, URIRef(self.destiny.uri)),
+                                              (a.relation.p, URIRef(a.destiny.uri)), lambda: self.__similarity(a))
+
+    def __similarity(self, a: OWLLink):
         bmp = BipartiteGraphMatching()
 
         try:
@@ -1614,6 +1802,8 @@ class OWLLink():
 
 
 class MyOWLLogicalEntity(ABC):
+    __slots__ = ('uri', 'o', 'neighbors')
+
     def __init__(self):
         self.uri = None
         self.o = None
@@ -1719,13 +1909,18 @@ class MyOWLLogicalEntity(ABC):
 
 
 class OWLConcept(MyOWLLogicalEntity):
+    __slots__ = ('cl',)
+
     def __init__(self, a: rdflib.URIRef, onto: MyOWLOntology):
         self.o = onto
         self.uri = a.n3()[1:-1]
         self.neighbors = None
         self.cl = a
         # self.name = self.uri
-        self.satisfiable = self.is_satisfiable()
+
+    @property
+    def satisfiable(self):
+        return self.is_satisfiable()
     
     def get_OWL_class(self):
         return self.cl
@@ -1917,7 +2112,7 @@ class OWLConcept(MyOWLLogicalEntity):
             #     return 0
             if self == c:
                 return 1.0
-            sim = self.on_sim(c)
+            sim = self.o.get_similarity('concept', self.cl, c.cl, lambda: self.on_sim(c))
             return sim
         elif isinstance(c, MyOWLIndividual):
             c.similarity(self)
@@ -1933,6 +2128,8 @@ class OWLConcept(MyOWLLogicalEntity):
 
 
 class MyOWLIndividual(MyOWLLogicalEntity):
+    __slots__ = ('ind',)
+
     def __init__(self, a: rdflib.URIRef, onto: MyOWLOntology):
         self.o = onto
         self.uri = a.n3()[1:-1]
@@ -2005,16 +2202,22 @@ class MyOWLIndividual(MyOWLLogicalEntity):
         if isinstance(c, MyOWLIndividual):
             if self == c:
                 return 1.0
-            sim = self.on_sim(c)
+            sim = self.o.get_similarity('individual', self.get_OWL_named_individual(), c.get_OWL_named_individual(),
+                                        lambda: self.on_sim(c))
             return sim
         if isinstance(c, OWLConcept):
-            tax_sim = self.taxonomic_similarity(c)
-            neigh_sim = 1
-            if tax_sim > 0:
-                neigh_sim = self.similarity_neighbors(c)
-            sim = tax_sim * neigh_sim
+            sim = self.o.get_similarity('individual_concept', self.get_OWL_named_individual(), c.get_OWL_class(),
+                                        lambda: self.__similarity_concept(c))
             return sim
 
+    def __similarity_concept(self, c: OWLConcept):
+        tax_sim = self.taxonomic_similarity(c)
+        neigh_sim = 1
+        if tax_sim > 0:
+            neigh_sim = self.similarity_neighbors(c)
+        sim = tax_sim * neigh_sim
+        return sim
+
 
 class BipartiteGraphMatching():
     def __init__(self):
@@ -2046,152 +2249,152 @@ class BipartiteGraphMatching():
 
 class HungarianAlgorithm():
     def __init__(self, cost_matrix: np.array):
-        self.dim = max(cost_matrix.shape[0], cost_matrix.shape[1])
-        self.rows = cost_matrix.shape[0]
-        self.cols = cost_matrix.shape[1]
-        self.cost_matrix = np.zeros((self.dim, self.dim))
-        for w in range(self.dim):
-            if w < cost_matrix.shape[0]:
-                # self.cost_matrix[w] = cost_matrix[:len(cost_matrix)-1]
-                self.cost_matrix[w, :cost_matrix.shape[1]] = cost_matrix[w]
-            else:
-                np.append(self.cost_matrix, np.zeros((1, self.dim)), axis=0)
-        self.label_by_worker = np.zeros(self.dim)
-        self.label_by_job = np.zeros(self.dim)
-        self.min_slack_worker_by_job = np.zeros(self.dim, dtype=np.int32)
-        self.min_slack_value_by_job = np.zeros(self.dim)
-        self.committed_workers = np.zeros(self.dim, dtype=np.bool8)
-        self.parent_worker_by_committed_job = np.zeros(self.dim, dtype=np.int32)
-        self.match_job_by_worker = np.zeros(self.dim, dtype=np.int32)
-        self.match_job_by_worker[:] = -1
-        self.match_worker_by_job = np.zeros(self.dim, dtype=np.int32)
-        self.match_worker_by_job[:] = -1
-    
-    def compute_initial_feasible_solution(self):
-        for j in range(self.dim):
-            self.label_by_job[j] = np.Infinity
-        for w in range(self.dim):
-            for j in range(self.dim):
-                if self.cost_matrix[w, j] < self.label_by_job[j]:
-                    self.label_by_job[j] = self.cost_matrix[w, j]
-    
+        """
+        Minimum cost assignment of the rows of a rectangular matrix to its columns
+        Shortest augmenting paths in the Jonker-Volgenant manner, each step is a NumPy operation over a whole
+        row, the matrix is neither copied element by element nor padded to a square.
+        :param cost_matrix: rows x cols costs
+
+        :return: None
+        """
+        self.cost_matrix = np.asarray(cost_matrix, dtype=np.float64)
+        self.rows = self.cost_matrix.shape[0]
+        self.cols = self.cost_matrix.shape[1]
+
     def execute(self) -> np.array:
-        self.reduce()
-        self.compute_initial_feasible_solution()
-        self.greedy_match()
-
-        w = self.fetch_unmatched_worker()
-        while w < self.dim:
-            self.initialize_phase(w)
-            self.execute_phase()
-            w = self.fetch_unmatched_worker()
-        result = self.match_job_by_worker[:self.rows]
-        for w in range(len(result)):
-            if result[w] >= self.cols:
-                result[w] = -1
-        
-        return result
-    
-    def execute_phase(self):
-        while True:
-            min_slack_worker, min_slack_job = -1, -1
-            min_slack_value = np.Infinity
-            for j in range(self.dim):
-                if self.parent_worker_by_committed_job[j] == -1:
-                    if self.min_slack_value_by_job[j] < min_slack_value:
-                        min_slack_value = self.min_slack_value_by_job[j]
-                        min_slack_worker = self.min_slack_worker_by_job[j]
-                        min_slack_job = j
-            if min_slack_value > 0:
-                self.update_labeling(min_slack_value)
-            self.parent_worker_by_committed_job[min_slack_job] = min_slack_worker
-            if self.match_worker_by_job[min_slack_job] == -1:
-                committed_job = min_slack_job
-                parent_worker = self.parent_worker_by_committed_job[committed_job]
-                while True:
-                    temp = self.match_job_by_worker[parent_worker]
-                    self.match(parent_worker, committed_job)
-                    committed_job = temp
-                    if committed_job == -1:
-                        break
-                    parent_worker = self.parent_worker_by_committed_job[committed_job]
-                return
-            else:
-                worker = self.match_worker_by_job[min_slack_job]
-                self.committed_workers[worker] = True
-                for j in range(self.dim):
-                    if self.parent_worker_by_committed_job[j] == -1:
-                        slack = self.cost_matrix[worker, j] - self.label_by_worker[worker] - self.label_by_job[j]
-                        if self.min_slack_value_by_job[j] > slack:
-                            self.min_slack_value_by_job[j] = slack
-                            self.min_slack_worker_by_job[j] = worker
-    
-    def fetch_unmatched_worker(self):
-        for w in range(self.dim):
-            if self.match_job_by_worker[w] == -1:
-                break
-            w += 1
-        
-        return w
-    
-    def greedy_match(self):
-        for w in range(self.dim):
-            for j in range(self.dim):
-                if self.match_job_by_worker[w] == -1 and self.match_worker_by_job[j] == -1 \
-                    and self.cost_matrix[w, j] - self.label_by_worker[w] - self.label_by_job[j] == 0:
-                    self.match(w, j)
-    
-    def initialize_phase(self, w: np.int32):
-        self.committed_workers[:] = False
-        self.parent_worker_by_committed_job[:] = -1
-        self.committed_workers[w] = True
-        for j in range(self.dim):
-            self.min_slack_value_by_job[j] = self.cost_matrix[w, j] - self.label_by_worker[w] \
-                                                - self.label_by_job[j]
-            self.min_slack_worker_by_job[j] = w
-    
-    def match(self, w: np.int32, j: np.int32):
-        self.match_job_by_worker[w] = j
-        self.match_worker_by_job[j] = w
-    
-    def reduce(self):
-        for w in range(self.dim):
-            mi = np.Infinity
-            for j in range(self.dim):
-                if self.cost_matrix[w, j] < mi:
-                    mi = self.cost_matrix[w, j]
-            for j in range(self.dim):
-                self.cost_matrix[w, j] -= mi
-        mi = np.zeros(self.dim)
-        for j in range(self.dim):
-            mi[j] = np.Infinity
-        for w in range(self.dim):
-            for j in range(self.dim):
-                if self.cost_matrix[w, j] < mi[j]:
-                    mi[j] = self.cost_matrix[w, j]
-        for w in range(self.dim):
-            for j in range(self.dim):
-                self.cost_matrix[w, j] -= mi[j]
-    
-    def update_labeling(self, slack):
-        for w in range(self.dim):
-            if self.committed_workers[w]:
-                self.label_by_worker[w] += slack
-        for j in range(self.dim):
-            if self.parent_worker_by_committed_job[j] != -1:
-                self.label_by_job[j] -= slack
-            else:
-                self.min_slack_value_by_job[j] -= slack
+        """
+        :return: column assigned to each row, -1 for the rows left over when there are more rows than columns
+        """
+        # the shorter side is assigned completely, columns are the longer one
+        cost = self.cost_matrix.T if self.rows > self.cols else self.cost_matrix
+        n, m = cost.shape
+        label_by_row = np.zeros(n)
+        label_by_col = np.zeros(m)
+        col_by_row = np.full(n, -1, dtype=np.int32)
+        row_by_col = np.full(m, -1, dtype=np.int32)
+        for cur_row in range(n):
+            shortest = np.full(m, np.inf)
+            path = np.full(m, -1, dtype=np.int32)
+            visited_rows = np.zeros(n, dtype=bool)
+            visited_cols = np.zeros(m, dtype=bool)
+            i, min_value, sink = cur_row, 0.0, -1
+            while sink == -1:
+                visited_rows[i] = True
+                reduced = min_value + cost[i] - label_by_row[i] - label_by_col
+                closer = ~visited_cols & (reduced < shortest)
+                path[closer] = i
+                shortest[closer] = reduced[closer]
+                candidates = np.where(visited_cols, np.inf, shortest)
+                min_value = candidates.min()
+                # among the closest columns a free one ends the path at once
+                ties = np.flatnonzero(candidates == min_value)
+                free = ties[row_by_col[ties] == -1]
+                j = int(free[0]) if len(free) > 0 else int(ties[0])
+                visited_cols[j] = True
+                if row_by_col[j] == -1:
+                    sink = j
+                else:
+                    i = row_by_col[j]
+
+            label_by_row[cur_row] += min_value
+            others = visited_rows.copy()
+            others[cur_row] = False
+            label_by_row[others] += min_value - shortest[col_by_row[others]]
+            label_by_col[visited_cols] -= min_value - shortest[visited_cols]
+            j = sink
+            while True:
+                i = path[j]
+                row_by_col[j] = i
+                col_by_row[i], j = j, col_by_row[i]
+                if i == cur_row:
+                    break
+
+        if self.rows > self.cols:
+            result = np.full(self.rows, -1, dtype=np.int32)
+            result[col_by_row] = np.arange(self.cols, dtype=np.int32)
+            return result
+
+        return col_by_row
+
+    @staticmethod
+    def execute_batch(cost_matrices: np.array) -> np.array:
+        """
+        Assignments of a stack of equally shaped matrices, every step runs on the whole stack at once
+        Problems whose augmenting path is already found wait for the others while the rest advance.
+        :param cost_matrices: batch x rows x cols costs
+
+        :return: batch x rows, column assigned to each row as in execute
+        """
+        costs = np.asarray(cost_matrices, dtype=np.float64)
+        batch, rows, cols = costs.shape
+        # the shorter side is assigned completely, columns are the longer one
+        if rows > cols:
+            costs = costs.transpose(0, 2, 1)
+        n, m = costs.shape[1:]
+        label_by_row = np.zeros((batch, n))
+        label_by_col = np.zeros((batch, m))
+        col_by_row = np.full((batch, n), -1, dtype=np.int32)
+        row_by_col = np.full((batch, m), -1, dtype=np.int32)
+        for cur_row in range(n):
+            shortest = np.full((batch, m), np.inf)
+            path = np.full((batch, m), -1, dtype=np.int32)
+            visited_rows = np.zeros((batch, n), dtype=bool)
+            visited_cols = np.zeros((batch, m), dtype=bool)
+            i = np.full(batch, cur_row)
+            min_value = np.zeros(batch)
+            sink = np.full(batch, -1)
+            active = np.arange(batch)
+            while len(active) > 0:
+                ia = i[active]
+                visited_rows[active, ia] = True
+                reduced = min_value[active, None] + costs[active, ia] - label_by_row[active, ia][:, None] \
+                    - label_by_col[active]
+                closer = ~visited_cols[active] & (reduced < shortest[active])
+                path[active] = np.where(closer, ia[:, None], path[active])
+                shortest[active] = np.where(closer, reduced, shortest[active])
+                candidates = np.where(visited_cols[active], np.inf, shortest[active])
+                min_value[active] = candidates.min(axis=1)
+                # among the closest columns a free one ends the path at once
+                ties = candidates == min_value[active, None]
+                free = ties & (row_by_col[active] == -1)
+                j = np.where(free.any(axis=1), free.argmax(axis=1), ties.argmax(axis=1))
+                visited_cols[active, j] = True
+                matched_row = row_by_col[active, j]
+                done = matched_row == -1
+                sink[active[done]] = j[done]
+                i[active[~done]] = matched_row[~done]
+                active = active[~done]
+
+            label_by_row[:, cur_row] += min_value
+            others = visited_rows
+            others[:, cur_row] = False
+            on_path = np.take_along_axis(shortest, np.maximum(col_by_row, 0), axis=1)
+            label_by_row[others] += (min_value[:, None] - on_path)[others]
+            label_by_col[visited_cols] -= (min_value[:, None] - shortest)[visited_cols]
+            j = sink
+            active = np.arange(batch)
+            while len(active) > 0:
+                i = path[active, j[active]]
+                row_by_col[active, j[active]] = i
+                j[active], col_by_row[active, i] = col_by_row[active, i], j[active]
+                active = active[i != cur_row]
+
+        if rows > cols:
+            result = np.full((batch, rows), -1, dtype=np.int32)
+            np.put_along_axis(result, col_by_row, np.arange(cols, dtype=np.int32)[None], axis=1)
+            return result
+
+        return col_by_row
 
 
 class AnnotationComparison():
+    __slots__ = ('concept_A', 'concept_B', 'hash')
+
     def __init__(self, a, b):
         self.concept_A = a
         self.concept_B = b
-        if str(self.concept_A) < str(self.concept_B):
-            self.hash = hash(self.concept_A) ^ hash(self.concept_B)
-        else:
-            self.hash = hash(self.concept_B) ^ hash(self.concept_A)
+        # xor is symmetric, (a, b) and (b, a) hash alike without ordering them first
+        self.hash = hash(a) ^ hash(b)
     
     def __hash__(self) -> int:
         return self.hash
@@ -6,94 +6,83 @@ import rdflib
 from rdflib import Graph, URIRef
 from rdflib import RDF, RDFS
 from rdflib import OWL
-from rdflib.plugins.sparql import prepareQuery
 import utils
 import time
+import os
+import multiprocessing
+from ontoindex import EntityTable, HierarchyIndex, LCSEngine, ReachabilityIndex, SimilarityCache, SimilarityMatrix, Snapshot
+from ontostore import QuadStore, TripleStore, compile_graph, is_ntriples, load_ntriples, parse_graph, update_store
+
+worker_ontology = None  # MyOWLOntology inherited by the forked workers of set_OWL_links_concepts
+
+
+def get_concept_link_uris(uris: list) -> list:
+    links = []
+    for uri in uris:
+        c = worker_ontology.get_OWL_concept(uri)
+        links.append([(str(l.relation), str(l.destiny)) for l in worker_ontology.get_concept_OWL_link(c)])
+    return links
+
 
 class MyOWLOntology():
-    def __init__(self, ont_file, pr: str=None):
+    def __init__(self, ont_file, pr: str=None, snapshot_dir: str=None, processes: int=1, compiled: bool=False,
+                 quadstore: str=None, similarity_cache: int=64 << 20):
         self.concepts = {}  # string: owl_concept
         self._concepts = []  # URIRef
         self.individuals = {}  # string: myowl_individual
         self._individuals = []  # URIRef
+        self._bnodes = []  # BNode, subjects and objects of anonymous class expressions and axioms
         self.relations = {}  # string: wol_relation
         self._relations = []  # URIRef
+        self.entities = EntityTable()  # URIRef: dense id and kind
         self.ancestors = {}  # owl_logical_entity: set of owl_class
+        self.super_expressions = {}  # owl_class: set of named and anonymous super class expressions
         self.concept_distances = {}  # owl_class: dictionary of owl_class: integer
-        self.lcas = {}  # annotation_comparison: owl_concept
+        self.lcas = None  # LCSEngine, bounded cache of least common subsumers
+        self.restriction_graph = None  # ReachabilityIndex over rdfs:subClassOf / owl:someValuesFrom
+        self.restrictions = None  # restriction class expression: list of (property, filler)
+        self.restriction_index = None  # (property, filler): list of restriction class expressions
+        self.class_restrictions = {}  # owl_class: list of (property, filler) among its super class expressions
         self.concept_profs = {}
         self.relation_profs = {}
         self.property_chains = {}
+        self.similarities = SimilarityCache(similarity_cache)  # symmetric memo of entity similarities, bytes capped
         self.exp_id = 0
         self.storing = True
+        self.from_snapshot = False  # the indexes were restored from a snapshot
+        self.unparsed = None  # (ont_file, processes, compiled) of a snapshot load, parsed when the triples are read
+        self.snapshot = None  # Snapshot of the ontology as loaded, the derived cache is saved under it
+        self.derived = None  # name: memory-mapped array of the derived cache read with the snapshot
         self.prefix = pr
 
-        self.prepared_queries = {
-            'q1': prepareQuery(
-                    '''
-                    SELECT ?obj
-                    WHERE {
-                        ?c rdfs:subClassOf ?sc.
-                        ?sc owl:someValuesFrom ?obj.
-                    }  
-                    '''
-                ),
-            # 'q1': default_world.prepare_sparql(
-            #     '''
-            #         SELECT ?obj
-            #         WHERE {
-            #             ?? rdfs:subClassOf ?sc.
-            #             ?sc owl:someValuesFrom ?obj.
-            #         }  
-            #         '''
-            # ),
-            'q2': prepareQuery(
-                    '''
-                    SELECT ?c
-                    WHERE {
-                        ?c owl:onProperty ?p.
-                        ?c owl:someValuesFrom ?b.
-                    }
-                    '''
-                ),
-            # 'q2': default_world.prepare_sparql(
-            #     '''
-            #         SELECT ?c
-            #         WHERE {
-            #             ?c owl:onProperty ?p.
-            #             ?c owl:someValuesFrom ?b.
-            #         }
-            #         '''
-            # )
-            'q3': prepareQuery(
-                '''
-                    SELECT DISTINCT ?p ?value
-                    WHERE {
-                        {
-                            ?p rdfs:domain ?sc.
-                            ?x ?p ?value.
-                            ?c rdfs:subClassOf* ?sc.
-                        } UNION {
-                            ?p rdfs:range ?sc.
-                            ?value ?p ?x.
-                            ?c rdfs:subClassOf* ?sc.
-                        }
-                    }
-                '''
-            )
-        }
-        
-        self.o = Graph()
-        print('Parsing ontology...')
-        if type(ont_file) == list:  # multiple graphs
-            for of in ont_file:
-                self.o.parse(of)
-        else:
-            self.o.parse(ont_file)
-            # self.go = get_ontology(ont_file).load()
-        print('Finished')
+        self.o = Graph() if quadstore is None else QuadStore(quadstore)
+        snapshot = None
+        if snapshot_dir is not None:
+            sources = [utils.split_archive_path(f) for f in (ont_file if type(ont_file) == list else [ont_file])]
+            options = {'compiled': compiled, 'quadstore': quadstore is not None}
+            snapshot = Snapshot(os.path.join(snapshot_dir, Snapshot.fingerprint([f for f, _ in sources],
+                                                                               [m or '' for _, m in sources],
+                                                                               options)))
+            self.snapshot = snapshot
+            if snapshot.exists():
+                # every index is restored from the snapshot, the graph stays empty until a method reads the triples
+                print('Loading snapshot...')
+                if isinstance(self.o, QuadStore):
+                    # unless it is a quadstore, whose file keeps the triples; files it holds are not parsed again
+                    for of in (ont_file if type(ont_file) == list else [ont_file]):
+                        self.o.load(of)
+                else:
+                    self.unparsed = (ont_file, processes, compiled)
+                self.__load_snapshot(snapshot)
+                self.__load_derived(snapshot.derived())
+                self.from_snapshot = True
+                print('Finished')
+                return
+
+        self.__parse_all(ont_file, processes, compiled)
 
-        object_properties = list(set([s for s, _, _ in self.o.triples((None, RDF.type, OWL.ObjectProperty))]))
+        kinds = self.__classify_triples()
+        object_properties = list(kinds['object_properties'])
         if OWL.topObjectProperty in object_properties:
             object_properties.remove(OWL.topObjectProperty)
         for op in object_properties:
@@ -105,85 +94,114 @@ class MyOWLOntology():
         #         print(str(r1), 'and', str(r2), 'has similarity ', r1.similarity(r2))
         # utils.similarity2csv(list(self.relations.values()), file='results/object_properties_sim.csv')
 
-        classes = self.__get_all_classes()
+        classes = list(kinds['classes'])
         classes.append(OWL.Thing)
         for cl in classes:
             self.concepts[cl.n3()[1:-1]] = OWLConcept(cl, self)
         self._concepts = [con.cl for con in self.concepts.values()]
         print('Classes read')
+
+        self.hierarchy = HierarchyIndex(self._concepts, kinds['subclass_edges'], top=OWL.Thing)
+        self.property_hierarchy = HierarchyIndex(self._relations, kinds['subproperty_edges'],
+                                                 top=OWL.topObjectProperty)
+        self.lcas = LCSEngine(self.hierarchy)
+        self.entities.update(self.hierarchy.nodes, EntityTable.CONCEPT)
+        self.entities.update(self.property_hierarchy.nodes, EntityTable.RELATION)
+        print('Hierarchy indexed')
         # for c1, c2 in zip(list(self.concepts.values())[:100], list(self.concepts.values())[100:200]):
         #     print(str(c1), 'and', str(c2), 'has similarity ', c1.similarity(c2))
         # utils.similarity2csv(list(self.concepts.values())[:100], file='results/class_taxonomic_sim.csv', sim_type='taxonomic_similarity')
 
-        # indivs = set()
-        # for cl in classes:
-        #     for s, _, _ in self.o.triples((None, RDF.type, cl)):
-        #         if not isinstance(s, rdflib.BNode) \
-        #             and s not in classes \
-        #             and s not in self.__get_all_properties():
-        #             indivs.add(s)
-        # indivs.update([s for s, _, _ in self.o.triples((None, RDF.type, OWL.NamedIndividual))])
-        # indivs = list(indivs)
-        # for ind in indivs:
-        #     if self.concepts.get(ind.n3()[1:-1]) is None:
-        #         self.individuals[ind.n3()[1:-1]] = MyOWLIndividual(ind, self)
-        # self._individuals = [ind.ind for ind in self.individuals.values()]
+        self.__add_individuals(kinds['individuals'])
+        self._bnodes = list(kinds['bnodes'])
         print('Individuals read')
+        if snapshot is not None:
+            self.__save_snapshot(snapshot)
+            print('Snapshot written')
         # for ind1 in list(self.individuals.values())[:10]:
         #     for ind2 in list(self.individuals.values())[:10]:
         #         print(str(ind1), 'and', str(ind2), 'has taxonomic similarity ', ind1.taxonomic_similarity(ind2))
 
 
     def __get_all_properties(self):
-        properties = set()
-        for s, p, o in self.o.triples((None, RDF.type, OWL.ObjectProperty)):
-            if not isinstance(s, rdflib.BNode):
-                properties.add(s)
-        for s, p, o in self.o.triples((None, RDF.type, OWL.DatatypeProperty)):
-            if not isinstance(s, rdflib.BNode):
-                properties.add(s)
-        for s, p, o in self.o.triples((None, RDF.type, OWL.OntologyProperty)):
-            if not isinstance(s, rdflib.BNode):
-                properties.add(s)
-        for s, p, o in self.o.triples((None, RDF.type, OWL.AnnotationProperty)):
-            if not isinstance(s, rdflib.BNode):
-                properties.add(s)
-        for s, p, o in self.o.triples((None, None, None)):
-            if not isinstance(p, rdflib.BNode):
-                properties.add(p)
-        properties = list(properties)
+        properties = list(self.__classify_triples()['properties'])
 
         return properties
     
     def __get_all_classes(self):
-        classes = set()
-        for s, p, o in self.o.triples((None, RDF.type, OWL.Class)):
-            if not isinstance(s, rdflib.BNode):
-                classes.add(s)
-        for s, p, o in self.o.triples((None, RDF.type, RDFS.Class)):
-            if not isinstance(s, rdflib.BNode):
-                classes.add(s)
-        for s, p, o in self.o.triples((None, RDF.type, None)):
-            if not isinstance(o, rdflib.BNode):
-                classes.add(o)
-                
-        for s, p, o in self.o.triples((None, RDFS.subClassOf, None)):
-            if s not in classes and not isinstance(s, rdflib.BNode):
-                classes.add(s)
-            if o not in classes and not isinstance(o, rdflib.BNode):
-                classes.add(o)
-        
-        for s, p, o in self.o.triples((None, RDFS.domain, None)):
-            if o not in classes and not isinstance(o, rdflib.BNode):
-                classes.add(o)
-        for s, p, o in self.o.triples((None, RDFS.range, None)):
-            if o not in classes and not isinstance(o, rdflib.BNode):
-                classes.add(o)
-        classes = list(classes)
+        classes = list(self.__classify_triples()['classes'])
         
         return classes
-    
+
+    def __classify_triples(self, graph=None) -> dict:
+        """
+        Classes, properties, individuals, blank nodes and named hierarchy edges of the graph
+        Every triple is visited once and dispatched on its predicate. Individuals are the named subjects
+        typed by owl:NamedIndividual or by a class outside the RDF, RDFS and OWL vocabularies that turn
+        out to be neither classes nor properties.
+        :param graph: the ontology triples when None, e.g. a triple delta otherwise
+        """
+        graph = self.o if graph is None else graph
+        class_types = {OWL.Class, RDFS.Class}
+        property_types = {OWL.ObjectProperty, OWL.DatatypeProperty, OWL.OntologyProperty, OWL.AnnotationProperty}
+        vocabularies = (str(RDF), str(RDFS), str(OWL))
+        # namespace attributes are resolved once, each lookup builds a new URIRef
+        rdf_type, sub_class_of, sub_property_of = RDF.type, RDFS.subClassOf, RDFS.subPropertyOf
+        domain, range_, object_property, named_individual = RDFS.domain, RDFS.range, OWL.ObjectProperty, OWL.NamedIndividual
+        bnode = rdflib.BNode
+        classes, properties, object_properties, typed, bnodes = set(), set(), set(), set(), set()
+        subclass_edges, subproperty_edges = [], []
+        for s, p, o in graph.triples((None, None, None)):
+            s_named, o_named = not isinstance(s, bnode), not isinstance(o, bnode)
+            if not s_named:
+                bnodes.add(s)
+            if not o_named:
+                bnodes.add(o)
+            if not isinstance(p, bnode):
+                properties.add(p)
+            if p == rdf_type:
+                if o == object_property:
+                    object_properties.add(s)
+                if not o_named:
+                    continue
+                classes.add(o)
+                if not s_named:
+                    continue
+                if o in class_types:
+                    classes.add(s)
+                elif o in property_types:
+                    properties.add(s)
+                elif o == named_individual or not str.startswith(o, vocabularies):
+                    typed.add(s)
+            elif p == sub_class_of:
+                if s_named:
+                    classes.add(s)
+                if o_named:
+                    classes.add(o)
+                if s_named and o_named:
+                    subclass_edges.append((s, o))
+            elif p == domain or p == range_:
+                if o_named:
+                    classes.add(o)
+            elif p == sub_property_of:
+                if s_named and o_named:
+                    subproperty_edges.append((s, o))
+
+        return {'classes': classes, 'properties': properties, 'object_properties': object_properties,
+                'individuals': typed - classes - properties, 'bnodes': bnodes,
+                'subclass_edges': subclass_edges, 'subproperty_edges': subproperty_edges}
+    
+    def __add_individuals(self, individuals):
+        # registered after the classes and relations, a punned entity keeps its first kind
+        for ind in individuals:
+            uri = ind.n3()[1:-1]
+            if uri not in self.individuals and uri not in self.concepts and uri not in self.relations:
+                self.individuals[uri] = MyOWLIndividual(ind, self)
+                self._individuals.append(ind)
+        self.entities.update(self._individuals, EntityTable.INDIVIDUAL)
+
     def __get_direct_superclasses(self, cls, exclude_bnodes=True):
+        self.__read_triples()
         superclasses = set()
         for s, p, o in self.o.triples((cls, RDFS.subClassOf, None)):
             if exclude_bnodes:
@@ -201,8 +219,27 @@ class MyOWLOntology():
             self.__get_all_superclasses(scls, superclasses, exclude_bnodes)
 
         return superclasses
+
+    def __get_all_super_expressions(self, cls):
+        # named ancestors come from the hierarchy index, only the anonymous expressions are looked up
+        superclasses = self.super_expressions.get(cls)
+        if superclasses is not None:
+            return superclasses
+        if cls not in self.hierarchy:
+            return self.__get_all_superclasses(cls, superclasses=set(), exclude_bnodes=False)
+        superclasses = set(self.hierarchy.get_ancestors(cls, include_top=False))
+        for named in [cls] + list(superclasses):
+            for scls in self.__get_direct_superclasses(named, exclude_bnodes=False):
+                if isinstance(scls, rdflib.BNode) and scls not in superclasses:
+                    superclasses.add(scls)
+                    self.__get_all_superclasses(scls, superclasses, exclude_bnodes=False)
+        if self.storing:
+            self.super_expressions[cls] = superclasses
+
+        return superclasses
     
     def __get_direct_subclasses(self, cls, exclude_bnodes=True):
+        self.__read_triples()
         subclasses = set()
         for s, p, o in self.o.triples((None, RDFS.subClassOf, cls)):
             if exclude_bnodes:
@@ -243,6 +280,7 @@ class MyOWLOntology():
         return top_classes
     
     def __get_direct_super_properties(self, prop, exclude_bnode=True):
+        self.__read_triples()
         super_properties = set()
         for s, p, o in self.o.triples((prop, RDFS.subPropertyOf, None)):
             if exclude_bnode:
@@ -263,6 +301,7 @@ class MyOWLOntology():
         return super_properties
 
     def __get_direct_sub_properties(self, prop, exclude_bnode=True):
+        self.__read_triples()
         sub_classes = set()
         for s, p, o in self.o.triples((None, RDFS.subPropertyOf, prop)):
             if exclude_bnode:
@@ -308,6 +347,8 @@ class MyOWLOntology():
         if direct:
             super_prop.update(self.__get_direct_super_properties(x))
             return super_prop
+        if x in self.property_hierarchy:
+            return self.property_hierarchy.get_ancestors(x)
         li = self.__get_direct_super_properties(x)
         while len(li) > 0:
             step = self.__get_direct_super_properties(li[0])
@@ -319,6 +360,9 @@ class MyOWLOntology():
         return super_prop
     
     def get_super_classes(self, sub: rdflib.URIRef):
+        if sub in self.hierarchy:
+            # OWL.Thing is reported as a superclass of everything, itself included
+            return self.hierarchy.get_ancestors(sub) if sub != OWL.Thing else [OWL.Thing]
         anc = self.ancestors.get(sub)
         if anc is None:
             # anc = self.__get_all_superclasses(sub, [])
@@ -332,6 +376,7 @@ class MyOWLOntology():
         return anc
 
     def get_property_chains(self) -> list:
+        self.__read_triples()
         property_chains = {}
         for s, _, o in self.o.triples((None, RDFS.subPropertyOf, None)):
             properties = [o for _, _, o in self.o.triples((s, OWL.propertyChain, None))]
@@ -351,6 +396,7 @@ class MyOWLOntology():
         return property_chains
     
     def get_individual_OWL_link(self, ind: MyOWLIndividual) -> list:
+        self.__read_triples()
         owl_links = set()
         same_ind = [o for _, _, o in self.o.triples((ind.get_OWL_named_individual(), OWL.sameAs, None))]
         for r in self.relations.values():
@@ -384,318 +430,583 @@ class MyOWLOntology():
 
         return owl_links
     
+    def __parse_all(self, ont_file, processes: int=1, compiled: bool=False):
+        print('Parsing ontology...')
+        stores = []
+        if type(ont_file) == list:  # multiple graphs
+            for of in ont_file:
+                self.__parse(of, stores, processes, compiled)
+        else:
+            self.__parse(ont_file, stores, processes, compiled)
+            # self.go = get_ontology(ont_file).load()
+        if len(stores) > 0:
+            # instance data never enters an rdflib.Graph, the other files join it as a compact store
+            if len(self.o) > 0:
+                stores.append(TripleStore.from_graph(self.o))
+            self.o = stores[0] if len(stores) == 1 else TripleStore.merge(stores)
+        print('Finished')
+
+    def __read_triples(self):
+        # a snapshot restores the indexes only, the ontology is parsed the first time its triples are needed
+        if self.unparsed is None:
+            return
+        ont_file, processes, compiled = self.unparsed
+        self.unparsed = None
+        self.__parse_all(ont_file, processes, compiled)
+        # classes the snapshot does not hold get their restrictions from the triples from now on
+        self.__index_restrictions()
+
+    def __parse(self, ont_file: str, stores: list, processes: int=1, compiled: bool=False):
+        if isinstance(self.o, QuadStore):
+            self.o.load(ont_file)
+        elif is_ntriples(ont_file):
+            stores.append(load_ntriples(ont_file, processes))
+        elif compiled:
+            stores.append(compile_graph(ont_file))
+        else:
+            parse_graph(self.o, ont_file)
+
+    def __save_snapshot(self, snapshot: Snapshot):
+        # classes and relations are the first nodes of their hierarchies, only their number is stored
+        terms = {}
+        arrays = {'entity_counts': np.array([len(self._concepts), len(self._relations)], dtype=np.int64)}
+        for name, h in [('hierarchy', self.hierarchy), ('property_hierarchy', self.property_hierarchy)]:
+            terms[name] = h.nodes
+            arrays[name + '.top'] = np.array([h.top], dtype=np.int64)
+            for k, a in h.get_arrays().items():
+                arrays[name + '.' + k] = a
+
+        restriction_terms = {}  # rdflib term: position in the restriction_terms list
+        intern = lambda t: restriction_terms.setdefault(t, len(restriction_terms))
+        edges = [(intern(s), intern(o)) for s, o in self.__get_restriction_edges()]
+        ptr, pairs = [0], []
+        for cl in self._concepts:
+            pairs.extend((intern(p), intern(b)) for p, b in self.get_class_restrictions(cl))
+            ptr.append(len(pairs))
+        terms['restriction_terms'] = list(restriction_terms)
+        terms['individuals'] = self._individuals
+        terms['bnodes'] = self._bnodes
+        arrays['restriction_edges'] = np.array(edges, dtype=np.int32).reshape(-1, 2)
+        arrays['class_restriction_ptr'] = np.array(ptr, dtype=np.int64)
+        arrays['class_restriction_pairs'] = np.array(pairs, dtype=np.int32).reshape(-1, 2)
+        snapshot.write(terms, arrays)
+
+    def __load_snapshot(self, snapshot: Snapshot):
+        terms, arrays = snapshot.read()
+        self.hierarchy, self.property_hierarchy = [
+            HierarchyIndex.from_arrays(terms[name], int(arrays[name + '.top'][0]),
+                                       {k: arrays[name + '.' + k] for k in HierarchyIndex.ARRAYS})
+            for name in ['hierarchy', 'property_hierarchy']]
+        n_concepts, n_relations = arrays['entity_counts'].tolist()
+
+        self._relations = self.property_hierarchy.nodes[:n_relations]
+        for op in self._relations:
+            self.relations[op.n3()[1:-1]] = OWLRelation(op, self)
+        print('Relations read')
+        self._concepts = self.hierarchy.nodes[:n_concepts]
+        for cl in self._concepts:
+            self.concepts[cl.n3()[1:-1]] = OWLConcept(cl, self)
+        print('Classes read')
+
+        self.lcas = LCSEngine(self.hierarchy)
+        self.entities.update(self.hierarchy.nodes, EntityTable.CONCEPT)
+        self.entities.update(self.property_hierarchy.nodes, EntityTable.RELATION)
+        print('Hierarchy indexed')
+
+        restriction_terms = terms['restriction_terms']
+        self.restriction_graph = ReachabilityIndex(
+            [(restriction_terms[s], restriction_terms[o]) for s, o in arrays['restriction_edges'].tolist()])
+        ptr, pairs = arrays['class_restriction_ptr'].tolist(), arrays['class_restriction_pairs'].tolist()
+        for i, cl in enumerate(self._concepts):
+            self.class_restrictions[cl] = [(restriction_terms[p], restriction_terms[b]) for p, b in pairs[ptr[i]:ptr[i + 1]]]
+        # the raw restriction axioms are not kept, every known class already has its restrictions
+        self.restrictions = {}
+        self.restriction_index = {}
+        self.__add_individuals(terms['individuals'])
+        self._bnodes = terms['bnodes']
+        print('Individuals read')
+
     def get_concept_OWL_link(self, c: OWLConcept) -> set:
+        # one pass over the restrictions above c instead of testing every relation against every island member
+        owl_links = self.__get_cached_links(c)
+        if owl_links is not None:
+            return owl_links
         owl_links = set()
-        potential_neighbors = self.get_island(c, set())  # if want use this multiple times, use get_island(c, set())
-        for d in potential_neighbors:
-            for r in self.relations.values():
-                exps = self.check_OWL_link(c, r, d)
-                if exps:
-                    link = OWLLink(r, d)
-                    owl_links.add(link)
-        
-        # owl_links = set()
-        # for qres in self.o.query(self.prepared_queries['q3'], initBindings={'c': c.cl}):
-        #     link = OWLLink(qres.d, qres.value)
-        #     owl_links.add(link)
+        potential_neighbors = self.get_island(c)
+        pairs = set()
+        for p, b in self.get_class_restrictions(c.get_OWL_class()):
+            r = self.relations.get(p.n3()[1:-1])
+            if r is None or isinstance(b, rdflib.BNode):
+                continue
+            d = self.get_OWL_concept(b.n3()[1:-1])
+            if d in potential_neighbors and (r, d) not in pairs:
+                pairs.add((r, d))
+                owl_links.add(OWLLink(r, d))
 
         return owl_links
-    
-    def get_island(self, c: OWLConcept, visited: set=set()) -> set:
+
+    def save_derived_cache(self):
+        """
+        Write the neighbors and the fallback caches under the snapshot, later loads of the same ontology read them back
+        Entries read from an earlier cache are kept, the ones computed since are added.
+
+        :return: None
+        """
+        if self.snapshot is None:
+            print('The derived cache needs snapshot_dir and an ontology without applied deltas')
+            return
+        derived_terms = {}  # rdflib term: position in the derived_terms list
+        intern = lambda t: derived_terms.setdefault(t, len(derived_terms))
+        known = np.zeros(len(self.hierarchy), dtype=bool)
+        ptr, links = [0], []
+        for i, cl in enumerate(self.hierarchy.nodes):
+            c = self.concepts.get(cl.n3()[1:-1])
+            if c is not None and c.neighbors is not None:
+                known[i] = True
+                links.extend((intern(l.relation.p), intern(l.destiny.cl)) for l in c.neighbors)
+            elif self.derived is not None and self.derived['neighbor_known'][i]:
+                known[i] = True
+                old_terms, old_ptr = self.derived['terms'], self.derived['neighbor_ptr']
+                links.extend((intern(old_terms[r]), intern(old_terms[d]))
+                             for r, d in self.derived['neighbor_links'][old_ptr[i]:old_ptr[i + 1]].tolist())
+            ptr.append(len(links))
+        arrays = {
+            'neighbor_known': known,
+            'neighbor_ptr': np.array(ptr, dtype=np.int64),
+            'neighbor_links': np.array(links, dtype=np.int32).reshape(-1, 2),
+            'ancestors': np.array([(intern(k), intern(a)) for k, anc in self.ancestors.items() for a in anc],
+                                  dtype=np.int32).reshape(-1, 2),
+            'concept_distances': np.array([(intern(c1), intern(c2), d) for c1, aux in self.concept_distances.items()
+                                           for c2, d in aux.items()], dtype=np.int32).reshape(-1, 3),
+            'concept_profs': np.array([(intern(k), d) for k, d in self.concept_profs.items()],
+                                      dtype=np.int32).reshape(-1, 2),
+            'relation_profs': np.array([(intern(k), d) for k, d in self.relation_profs.items()],
+                                       dtype=np.int32).reshape(-1, 2)
+        }
+        self.snapshot.derived().write({'derived_terms': list(derived_terms)}, arrays)
+        print('Derived cache written for', int(known.sum()), 'concepts')
+
+    def __load_derived(self, part: Snapshot):
+        if not part.exists():
+            return
+        terms, arrays = part.read()
+        if len(arrays['neighbor_known']) != len(self.hierarchy):
+            print('Derived cache does not match the hierarchy, ignored')
+            return
+        derived_terms = terms['derived_terms']
+        # neighbors stay in the memory-mapped arrays until a concept asks for them
+        self.derived = dict(arrays, terms=derived_terms)
+        for k, a in arrays['ancestors'].tolist():
+            self.ancestors.setdefault(derived_terms[k], set()).add(derived_terms[a])
+        for c1, c2, d in arrays['concept_distances'].tolist():
+            self.concept_distances.setdefault(derived_terms[c1], {})[derived_terms[c2]] = d
+        for k, d in arrays['concept_profs'].tolist():
+            self.concept_profs[derived_terms[k]] = d
+        for k, d in arrays['relation_profs'].tolist():
+            self.relation_profs[derived_terms[k]] = d
+        print('Derived cache read,', int(arrays['neighbor_known'].sum()), 'concepts with neighbors')
+
+    def __get_cached_links(self, c: OWLConcept):
+        if self.derived is None:
+            return None
+        i = self.hierarchy.get_id(c.get_OWL_class())
+        if i < 0 or not self.derived['neighbor_known'][i]:
+            return None
+        derived_terms, ptr = self.derived['terms'], self.derived['neighbor_ptr']
+        owl_links = set()
+        for r, d in self.derived['neighbor_links'][ptr[i]:ptr[i + 1]].tolist():
+            owl_links.add(OWLLink(self.get_OWL_relation(derived_terms[r].n3()[1:-1]),
+                                  self.get_OWL_concept(derived_terms[d].n3()[1:-1])))
+
+        return owl_links
+
+    def __index_restrictions(self):
+        self.__read_triples()
+        self.restrictions = {}
+        self.restriction_index = {}
+        for ce, _, p in self.o.triples((None, OWL.onProperty, None)):
+            for b in self.o.objects(ce, OWL.someValuesFrom):
+                self.restrictions.setdefault(ce, []).append((p, b))
+                self.restriction_index.setdefault((p, b), []).append(ce)
+
+    def get_class_restrictions(self, cls) -> list:
+        restrictions = self.class_restrictions.get(cls)
+        if restrictions is not None:
+            return restrictions
+        if self.restrictions is None:
+            self.__index_restrictions()
+        restrictions = []
+        for ce in self.__get_all_super_expressions(cls):
+            restrictions.extend(self.restrictions.get(ce, []))
+        if self.storing:
+            self.class_restrictions[cls] = restrictions
+
+        return restrictions
+    
+    def get_island(self, c: OWLConcept) -> set:
+        # classes reachable from c through chains of existential restrictions, the edges of q1
+        if self.restriction_graph is None:
+            self.restriction_graph = ReachabilityIndex(self.__get_restriction_edges())
         island = set()
-        # q = '''
-        #     SELECT ?obj
-        #     WHERE {
-        #         ?c rdfs:subClassOf ?sc.
-        #         ?sc owl:someValuesFrom ?obj.
-        #     }  
-        #     '''.replace('?c', c.cl.n3())
-
-        # class_exps = [qres.obj for qres in self.o.query(q)]  # all super class expressions
-        # for ce in class_exps:
-        # for qres in self.o.query(q):
-        
-        for qres in self.o.query(self.prepared_queries['q1'], initBindings={'c': c.cl}):
-            ce = qres.obj
-            destiny_concept = self.get_OWL_concept(ce.n3()[1:-1])
-            if destiny_concept not in visited:
-                island.add(destiny_concept)
-                visited.add(destiny_concept)
-                island.update(self.get_island(destiny_concept, visited))
-        
-        # print(list(self.prepared_queries['q1'].execute(['owl:' + c.cl.n3()[1:-10]])))
-        # for qres in self.prepared_queries['q1'].execute([c.cl.n3()]):
-        #     print(qres)
-        #     ce = qres.obj
-        #     destiny_concept = self.get_OWL_concept(ce.n3()[1:-1])
-        #     if destiny_concept not in visited:
-        #         island.add(destiny_concept)
-        #         visited.add(destiny_concept)
-        #         island.update(self.get_island(destiny_concept, visited))
-        
+        for ce in self.restriction_graph.get_reachable(c.cl):
+            island.add(self.get_OWL_concept(ce.n3()[1:-1]))
+
         return island
-    
+
+    def __get_restriction_edges(self) -> list:
+        self.__read_triples()
+        edges = []
+        for s, _, sc in self.o.triples((None, RDFS.subClassOf, None)):
+            # anonymous classes never start an island, their fillers are leaves
+            if isinstance(s, rdflib.BNode):
+                continue
+            for obj in self.o.objects(sc, OWL.someValuesFrom):
+                edges.append((s, obj))
+
+        return edges
+    
+    def extract_module(self, seeds: list, out_file: str=None) -> Graph:
+        """
+        Sub-ontology holding everything the similarity measures read about a set of seed terms
+        The named ancestors of the seeds, the fillers and properties of the existential restrictions among
+        their super class expressions, and the super properties of those, are added until nothing new is found.
+        Every triple about a kept term is copied, together with the anonymous expressions it points to.
+        :param seeds: URIRef or uri string, e.g. every term of an annotation corpus or of one GO namespace
+        :param out_file: file the module is written to, the format follows its extension
+
+        :return: rdflib.Graph
+        """
+        self.__read_triples()
+        builtin = (str(OWL), str(RDF), str(RDFS))
+        kept = set()
+        stack = [URIRef(t) for t in seeds]
+        while stack:
+            t = stack.pop()
+            if t in kept or str.startswith(t, builtin):
+                continue
+            kept.add(t)
+            stack.extend(o for o in self.o.objects(t, RDF.type) if not isinstance(o, rdflib.BNode))
+            stack.extend(o for o in self.o.objects(t, RDFS.subPropertyOf) if not isinstance(o, rdflib.BNode))
+            expressions = list(self.o.objects(t, RDFS.subClassOf))
+            while expressions:
+                sc = expressions.pop()
+                if not isinstance(sc, rdflib.BNode):
+                    stack.append(sc)
+                    continue
+                stack.extend(self.o.objects(sc, OWL.onProperty))
+                stack.extend(o for o in self.o.objects(sc, OWL.someValuesFrom) if not isinstance(o, rdflib.BNode))
+                expressions.extend(self.o.objects(sc, RDFS.subClassOf))
+
+        module = Graph()
+        subjects = list(kept) + list(self.o.subjects(RDF.type, OWL.Ontology))
+        seen = set(subjects)
+        while subjects:
+            s = subjects.pop()
+            for triple in self.o.triples((s, None, None)):
+                module.add(triple)
+                if isinstance(triple[2], rdflib.BNode) and triple[2] not in seen:
+                    seen.add(triple[2])
+                    subjects.append(triple[2])
+        print('Module extracted:', len(kept), 'terms,', len(module), 'triples')
+        if out_file is not None:
+            module.serialize(destination=out_file, format=rdflib.util.guess_format(out_file) or 'xml', encoding='utf-8')
+
+        return module
+
     def check_OWL_link(self, c1: OWLConcept, r: OWLRelation, c2: OWLConcept) -> bool:
         a = c1.get_OWL_class()
         b = c2.get_OWL_class()
         p = r.get_OWL_object_property()
-        # q = prepareQuery(
-        #     '''
-        #     SELECT ?c
-        #     WHERE {
-        #         ?c owl:onProperty ?p.
-        #         ?c owl:someValuesFrom ?b.
-        #     }
-        #     '''
-        # )
-
-        class_expr = self.o.query(self.prepared_queries['q2'], initBindings={'p': p, 'b': b})
-
-        # class_expr = self.o.query(
-        #     '''
-        #     SELECT ?c
-        #     WHERE {
-        #         ?c owl:onProperty ?p.
-        #         ?c owl:someValuesFrom ?b.
-        #     }
-        #     '''.replace('?p', p.n3()).replace('?b', b.n3())
-        # )
-
-        cond1 = False
-        for ce in class_expr:  #  loop class_expr wastes too much time !!!
-            if (a, RDFS.subClassOf, ce.c) in self.o:
-                cond1 = True
-                break
-        all_scs = self.__get_all_superclasses(a, superclasses=set(), exclude_bnodes=False)
-        # all_scs = self.__get_all_superclasses(a, superclasses=[], exclude_bnodes=False)
-        # cond2 = [ce.c in all_scs for ce in class_expr]
-        cond2 = False
-        for ce in class_expr:
-            if ce.c in all_scs:
-                cond2 = True
-                break
-
-        if cond1 or cond2:
-            return True
-        else:
-            return False
+        # the restrictions among the super class expressions of a are indexed once, see get_class_restrictions
+        return (p, b) in self.get_class_restrictions(a)
     
-    def set_OWL_links(self, entities: list):
+    def set_OWL_links(self, entities: list, processes: int=1):
         concepts_E = set()
         for e in entities:
             if isinstance(e, OWLConcept):
                 concepts_E.add(e)
             else:
-                e.gei_neighbors()
-        self.set_OWL_links_concepts(list(concepts_E))
-    
-    def set_OWL_links_concepts(self, concepts: list):
-        axioms = {}
-        
-        for c in concepts:
-            potential_neighbors = self.get_island(c)
-            register = self.add_equivalent_axioms(c, potential_neighbors)
-            axioms[c] = register
-        
-        for c in axioms.keys():
-            a = c.get_OWL_class()
-            register = axioms[c]
-            links = set()
-            for test in register.keys():
-                expression = register[test]
-                links.update(self.conformed_links(a, test, expression))
-            c.set_neighbors(links)
-        
-        for c in axioms.keys():
-            register = axioms[c]
-            for test in register.keys():
-                expression = register[test]
-                # TODO remove axioms
+                e.get_neighbors()
+        self.set_OWL_links_concepts(list(concepts_E), processes)
+    
+    def set_OWL_links_concepts(self, concepts: list=None, processes: int=1):
+        """
+        Materialize the neighbors of many concepts at once
+        :param concepts: OWLConcept to fill, every class of the ontology when None
+        :param processes: number of worker processes, the indexes are built first and shared by fork
+
+        :return: None
+        """
+        if concepts is None:
+            concepts = [self.get_OWL_concept(cl.n3()[1:-1]) for cl in self._concepts]
+        if self.restriction_graph is None:
+            self.restriction_graph = ReachabilityIndex(self.__get_restriction_edges())
+        if self.restrictions is None:
+            self.__index_restrictions()
+
+        if processes > 1 and len(concepts) > 1 and 'fork' in multiprocessing.get_all_start_methods():
+            global worker_ontology
+            worker_ontology = self
+            uris = [c.uri for c in concepts]
+            chunk = max(1, len(uris) // (processes * 4))
+            with multiprocessing.get_context('fork').Pool(processes) as pool:
+                results = pool.map(get_concept_link_uris, [uris[i:i + chunk] for i in range(0, len(uris), chunk)])
+            worker_ontology = None
+            for c, links in zip(concepts, [links for res in results for links in res]):
+                c.set_neighbors(set(OWLLink(self.get_OWL_relation(r), self.get_OWL_concept(d)) for r, d in links))
+        else:
+            for c in concepts:
+                c.set_neighbors(self.get_concept_OWL_link(c))
+        print('Neighbors set for', len(concepts), 'concepts')
+    
+    def apply_delta(self, added: list=(), removed: list=()):
+        """
+        Add and remove triples, then rebuild only the derived state they can change
+        Hierarchy rows are recomputed for the classes and properties below a changed edge. Cached
+        restrictions, islands, neighbors and LCS pairs are dropped only for the entities depending on a
+        changed triple. Classes and properties are never removed, one left without triples stays as a root.
+        :param added: (s, p, o) triples
+        :param removed: (s, p, o) triples
+
+        :return: None
+        """
+        if self.from_snapshot:
+            print('Deltas need the ontology triples, load it without snapshot_dir')
+            return
+        added, removed = list(added), list(removed)
+        # the fingerprint no longer describes the content, nothing derived from now on is saved under it
+        self.snapshot = None
+        if self.restriction_graph is not None:
+            # islands behind materialized neighbors have to be memoized to tell whether they change
+            for c in self.concepts.values():
+                if c.neighbors is not None:
+                    self.restriction_graph.get_reachable(c.cl)
+        self.o = update_store(self.o, added, removed)
+        delta_added, delta_removed = Graph(), Graph()
+        for triple in added:
+            delta_added.add(triple)
+        for triple in removed:
+            delta_removed.add(triple)
+        kinds_added = self.__classify_triples(delta_added)
+        kinds_removed = self.__classify_triples(delta_removed)
+
+        new_relations = [op for op in kinds_added['object_properties']
+                         if op != OWL.topObjectProperty and op.n3()[1:-1] not in self.relations]
+        for op in new_relations:
+            self.relations[op.n3()[1:-1]] = OWLRelation(op, self)
+            self._relations.append(op)
+        new_classes = [cl for cl in kinds_added['classes'] if cl.n3()[1:-1] not in self.concepts]
+        for cl in new_classes:
+            self.concepts[cl.n3()[1:-1]] = OWLConcept(cl, self)
+            self._concepts.append(cl)
+        known_bnodes = set(self._bnodes)
+        self._bnodes.extend(b for b in kinds_added['bnodes'] if b not in known_bnodes)
+
+        n_concepts, n_relations = len(self.hierarchy), len(self.property_hierarchy)
+        self.hierarchy, affected = self.hierarchy.update(new_classes, kinds_added['subclass_edges'],
+                                                         kinds_removed['subclass_edges'])
+        self.property_hierarchy, affected_relations = self.property_hierarchy.update(
+            new_relations, kinds_added['subproperty_edges'], kinds_removed['subproperty_edges'])
+        self.entities.update(self.hierarchy.nodes[n_concepts:], EntityTable.CONCEPT)
+        self.entities.update(self.property_hierarchy.nodes[n_relations:], EntityTable.RELATION)
+        self.__add_individuals(kinds_added['individuals'])
+
+        # anonymous subjects are charged to the named classes holding them as super class expressions
+        touched = set(s for s, _, _ in added + removed)
+        owners, stack = set(), list(touched)
+        while stack:
+            t = stack.pop()
+            if t not in owners:
+                owners.add(t)
+                if isinstance(t, rdflib.BNode):
+                    stack.extend(self.o.subjects(RDFS.subClassOf, t))
+        owner_ids = [self.hierarchy.get_id(t) for t in owners if t in self.hierarchy]
+        affected = np.union1d(affected, self.hierarchy.get_descendant_ids(owner_ids))
+        self.lcas = self.lcas.update(self.hierarchy, affected)
+        affected = set(self.hierarchy.nodes[i] for i in affected.tolist())
+
+        if self.restrictions is not None:
+            for ce in touched:
+                for pair in self.restrictions.pop(ce, []):
+                    self.restriction_index[pair].remove(ce)
+                for p in self.o.objects(ce, OWL.onProperty):
+                    for b in self.o.objects(ce, OWL.someValuesFrom):
+                        self.restrictions.setdefault(ce, []).append((p, b))
+                        self.restriction_index.setdefault((p, b), []).append(ce)
+        for cls in affected:
+            self.super_expressions.pop(cls, None)
+            self.class_restrictions.pop(cls, None)
+        islands = set()
+        if self.restriction_graph is not None:
+            sources = [t for t in owners if not isinstance(t, rdflib.BNode)]
+            islands = self.restriction_graph.update({s: [obj for sc in self.o.objects(s, RDFS.subClassOf)
+                                                         for obj in self.o.objects(sc, OWL.someValuesFrom)]
+                                                     for s in sources})
+        # entities outside the indexes are walked in the graph, their caches are dropped on any schema change;
+        # typing an individual is not one, it only reaches the individual caches
+        schema_types = {OWL.Class, RDFS.Class, OWL.Restriction, RDF.Property, OWL.ObjectProperty,
+                        OWL.DatatypeProperty, OWL.AnnotationProperty, OWL.OntologyProperty, OWL.TransitiveProperty,
+                        OWL.SymmetricProperty, OWL.FunctionalProperty, OWL.InverseFunctionalProperty}
+        schema_typed = any(p == RDF.type and o in schema_types for _, p, o in added + removed)
+        schema_changed = len(affected) > 0 or len(affected_relations) > 0 or schema_typed
+        changed = lambda cl: cl in affected or schema_changed and cl not in self.hierarchy
+        stale = set()  # classes whose memoized similarities may change
+        for c in self.concepts.values():
+            if changed(c.cl):
+                stale.add(c.cl)
+            if c.neighbors is None:
+                continue
+            if c.cl in affected or c.cl in islands:
+                c.neighbors = None
+                stale.add(c.cl)
+            elif any(changed(URIRef(l.destiny.uri)) for l in c.neighbors):
+                stale.add(c.cl)
+
+        if schema_changed:
+            self.ancestors = {}
+            self.concept_distances = {}
+            self.concept_profs = {}
+            self.relation_profs = {}
+        for ind in self.individuals.values():
+            if ind.neighbors is not None and (ind.ind in touched or len(new_relations) > 0 or schema_typed):
+                ind.neighbors = None
+        if len(affected_relations) > 0 or len(new_relations) > 0:
+            self.similarities.clear()
+        else:
+            # link terms are (relation, destiny uri) pairs, the destiny decides
+            self.similarities.evict(lambda t: (t[1] if isinstance(t, tuple) else t) in stale, ['concept', 'link'])
+            self.similarities.evict(lambda t: True, ['individual', 'individual_concept'])
+        print('Delta applied:', len(added), 'added,', len(removed), 'removed,', len(affected), 'classes re-indexed')
     
     def prof_LCS(self, set_x: list, set_y: list, x: rdflib.URIRef, y: rdflib.URIRef, typeofxy=None):
-        if typeofxy is None:
-            if x == y:
-                return x
-            
-            common = [i for i in set_x if i in set_y]
+        if x == y:
+            return x
 
-            if len(common) == 0:
-                return None
-            
-            lcs = common[0]
+        set_y = set(set_y)
+        common = [i for i in set_x if i in set_y]
 
-            maxProf = self.prof(lcs)
-            for aux in common:
-                if self.prof(aux) > maxProf:
-                    maxProf = self.prof(aux)
-                    lcs = aux
+        if len(common) == 0:
+            return None
+
+        if typeofxy == 'OWLConcept':
+            prof = self.prof_class
+        elif typeofxy == 'OWLRelation':
+            prof = self.prof_property
         else:
-            if typeofxy == 'OWLConcept':
-                if x == y:
-                    return x
-            
-                common = [i for i in set_x if i in set_y]
-
-                if len(common) == 0:
-                    return None
-                
-                lcs = common[0]
-
-                maxProf = self.prof(self.get_OWL_concept(lcs))
-                for aux in common:
-                    if self.prof(self.get_OWL_concept(aux)) > maxProf:
-                        maxProf = self.prof(self.get_OWL_concept(aux))
-                        lcs = aux
-            elif typeofxy == 'OWLRelation':
-                if x == y:
-                    return x
-            
-                common = [i for i in set_x if i in set_y]
-
-                if len(common) == 0:
-                    return None
-                
-                lcs = common[0]
-
-                maxProf = self.prof(self.get_OWL_relation(lcs))
-                for aux in common:
-                    if self.prof(self.get_OWL_concept(aux)) > maxProf:
-                        maxProf = self.prof(self.get_OWL_relation(aux))
-                        lcs = aux
-            elif typeofxy == 'MyOWLIndividual':
-                if x == y:
-                    return x
-            
-                common = [i for i in set_x if i in set_y]
-
-                if len(common) == 0:
-                    return None
-                
-                lcs = common[0]
-
-                maxProf = self.prof(self.get_OWL_individual(lcs))
-                for aux in common:
-                    if self.prof(self.get_OWL_individual(aux)) > maxProf:
-                        maxProf = self.prof(self.get_OWL_individual(aux))
-                        lcs = aux
+            prof = self.prof
         
-        return lcs
+        return common[int(np.argmax([prof(aux) for aux in common]))]
     
     def dist(self, c1, c2):
         depth = 0
         if isinstance(c1, rdflib.URIRef):
-            if c1 in self._concepts:
-                dis = self.get_distance(c1, c2)
-                if dis != -1:
-                    return dis
-                c = []  # Set of OWLClassExpression
-                c.append(c1)
-                while c2 not in c and len(c) > 0:
-                    super_classes = []  # Set of OWLClassExpression
-                    for i in c:
-                        if i.n3():
-                            super_classes.extend(self.__get_direct_superclasses(i))
-                    c = super_classes
-                    depth += 1
-                self.set_distance(c1, c2, depth)
-            elif c1 in self._relations:
-                c = []
-                c.append(c1)
-                while c2 not in c and len(c) > 0:
-                    superobject_properties = []
-                    for i in c:
-                        if i.n3():
-                            superobject_properties.extend(self.__get_direct_super_properties(i))
-                    c = superobject_properties
-                    depth += 1
-            elif c1 in self._individuals:
-                c = []
-                aux_set = self.get_types(c1, True)
-                c.extend(aux_set)
-                while c2 not in c and len(c) > 0:
-                    super_classes = []
-                    for i in c:
-                        if i.n3():
-                            super_classes.extend(self.__get_direct_superclasses(i))
-                    c = super_classes
-                    depth += 1
+            kind = self.entities.get_kind(c1)
+            if kind == EntityTable.CONCEPT:
+                depth = self.dist_class(c1, c2)
+            elif kind == EntityTable.RELATION:
+                depth = self.dist_property(c1, c2)
+            elif kind == EntityTable.INDIVIDUAL:
+                depth = self.dist_individual(c1, c2)
         else:
             if isinstance(c1, OWLConcept):
-                c1 = c1.get_OWL_class()
-                c2 = c2.get_OWL_class()
-                dis = self.get_distance(c1, c2)
-                if dis != -1:
-                    return dis
-                c = []  # Set of OWLClassExpression
-                c.append(c1)
-                while c2 not in c and len(c) > 0:
-                    super_classes = []  # Set of OWLClassExpression
-                    for i in c:
-                        if i.n3():
-                            super_classes.extend(self.__get_direct_superclasses(i))
-                    c = super_classes
-                    depth += 1
-                self.set_distance(c1, c2, depth)
+                depth = self.dist_class(c1.get_OWL_class(), c2.get_OWL_class())
             elif isinstance(c1, OWLRelation):
-                c1 = c1.get_OWL_object_property()
-                c2 = c2.get_OWL_object_property()
-                c = []
-                c.append(c1)
-                while c2 not in c and len(c) > 0:
-                    superobject_properties = []
-                    for i in c:
-                        if i.n3():
-                            superobject_properties.extend(self.__get_direct_super_properties(i))
-                    c = superobject_properties
-                    depth += 1
+                depth = self.dist_property(c1.get_OWL_object_property(), c2.get_OWL_object_property())
             elif isinstance(c1, MyOWLIndividual):
-                c1 = c1.get_OWL_named_individual()
-                c2 = c2.get_OWL_named_individual()
-                c = []
-                aux_set = self.get_types(c1, True)
-                c.extend(aux_set)
-                while c2 not in c and len(c) > 0:
-                    super_classes = []
-                    for i in c:
-                        if i.n3():
-                            super_classes.extend(self.__get_direct_superclasses(i))
-                    c = super_classes
-                    depth += 1
-
+                depth = self.dist_individual(c1.get_OWL_named_individual(), c2.get_OWL_named_individual())
         
         return depth
 
+    def __search_dist(self, c: list, c2, get_direct_supers) -> int:
+        # level by level search for entities outside the indexes, each level deduplicated
+        depth = 0
+        while c2 not in c and len(c) > 0:
+            supers = set()
+            for i in c:
+                supers.update(get_direct_supers(i))
+            c = list(supers)
+            depth += 1
+
+        return depth
+
+    def dist_class(self, c1: rdflib.URIRef, c2: rdflib.URIRef):
+        i = self.hierarchy.get_id(c1)
+        if i >= 0:
+            depth = self.hierarchy.distance(i, self.hierarchy.get_id(c2))
+            # an entity that does not subsume c1 is reported where the search runs out, as before
+            return depth if depth >= 0 else int(self.hierarchy.max_depth[i])
+        dis = self.get_distance(c1, c2)
+        if dis != -1:
+            return dis
+        depth = self.__search_dist([c1], c2, self.__get_direct_superclasses)
+        self.set_distance(c1, c2, depth)
+
+        return depth
+
+    def dist_property(self, c1: rdflib.URIRef, c2: rdflib.URIRef):
+        i = self.property_hierarchy.get_id(c1)
+        if i >= 0:
+            depth = self.property_hierarchy.distance(i, self.property_hierarchy.get_id(c2))
+            return depth if depth >= 0 else int(self.property_hierarchy.max_depth[i])
+
+        return self.__search_dist([c1], c2, self.__get_direct_super_properties)
+
+    def dist_individual(self, c1: rdflib.URIRef, c2: rdflib.URIRef):
+        types = self.get_types(c1, True)
+        ids = [self.hierarchy.get_id(t) for t in types]
+        if len(ids) == 0 or min(ids) < 0:
+            return self.__search_dist(types, c2, self.__get_direct_superclasses)
+        j = self.hierarchy.get_id(c2)
+        depths = [self.hierarchy.distance(i, j) for i in ids]
+        depths = [d for d in depths if d >= 0]
+        if len(depths) > 0:
+            return min(depths)
+
+        return int(max(self.hierarchy.max_depth[i] for i in ids))
+
     def prof(self, _class):
         depth = 0
         if isinstance(_class, rdflib.URIRef):
-            if _class in self._concepts:
-                if self.concept_profs.get(_class) is not None:
-                    return self.concept_profs[_class]
-                depth = self.dist(_class, OWL.Thing)
-                if self.storing:
-                    self.concept_profs[_class] = depth
-            elif _class in self._relations:
-                if self.relation_profs.get(_class) is not None:
-                    return self.relation_profs[_class]
-                depth = self.dist(_class, OWL.topObjectProperty)
-                self.relation_profs[_class] = depth
+            kind = self.entities.get_kind(_class)
+            if kind == EntityTable.CONCEPT:
+                depth = self.prof_class(_class)
+            elif kind == EntityTable.RELATION:
+                depth = self.prof_property(_class)
         else:
             if isinstance(_class, OWLConcept):
-                _class = _class.get_OWL_class()
-                if self.concept_profs.get(_class) is not None:
-                    return self.concept_profs[_class]
-                depth = self.dist(self.get_OWL_concept(_class), self.get_OWL_concept(OWL.Thing))
-                if self.storing:
-                    self.concept_profs[_class] = depth
+                depth = self.prof_class(_class)
             elif isinstance(_class, OWLRelation):
-                _class = _class.get_OWL_object_property()
-                if self.relation_profs.get(_class) is not None:
-                    return self.relation_profs[_class]
-                depth = self.dist(self.get_OWL_relation(_class), self.get_OWL_relation(OWL.topObjectProperty))
-                self.relation_profs[_class] = depth
+                depth = self.prof_property(_class)
         
         return depth
 
+    def prof_class(self, _class):
+        if isinstance(_class, OWLConcept):
+            _class = _class.get_OWL_class()
+        depth = self.hierarchy.get_depth(_class)
+        if depth >= 0:
+            return depth
+        if self.concept_profs.get(_class) is not None:
+            return self.concept_profs[_class]
+        depth = self.dist_class(_class, OWL.Thing)
+        if self.storing:
+            self.concept_profs[_class] = depth
+
+        return depth
+
+    def prof_property(self, _class):
+        if isinstance(_class, OWLRelation):
+            _class = _class.get_OWL_object_property()
+        depth = self.property_hierarchy.get_depth(_class)
+        if depth >= 0:
+            return depth
+        if self.relation_profs.get(_class) is not None:
+            return self.relation_profs[_class]
+        depth = self.dist_property(_class, OWL.topObjectProperty)
+        self.relation_profs[_class] = depth
+
+        return depth
+
     def taxonomic_property_similarity(self, x, y):
         set_x = self.get_superobject_properties(x, False)
         set_x.append(x)
@@ -732,18 +1043,43 @@ class MyOWLOntology():
             else:
                 return d
     
+    def get_similarity(self, kind: str, a, b, compute) -> float:
+        """
+        Similarity of a and b read from the shared memo, computed and stored on a miss
+        :param kind: 'concept', 'individual', 'individual_concept', 'relation' or 'link', pairs of different kinds never meet
+        :param compute: function without arguments returning the similarity
+
+        :return: the similarity
+        """
+        sim = self.similarities.get(kind, a, b)
+        if sim is None:
+            sim = compute()
+            if self.storing:
+                self.similarities.put(kind, a, b, sim)
+
+        return sim
+
     def get_types(self, ind: rdflib.URIRef, direct: bool):
+        self.__read_triples()
         classes = set()
         clses = [o for _, _, o in self.o.triples((ind, RDF.type, None))]
         if direct:
             classes.update(clses)
         else:
             for cls in clses:
-                classes.update(self.__get_direct_superclasses(cls))
+                if cls in self.hierarchy:
+                    classes.update(self.hierarchy.get_ancestors(cls, include_top=False))
+                else:
+                    classes.update(self.__get_direct_superclasses(cls))
             classes.update(clses)
         classes = list(classes)
         
         return classes
+
+    def is_subclass_of(self, a: rdflib.URIRef, b: rdflib.URIRef) -> bool:
+        if a in self.hierarchy:
+            return self.hierarchy.subsumes(b, a)
+        return a == b or b in self.get_super_classes(a)
     
     def get_OWL_relation(self, uri: str) -> OWLRelation:
         return self.relations.get(uri)
@@ -773,28 +1109,27 @@ class MyOWLOntology():
         pass
 
     def get_LCS(self, a: OWLConcept, b: OWLConcept) -> OWLConcept:
-        # comparison = AnnotationComparison(a, b)
-        # lcs_concept = self.lcas.get(comparison)
-        lcs_concept = None
-        if lcs_concept is None:
-            x, y = a.get_OWL_class(), b.get_OWL_class()
+        x, y = a.get_OWL_class(), b.get_OWL_class()
+        lcs = self.lcas.get_LCS(x, y)
+        if lcs is None:
             set_x = self.get_super_classes(x)
             set_x.append(x)
             set_y = self.get_super_classes(y)
             set_y.append(y)
             lcs = self.prof_LCS(set_x, set_y, x, y, typeofxy='OWLConcept')
-            lcs_concept = self.get_OWL_concept(lcs.n3()[1:-1])
-            # if self.storing:
-            #     self.lcas[comparison] = lcs_concept
         
-        return lcs_concept
+        return self.get_OWL_concept(lcs.n3()[1:-1])
 
     def dps(self, x: OWLConcept, y: OWLConcept):
-        lcs = self.get_LCS(x, y)
-
-        prof_LCS = self.prof(lcs)
-        dxa = self.dist(x, lcs)
-        dya = self.dist(y, lcs)
+        i, j = self.hierarchy.get_id(x.get_OWL_class()), self.hierarchy.get_id(y.get_OWL_class())
+        if i >= 0 and j >= 0:
+            lcs, dxa, dya = self.lcas.get_LCS_ids(i, j)
+            prof_LCS = int(self.hierarchy.depth[lcs])
+        else:
+            lcs = self.get_LCS(x, y)
+            prof_LCS = self.prof(lcs)
+            dxa = self.dist(x, lcs)
+            dya = self.dist(y, lcs)
         if prof_LCS + dxa + dya != 0:
             dps = 1.0 - prof_LCS / (prof_LCS + dxa + dya)
         else:
@@ -808,18 +1143,47 @@ class MyOWLOntology():
 
         return dps
 
+    def taxonomic_similarity_matrix(self, list_a: list, list_b: list) -> np.ndarray:
+        """
+        Taxonomic similarity (dps) of every pair of concepts in list_a x list_b
+        :param list_a: OWLConcept or class URIs
+        :param list_b: OWLConcept or class URIs
+
+        :return: array of shape (len(list_a), len(list_b)), entry [i, j] equals taxonomic_class_similarity(a_i, b_j)
+        """
+        list_a = [c if isinstance(c, OWLConcept) else self.get_OWL_concept(c.n3()[1:-1]) for c in list_a]
+        list_b = [c if isinstance(c, OWLConcept) else self.get_OWL_concept(c.n3()[1:-1]) for c in list_b]
+        ids_a = np.array([self.hierarchy.get_id(c.get_OWL_class()) for c in list_a], dtype=np.int64)
+        ids_b = np.array([self.hierarchy.get_id(c.get_OWL_class()) for c in list_b], dtype=np.int64)
+        known_a, known_b = np.flatnonzero(ids_a >= 0), np.flatnonzero(ids_b >= 0)
+
+        sim = np.zeros((len(list_a), len(list_b)), dtype=np.float64)
+        _, prof_LCS, dist = self.lcas.get_LCS_matrix(ids_a[known_a], ids_b[known_b])
+        total = prof_LCS + dist
+        block = np.where((prof_LCS >= 0) & (total != 0), prof_LCS / np.where(total != 0, total, 1), 0.0)
+        sim[np.ix_(known_a, known_b)] = block
+        # concepts outside the named hierarchy keep the pairwise path
+        for i in np.flatnonzero(ids_a < 0).tolist():
+            for j in range(len(list_b)):
+                sim[i, j] = self.dps(list_a[i], list_b[j])
+        for j in np.flatnonzero(ids_b < 0).tolist():
+            for i in known_a.tolist():
+                sim[i, j] = self.dps(list_a[i], list_b[j])
+
+        return sim
+
     def taxonomic_individual_similarity(self, x: rdflib.URIRef, y: rdflib.URIRef):
         set_x = []
         set_y = []
 
-        if x in self._individuals and y in self._individuals:
+        if self.entities.is_individual(x) and self.entities.is_individual(y):
             set_x = self.get_types(x, False)
             set_y = self.get_types(y, False)
             if len(set_x) == 0 or len(set_y) == 0:
                 print('ERROR: ', x, ' or ', y, ' have no types.')
             lcs = self.prof_LCS(set_x, set_y, set_x[0], None)
         
-        if x in self._concepts and y in self._concepts:
+        if self.entities.is_concept(x) and self.entities.is_concept(y):
             set_x = self.get_super_classes(x)
             set_x.append(x)
             set_x = list(set(x))
@@ -845,6 +1209,8 @@ class MyOWLOntology():
 
 
 class AnnSim():
+    AGGREGATORS = ('bma', 'max', 'average', 'hungarian')  # group similarities of AnnSim.aggregate
+
     def __init__(self, matrix=None):
         self.v1 = None
         self.v2 = None
@@ -867,6 +1233,12 @@ class AnnSim():
                 for i, s1 in enumerate(self.v1):
                     for j, s2 in enumerate(self.v2):
                         self.cost_matrix[i, j] = 1 - s1.similarity(s2, orig, des)
+            elif isinstance(self.map_comparisons, SimilarityMatrix):
+                # one gather over the interned ids replaces a dict lookup per cell
+                block = self.map_comparisons.get_block(self.v1, self.v2)
+                if np.isnan(block).any():
+                    raise KeyError('Similarity missing for a pair of ' + str(self.v1) + ' and ' + str(self.v2))
+                self.cost_matrix = 1 - block
             else:
                 for i, s1 in enumerate(self.v1):
                     for j, s2 in enumerate(self.v2):
@@ -882,6 +1254,89 @@ class AnnSim():
                     sim += 1 - self.cost_matrix[i, aux]
             
             return 2 * sim / (len(self.v1) + len(self.v2))
+
+    def matching_batch(self, pairs: list) -> np.array:
+        """
+        Similarities of many pairs of annotation lists, the assignments of equally shaped cost matrices are
+        solved together by HungarianAlgorithm.execute_batch
+        :param pairs: (a, b) lists of annotations, as given to matching
+
+        :return: similarity of each pair, nan where matching fails on the pair
+        """
+        return self.group_similarities(pairs, ['hungarian'])['hungarian']
+
+    def group_similarities(self, pairs: list, aggregators: list=AGGREGATORS) -> dict:
+        """
+        Similarities of many pairs of annotation lists under several aggregators, the term similarities of
+        each pair are looked up once and shared by all of them
+        :param pairs: (a, b) lists of annotations, as given to matching
+        :param aggregators: names among AnnSim.AGGREGATORS
+
+        :return: aggregator: similarity of each pair, nan where matching fails on the pair
+        """
+        sims = {name: np.full(len(pairs), np.nan) for name in aggregators}
+        groups = {}  # shape: list of (position in pairs, similarity matrix)
+        for k, (a, b) in enumerate(pairs):
+            if len(a) == 0 or len(b) == 0 or type(a[0]) != type(b[0]):
+                continue
+            if a == b:
+                for name in aggregators:
+                    sims[name][k] = 1.0
+                continue
+            if self.map_comparisons is None:
+                sim = [[s1.similarity(s2, None, None) for s2 in b] for s1 in a]
+            else:
+                if isinstance(self.map_comparisons, SimilarityMatrix):
+                    sim = self.map_comparisons.get_block(a, b)
+                else:
+                    sim = np.array([[self.map_comparisons.get(AnnotationComparison(s1, s2), np.nan) for s2 in b]
+                                    for s1 in a], dtype=np.float64)
+                # a missing comparison leaves the pair at nan instead of failing the batch
+                if np.isnan(sim).any():
+                    continue
+            groups.setdefault((len(a), len(b)), []).append((k, sim))
+
+        for group in groups.values():
+            positions = [k for k, _ in group]
+            for name, values in AnnSim.aggregate(np.array([sim for _, sim in group]), aggregators).items():
+                sims[name][positions] = values
+
+        return sims
+
+    @staticmethod
+    def aggregate(sim_matrices: np.array, aggregators: list=AGGREGATORS) -> dict:
+        """
+        Group similarities of a stack of equally shaped term similarity matrices, one reduction per aggregator
+        bma: best match average, the row and column maxima averaged together as maximum_matching does
+        max: the best single match
+        average: the mean over every pair of terms
+        hungarian: the one-to-one assignment of maximum similarity normalized by both sizes as matching does
+        :param sim_matrices: batch x rows x cols similarities
+        :param aggregators: names among AnnSim.AGGREGATORS
+
+        :return: aggregator: similarity of each matrix
+        """
+        sim_matrices = np.asarray(sim_matrices, dtype=np.float64)
+        _, rows, cols = sim_matrices.shape
+        sims = {}
+        if 'bma' in aggregators or 'max' in aggregators:
+            # maxima start from 0 as in maximum_matching
+            row_max = np.maximum(sim_matrices.max(axis=2), 0)
+            col_max = np.maximum(sim_matrices.max(axis=1), 0)
+            if 'bma' in aggregators:
+                # cumulative sums add the maxima in the order the loops of maximum_matching do
+                sims['bma'] = np.cumsum(np.concatenate([row_max, col_max], axis=1), axis=1)[:, -1] / (rows + cols)
+            if 'max' in aggregators:
+                sims['max'] = row_max.max(axis=1)
+        if 'average' in aggregators:
+            sims['average'] = sim_matrices.mean(axis=(1, 2))
+        if 'hungarian' in aggregators:
+            cost_matrices = 1 - sim_matrices
+            assignment = HungarianAlgorithm.execute_batch(cost_matrices)
+            matched = np.take_along_axis(cost_matrices, np.maximum(assignment, 0)[:, :, None], axis=2)[:, :, 0]
+            sims['hungarian'] = 2 * np.cumsum(np.where(assignment >= 0, 1 - matched, 0), axis=1)[:, -1] / (rows + cols)
+
+        return sims
     
     def maximum_matching(self, a: set, b: set, orig: MyOWLLogicalEntity, des: MyOWLLogicalEntity):
         if type(a) != type(b) and len(a) == 0 and len(b) == 0:
@@ -898,6 +1353,8 @@ class AnnSim():
                 for i, s1 in enumerate(self.v1):
                     for j, s2 in enumerate(self.v2):
                         self.cost_matrix[i, j] = s1.similarity(s2, orig, des)
+            elif isinstance(self.map_comparisons, SimilarityMatrix):
+                self.cost_matrix = np.nan_to_num(self.map_comparisons.get_block(self.v1, self.v2), nan=0.0)
             else:
                 for i, s1 in enumerate(self.v1):
                     for j, s2 in enumerate(self.v2):
@@ -906,23 +1363,12 @@ class AnnSim():
                             value = 0.0
                         self.cost_matrix[i, j] = value
             
-            sim = 0
-            for i in range(len(self.v1)):
-                max_row = 0
-                for j in range(len(self.v2)):
-                    if max_row < self.cost_matrix[i, j]:
-                        max_row = self.cost_matrix[i, j]
-                sim += max_row
-            for j in range(len(self.v2)):
-                max_col = 0
-                for i in range(len(self.v1)):
-                    if max_col < self.cost_matrix[i, j]:
-                        max_col = self.cost_matrix[i, j]
-                sim += max_col
-            return sim / (len(a) + len(b))
+            return float(AnnSim.aggregate(self.cost_matrix[None], ['bma'])['bma'][0])
 
 
 class OWLRelation():
+    __slots__ = ('o', 'p', 'uri')
+
     def __init__(self, property: rdflib.URIRef, onto: MyOWLOntology):
         self.o = onto
         self.p = property
@@ -935,10 +1381,13 @@ class OWLRelation():
         return self.uri
     
     def similarity(self, r: OWLRelation):
-        return self.o.taxonomic_property_similarity(self.get_OWL_object_property(), r.get_OWL_object_property())
+        return self.o.get_similarity('relation', self.p, r.p, lambda: self.o.taxonomic_property_similarity(
+            self.get_OWL_object_property(), r.get_OWL_object_property()))
 
 
 class OWLLink():
+    __slots__ = ('relation', 'destiny', 'explanations')
+
     def __init__(self, r: OWLRelation, b: MyOWLLogicalEntity, exp: list=None):
         self.relation = r
         self.destiny = b
@@ -957,6 +1406,13 @@ class OWLLink():
         return self.destiny
     
     def similarity(self, a: OWLLink, concept_a: MyOWLLogicalEntity, concept_b: MyOWLLogicalEntity):
+        if None in (self.relation, self.destiny, a.relation, a.destiny):
+            return self.__similarity(a)
+        # a link is identified by its relation and its destiny, both URIRef like the other memo terms
+        return self.relation.o.get_similarity('link', (self.relation.p, URIRef(self.destiny.uri)),
+                                              (a.relation.p, URIRef(a.destiny.uri)), lambda: self.__similarity(a))
+
+    def __similarity(self, a: OWLLink):
         bmp = BipartiteGraphMatching()
 
         try:
@@ -972,6 +1428,8 @@ class OWLLink():
 
 
 class MyOWLLogicalEntity(ABC):
+    __slots__ = ('uri', 'o', 'neighbors')
+
     def __init__(self):
         self.uri = None
         self.o = None
@@ -1077,13 +1535,18 @@ class MyOWLLogicalEntity(ABC):
 
 
 class OWLConcept(MyOWLLogicalEntity):
+    __slots__ = ('cl',)
+
     def __init__(self, a: rdflib.URIRef, onto: MyOWLOntology):
         self.o = onto
         self.uri = a.n3()[1:-1]
         self.neighbors = None
         self.cl = a
         # self.name = self.uri
-        self.satisfiable = self.is_satisfiable()
+
+    @property
+    def satisfiable(self):
+        return self.is_satisfiable()
     
     def get_OWL_class(self):
         return self.cl
@@ -1269,7 +1732,7 @@ class OWLConcept(MyOWLLogicalEntity):
             #     return 0
             if self == c:
                 return 1.0
-            sim = self.on_sim(c)
+            sim = self.o.get_similarity('concept', self.cl, c.cl, lambda: self.on_sim(c))
             return sim
         elif isinstance(c, MyOWLIndividual):
             c.similarity(self)
@@ -1285,6 +1748,8 @@ class OWLConcept(MyOWLLogicalEntity):
 
 
 class MyOWLIndividual(MyOWLLogicalEntity):
+    __slots__ = ('ind',)
+
     def __init__(self, a: rdflib.URIRef, onto: MyOWLOntology):
         self.o = onto
         self.uri = a.n3()[1:-1]
@@ -1351,16 +1816,22 @@ class MyOWLIndividual(MyOWLLogicalEntity):
         if isinstance(c, MyOWLIndividual):
             if self == c:
                 return 1.0
-            sim = self.on_sim(c)
+            sim = self.o.get_similarity('individual', self.get_OWL_named_individual(), c.get_OWL_named_individual(),
+                                        lambda: self.on_sim(c))
             return sim
         if isinstance(c, OWLConcept):
-            tax_sim = self.taxonomic_similarity(c)
-            neigh_sim = 1
-            if tax_sim > 0:
-                neigh_sim = self.similarity_neighbors(c)
-            sim = tax_sim * neigh_sim
+            sim = self.o.get_similarity('individual_concept', self.get_OWL_named_individual(), c.get_OWL_class(),
+                                        lambda: self.__similarity_concept(c))
             return sim
 
+    def __similarity_concept(self, c: OWLConcept):
+        tax_sim = self.taxonomic_similarity(c)
+        neigh_sim = 1
+        if tax_sim > 0:
+            neigh_sim = self.similarity_neighbors(c)
+        sim = tax_sim * neigh_sim
+        return sim
+
 
 class BipartiteGraphMatching():
     def __init__(self):
@@ -1392,152 +1863,152 @@ class BipartiteGraphMatching():
 
 class HungarianAlgorithm():
     def __init__(self, cost_matrix: np.array):
-        self.dim = max(cost_matrix.shape[0], cost_matrix.shape[1])
-        self.rows = cost_matrix.shape[0]
-        self.cols = cost_matrix.shape[1]
-        self.cost_matrix = np.zeros((self.dim, self.dim))
-        for w in range(self.dim):
-            if w < cost_matrix.shape[0]:
-                # self.cost_matrix[w] = cost_matrix[:len(cost_matrix)-1]
-                self.cost_matrix[w, :cost_matrix.shape[1]] = cost_matrix[w]
-            else:
-                np.append(self.cost_matrix, np.zeros((1, self.dim)), axis=0)
-        self.label_by_worker = np.zeros(self.dim)
-        self.label_by_job = np.zeros(self.dim)
-        self.min_slack_worker_by_job = np.zeros(self.dim, dtype=np.int32)
-        self.min_slack_value_by_job = np.zeros(self.dim)
-        self.committed_workers = np.zeros(self.dim, dtype=np.bool8)
-        self.parent_worker_by_committed_job = np.zeros(self.dim, dtype=np.int32)
-        self.match_job_by_worker = np.zeros(self.dim, dtype=np.int32)
-        self.match_job_by_worker[:] = -1
-        self.match_worker_by_job = np.zeros(self.dim, dtype=np.int32)
-        self.match_worker_by_job[:] = -1
-    
-    def compute_initial_feasible_solution(self):
-        for j in range(self.dim):
-            self.label_by_job[j] = np.Infinity
-        for w in range(self.dim):
-            for j in range(self.dim):
-                if self.cost_matrix[w, j] < self.label_by_job[j]:
-                    self.label_by_job[j] = self.cost_matrix[w, j]
-    
+        """
+        Minimum cost assignment of the rows of a rectangular matrix to its columns
+        Shortest augmenting paths in the Jonker-Volgenant manner, each step is a NumPy operation over a whole
+        row, the matrix is neither copied element by element nor padded to a square.
+        :param cost_matrix: rows x cols costs
+
+        :return: None
+        """
+        self.cost_matrix = np.asarray(cost_matrix, dtype=np.float64)
+        self.rows = self.cost_matrix.shape[0]
+        self.cols = self.cost_matrix.shape[1]
+
     def execute(self) -> np.array:
-        self.reduce()
-        self.compute_initial_feasible_solution()
-        self.greedy_match()
-
-        w = self.fetch_unmatched_worker()
-        while w < self.dim:
-            self.initialize_phase(w)
-            self.execute_phase()
-            w = self.fetch_unmatched_worker()
-        result = self.match_job_by_worker[:self.rows]
-        for w in range(len(result)):
-            if result[w] >= self.cols:
-                result[w] = -1
-        
-        return result
-    
-    def execute_phase(self):
-        while True:
-            min_slack_worker, min_slack_job = -1, -1
-            min_slack_value = np.Infinity
-            for j in range(self.dim):
-                if self.parent_worker_by_committed_job[j] == -1:
-                    if self.min_slack_value_by_job[j] < min_slack_value:
-                        min_slack_value = self.min_slack_value_by_job[j]
-                        min_slack_worker = self.min_slack_worker_by_job[j]
-                        min_slack_job = j
-            if min_slack_value > 0:
-                self.update_labeling(min_slack_value)
-            self.parent_worker_by_committed_job[min_slack_job] = min_slack_worker
-            if self.match_worker_by_job[min_slack_job] == -1:
-                committed_job = min_slack_job
-                parent_worker = self.parent_worker_by_committed_job[committed_job]
-                while True:
-                    temp = self.match_job_by_worker[parent_worker]
-                    self.match(parent_worker, committed_job)
-                    committed_job = temp
-                    if committed_job == -1:
-                        break
-                    parent_worker = self.parent_worker_by_committed_job[committed_job]
-                return
-            else:
-                worker = self.match_worker_by_job[min_slack_job]
-                self.committed_workers[worker] = True
-                for j in range(self.dim):
-                    if self.parent_worker_by_committed_job[j] == -1:
-                        slack = self.cost_matrix[worker, j] - self.label_by_worker[worker] - self.label_by_job[j]
-                        if self.min_slack_value_by_job[j] > slack:
-                            self.min_slack_value_by_job[j] = slack
-                            self.min_slack_worker_by_job[j] = worker
-    
-    def fetch_unmatched_worker(self):
-        for w in range(self.dim):
-            if self.match_job_by_worker[w] == -1:
-                break
-            w += 1
-        
-        return w
-    
-    def greedy_match(self):
-        for w in range(self.dim):
-            for j in range(self.dim):
-                if self.match_job_by_worker[w] == -1 and self.match_worker_by_job[j] == -1 \
-                    and self.cost_matrix[w, j] - self.label_by_worker[w] - self.label_by_job[j] == 0:
-                    self.match(w, j)
-    
-    def initialize_phase(self, w: np.int32):
-        self.committed_workers[:] = False
-        self.parent_worker_by_committed_job[:] = -1
-        self.committed_workers[w] = True
-        for j in range(self.dim):
-            self.min_slack_value_by_job[j] = self.cost_matrix[w, j] - self.label_by_worker[w] \
-                                                - self.label_by_job[j]
-            self.min_slack_worker_by_job[j] = w
-    
-    def match(self, w: np.int32, j: np.int32):
-        self.match_job_by_worker[w] = j
-        self.match_worker_by_job[j] = w
-    
-    def reduce(self):
-        for w in range(self.dim):
-            mi = np.Infinity
-            for j in range(self.dim):
-                if self.cost_matrix[w, j] < mi:
-                    mi = self.cost_matrix[w, j]
-            for j in range(self.dim):
-                self.cost_matrix[w, j] -= mi
-        mi = np.zeros(self.dim)
-        for j in range(self.dim):
-            mi[j] = np.Infinity
-        for w in range(self.dim):
-            for j in range(self.dim):
-                if self.cost_matrix[w, j] < mi[j]:
-                    mi[j] = self.cost_matrix[w, j]
-        for w in range(self.dim):
-            for j in range(self.dim):
-                self.cost_matrix[w, j] -= mi[j]
-    
-    def update_labeling(self, slack):
-        for w in range(self.dim):
-            if self.committed_workers[w]:
-                self.label_by_worker[w] += slack
-        for j in range(self.dim):
-            if self.parent_worker_by_committed_job[j] != -1:
-                self.label_by_job[j] -= slack
-            else:
-                self.min_slack_value_by_job[j] -= slack
+        """
+        :return: column assigned to each row, -1 for the rows left over when there are more rows than columns
+        """
+        # the shorter side is assigned completely, columns are the longer one
+        cost = self.cost_matrix.T if self.rows > self.cols else self.cost_matrix
+        n, m = cost.shape
+        label_by_row = np.zeros(n)
+        label_by_col = np.zeros(m)
+        col_by_row = np.full(n, -1, dtype=np.int32)
+        row_by_col = np.full(m, -1, dtype=np.int32)
+        for cur_row in range(n):
+            shortest = np.full(m, np.inf)
+            path = np.full(m, -1, dtype=np.int32)
+            visited_rows = np.zeros(n, dtype=bool)
+            visited_cols = np.zeros(m, dtype=bool)
+            i, min_value, sink = cur_row, 0.0, -1
+            while sink == -1:
+                visited_rows[i] = True
+                reduced = min_value + cost[i] - label_by_row[i] - label_by_col
+                closer = ~visited_cols & (reduced < shortest)
+                path[closer] = i
+                shortest[closer] = reduced[closer]
+                candidates = np.where(visited_cols, np.inf, shortest)
+                min_value = candidates.min()
+                # among the closest columns a free one ends the path at once
+                ties = np.flatnonzero(candidates == min_value)
+                free = ties[row_by_col[ties] == -1]
+                j = int(free[0]) if len(free) > 0 else int(ties[0])
+                visited_cols[j] = True
+                if row_by_col[j] == -1:
+                    sink = j
+                else:
+                    i = row_by_col[j]
+
+            label_by_row[cur_row] += min_value
+            others = visited_rows.copy()
+            others[cur_row] = False
+            label_by_row[others] += min_value - shortest[col_by_row[others]]
+            label_by_col[visited_cols] -= min_value - shortest[visited_cols]
+            j = sink
+            while True:
+                i = path[j]
+                row_by_col[j] = i
+                col_by_row[i], j = j, col_by_row[i]
+                if i == cur_row:
+                    break
+
+        if self.rows > self.cols:
+            result = np.full(self.rows, -1, dtype=np.int32)
+            result[col_by_row] = np.arange(self.cols, dtype=np.int32)
+            return result
+
+        return col_by_row
+
+    @staticmethod
+    def execute_batch(cost_matrices: np.array) -> np.array:
+        """
+        Assignments of a stack of equally shaped matrices, every step runs on the whole stack at once
+        Problems whose augmenting path is already found wait for the others while the rest advance.
+        :param cost_matrices: batch x rows x cols costs
+
+        :return: batch x rows, column assigned to each row as in execute
+        """
+        costs = np.asarray(cost_matrices, dtype=np.float64)
+        batch, rows, cols = costs.shape
+        # the shorter side is assigned completely, columns are the longer one
+        if rows > cols:
+            costs = costs.transpose(0, 2, 1)
+        n, m = costs.shape[1:]
+        label_by_row = np.zeros((batch, n))
+        label_by_col = np.zeros((batch, m))
+        col_by_row = np.full((batch, n), -1, dtype=np.int32)
+        row_by_col = np.full((batch, m), -1, dtype=np.int32)
+        for cur_row in range(n):
+            shortest = np.full((batch, m), np.inf)
+            path = np.full((batch, m), -1, dtype=np.int32)
+            visited_rows = np.zeros((batch, n), dtype=bool)
+            visited_cols = np.zeros((batch, m), dtype=bool)
+            i = np.full(batch, cur_row)
+            min_value = np.zeros(batch)
+            sink = np.full(batch, -1)
+            active = np.arange(batch)
+            while len(active) > 0:
+                ia = i[active]
+                visited_rows[active, ia] = True
+                reduced = min_value[active, None] + costs[active, ia] - label_by_row[active, ia][:, None] \
+                    - label_by_col[active]
+                closer = ~visited_cols[active] & (reduced < shortest[active])
+                path[active] = np.where(closer, ia[:, None], path[active])
+                shortest[active] = np.where(closer, reduced, shortest[active])
+                candidates = np.where(visited_cols[active], np.inf, shortest[active])
+                min_value[active] = candidates.min(axis=1)
+                # among the closest columns a free one ends the path at once
+                ties = candidates == min_value[active, None]
+                free = ties & (row_by_col[active] == -1)
+                j = np.where(free.any(axis=1), free.argmax(axis=1), ties.argmax(axis=1))
+                visited_cols[active, j] = True
+                matched_row = row_by_col[active, j]
+                done = matched_row == -1
+                sink[active[done]] = j[done]
+                i[active[~done]] = matched_row[~done]
+                active = active[~done]
+
+            label_by_row[:, cur_row] += min_value
+            others = visited_rows
+            others[:, cur_row] = False
+            on_path = np.take_along_axis(shortest, np.maximum(col_by_row, 0), axis=1)
+            label_by_row[others] += (min_value[:, None] - on_path)[others]
+            label_by_col[visited_cols] -= (min_value[:, None] - shortest)[visited_cols]
+            j = sink
+            active = np.arange(batch)
+            while len(active) > 0:
+                i = path[active, j[active]]
+                row_by_col[active, j[active]] = i
+                j[active], col_by_row[active, i] = col_by_row[active, i], j[active]
+                active = active[i != cur_row]
+
+        if rows > cols:
+            result = np.full((batch, rows), -1, dtype=np.int32)
+            np.put_along_axis(result, col_by_row, np.arange(cols, dtype=np.int32)[None], axis=1)
+            return result
+
+        return col_by_row
 
 
 class AnnotationComparison():
+    __slots__ = ('concept_A', 'concept_B', 'hash')
+
     def __init__(self, a, b):
         self.concept_A = a
         self.concept_B = b
-        if str(self.concept_A) < str(self.concept_B):
-            self.hash = hash(self.concept_A) ^ hash(self.concept_B)
-        else:
-            self.hash = hash(self.concept_B) ^ hash(self.concept_A)
+        # xor is symmetric, (a, b) and (b, a) hash alike without ordering them first
+        self.hash = hash(a) ^ hash(b)
     
     def __hash__(self) -> int:
         return self.hash
@@ -0,0 +1,970 @@
+from __future__ import annotations
+from array import array
+from collections import deque, OrderedDict
+import hashlib
+import heapq
+import os
+import shutil
+import numpy as np
+from rdflib import BNode, URIRef
+
+
+class EntityTable():
+    UNKNOWN = 0
+    CONCEPT = 1
+    RELATION = 2
+    INDIVIDUAL = 3
+
+    def __init__(self):
+        """
+        Interned entities of an ontology, every URI gets a dense integer id and a kind tag
+        An entity keeps the first kind it is registered with, so concepts have to be added before
+        relations and individuals, matching the order in which MyOWLOntology used to test them.
+
+        :return: None
+        """
+        self.uris = []  # id: URIRef
+        self.ids = {}  # URIRef: id
+        self.kinds = array('b')  # id: kind
+
+    def add(self, uri, kind: int) -> int:
+        i = self.ids.get(uri)
+        if i is None:
+            i = len(self.uris)
+            self.ids[uri] = i
+            self.uris.append(uri)
+            self.kinds.append(kind)
+        return i
+
+    def update(self, uris, kind: int):
+        for uri in uris:
+            self.add(uri, kind)
+
+    def __contains__(self, uri) -> bool:
+        return uri in self.ids
+
+    def __len__(self) -> int:
+        return len(self.uris)
+
+    def get_id(self, uri) -> int:
+        return self.ids.get(uri, -1)
+
+    def get_uri(self, i: int):
+        return self.uris[i]
+
+    def get_kind(self, uri) -> int:
+        i = self.ids.get(uri)
+        if i is None:
+            return EntityTable.UNKNOWN
+        return self.kinds[i]
+
+    def is_concept(self, uri) -> bool:
+        return self.get_kind(uri) == EntityTable.CONCEPT
+
+    def is_relation(self, uri) -> bool:
+        return self.get_kind(uri) == EntityTable.RELATION
+
+    def is_individual(self, uri) -> bool:
+        return self.get_kind(uri) == EntityTable.INDIVIDUAL
+
+
+class UriSet():
+    def __init__(self, uris=()):
+        """
+        Read-only set of URIs packed in one sorted bytes buffer, membership is a binary search
+        It costs the length of the URIs plus 8 bytes each, instead of a Python object per entity.
+        :param uris: URIRef or uri strings
+
+        :return: None
+        """
+        encoded = sorted(set(str(u).encode('utf-8') for u in uris))
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum(np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded)), out=offsets[1:])
+        self.offsets = array('q', offsets.tobytes())
+        self.data = b''.join(encoded)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        return self.data[self.offsets[i]:self.offsets[i + 1]].decode('utf-8')
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __contains__(self, uri) -> bool:
+        key = str(uri).encode('utf-8')
+        data, offsets = self.data, self.offsets
+        lo, hi = 0, len(offsets) - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if data[offsets[mid]:offsets[mid + 1]] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo < len(offsets) - 1 and data[offsets[lo]:offsets[lo + 1]] == key
+
+
+class SimilarityMatrix():
+    def __init__(self, terms: list):
+        """
+        Dense symmetric matrix of precomputed similarities between interned terms, unknown pairs are nan
+        A group of terms reads its similarities to another group with one fancy-indexing gather.
+        :param terms: hashable terms, e.g. OWLConcept, in the order of their ids
+
+        :return: None
+        """
+        self.terms = list(dict.fromkeys(terms))
+        self.ids = {t: i for i, t in enumerate(self.terms)}  # term: id
+        self.values = np.full((len(self.terms), len(self.terms)), np.nan)
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    def get_ids(self, terms: list) -> np.ndarray:
+        """
+        :return: id of each term, -1 for terms outside the matrix
+        """
+        return np.fromiter((self.ids.get(t, -1) for t in terms), dtype=np.int64, count=len(terms))
+
+    def set(self, i: int, j: int, sim: float):
+        self.values[i, j] = sim
+        self.values[j, i] = sim
+
+    def get(self, a, b) -> float:
+        i, j = self.ids.get(a, -1), self.ids.get(b, -1)
+        if i < 0 or j < 0:
+            return np.nan
+        return float(self.values[i, j])
+
+    def get_block(self, a: list, b: list) -> np.ndarray:
+        """
+        :return: len(a) x len(b) similarities
+        """
+        ids_a, ids_b = self.get_ids(a), self.get_ids(b)
+        block = self.values[np.ix_(np.maximum(ids_a, 0), np.maximum(ids_b, 0))]
+        if ids_a.min(initial=0) < 0 or ids_b.min(initial=0) < 0:
+            block[ids_a < 0, :] = np.nan
+            block[:, ids_b < 0] = np.nan
+        return block
+
+
+class SimilarityCache():
+    ENTRY_BYTES = 256  # measured size of one cached pair: key tuple, float and OrderedDict slot
+    TERM_BYTES = 240  # measured size of one interned term: three dict slots, its id and the tuple of a link term
+
+    def __init__(self, max_bytes: int=64 << 20):
+        """
+        Symmetric memo of similarities split by kind, least recently used pairs are evicted past a memory cap
+        Both terms of a pair are interned and the key holds the smaller id first, (a, b) and (b, a) share an entry.
+        A term is forgotten with the last pair holding it, and interned terms count towards the cap.
+        :param max_bytes: estimated memory the cached pairs and their terms may take, 0 disables the cache
+
+        :return: None
+        """
+        self.max_bytes = max_bytes
+        self.ids = {}  # term: id
+        self.terms = {}  # id: term
+        self.refs = {}  # id: number of cached pairs holding the term
+        self.next_id = 0
+        self.cache = OrderedDict()  # (kind, smaller id, larger id): similarity
+        self.hits = {}  # kind: number of lookups answered from the cache
+        self.misses = {}  # kind: number of lookups that had to compute
+        self.evictions = {}  # kind: number of pairs dropped to stay under the cap or after a change
+
+    def __len__(self) -> int:
+        return len(self.cache)
+
+    def __intern(self, t) -> int:
+        i = self.ids.get(t)
+        if i is None:
+            i = self.next_id
+            self.next_id += 1
+            self.ids[t] = i
+            self.terms[i] = t
+            self.refs[i] = 0
+        return i
+
+    def __release(self, i: int):
+        self.refs[i] -= 1
+        if self.refs[i] == 0:
+            del self.ids[self.terms.pop(i)]
+            del self.refs[i]
+
+    def __drop(self, key: tuple):
+        kind, i, j = key
+        self.__release(i)
+        self.__release(j)
+        self.evictions[kind] = self.evictions.get(kind, 0) + 1
+
+    def get_bytes(self) -> int:
+        # estimated size of the cached pairs and of the terms they hold
+        return len(self.cache) * SimilarityCache.ENTRY_BYTES + len(self.ids) * SimilarityCache.TERM_BYTES
+
+    def get(self, kind: str, a, b):
+        """
+        :return: cached similarity of a and b, None when it has to be computed
+        """
+        i, j = self.ids.get(a), self.ids.get(b)
+        sim = None
+        if i is not None and j is not None:
+            key = (kind, i, j) if i <= j else (kind, j, i)
+            sim = self.cache.get(key)
+        if sim is None:
+            self.misses[kind] = self.misses.get(kind, 0) + 1
+        else:
+            self.hits[kind] = self.hits.get(kind, 0) + 1
+            self.cache.move_to_end(key)
+        return sim
+
+    def put(self, kind: str, a, b, sim: float):
+        if self.max_bytes <= 0:
+            return
+        i, j = self.__intern(a), self.__intern(b)
+        key = (kind, i, j) if i <= j else (kind, j, i)
+        if key not in self.cache:
+            self.refs[i] += 1
+            self.refs[j] += 1
+        self.cache[key] = sim
+        self.cache.move_to_end(key)
+        while len(self.cache) > 0 and self.get_bytes() > self.max_bytes:
+            evicted, _ = self.cache.popitem(last=False)
+            self.__drop(evicted)
+
+    def evict(self, stale, kinds: list=None) -> int:
+        """
+        Drop the pairs involving stale terms, e.g. after an ontology change
+        :param stale: function telling whether a term is stale, it is called once per interned term
+        :param kinds: only pairs of these kinds, every kind when None
+
+        :return: number of pairs dropped
+        """
+        stale_ids = set(i for t, i in self.ids.items() if stale(t))
+        keys = [k for k in self.cache if (kinds is None or k[0] in kinds) and (k[1] in stale_ids or k[2] in stale_ids)]
+        for k in keys:
+            del self.cache[k]
+            self.__drop(k)
+        return len(keys)
+
+    def clear(self):
+        # the counters are kept, they describe the whole workload
+        self.cache.clear()
+        self.ids.clear()
+        self.terms.clear()
+        self.refs.clear()
+
+    def get_stats(self) -> dict:
+        """
+        :return: kind: {'hits', 'misses', 'evictions', 'entries'}, plus 'terms', the number of interned terms,
+        and 'bytes', the estimated size of the entries and terms
+        """
+        entries = {}
+        for kind, _, _ in self.cache:
+            entries[kind] = entries.get(kind, 0) + 1
+        kinds = set(self.hits) | set(self.misses) | set(self.evictions) | set(entries)
+        stats = {kind: {'hits': self.hits.get(kind, 0), 'misses': self.misses.get(kind, 0),
+                        'evictions': self.evictions.get(kind, 0), 'entries': entries.get(kind, 0)}
+                 for kind in sorted(kinds)}
+        stats['terms'] = len(self.ids)
+        stats['bytes'] = self.get_bytes()
+        return stats
+
+
+class HierarchyIndex():
+    def __init__(self, nodes: list, edges: list, top=None):
+        """
+        Transitive closure of a subsumption hierarchy, stored as integer-id arrays
+        :param nodes: entities of the hierarchy, e.g. rdflib.URIRef of every class
+        :param edges: (sub, super) pairs between named entities
+        :param top: optional root subsuming every other node, e.g. OWL.Thing
+
+        :return: None
+        """
+        self.nodes = []  # id: entity
+        self.ids = {}  # entity: id
+        for n in nodes:
+            self.add_node(n)
+        if top is not None:
+            self.add_node(top)
+        self.top = self.ids.get(top, -1)
+
+        pairs = [(self.add_node(s), self.add_node(o)) for s, o in edges]
+        parents = [set() for _ in self.nodes]
+        for s_id, o_id in pairs:
+            if s_id != o_id:
+                parents[s_id].add(o_id)
+
+        self.parent_ptr, self.parent_idx, _ = self.__pack([dict.fromkeys(p, 1) for p in parents])
+        order, cyclic = self.__topological_order(parents)
+        self.min_depth, self.max_depth, self.depth = self.__depths(parents, order, cyclic)
+        self.ancestor_ptr, self.ancestor_idx, self.ancestor_dist = self.__pack(self.__closure(parents, order, cyclic))
+
+    ARRAYS = ('parent_ptr', 'parent_idx', 'min_depth', 'max_depth', 'depth',
+              'ancestor_ptr', 'ancestor_idx', 'ancestor_dist')
+
+    def get_arrays(self) -> dict:
+        return {name: getattr(self, name) for name in HierarchyIndex.ARRAYS}
+
+    @staticmethod
+    def from_arrays(nodes: list, top: int, arrays: dict) -> HierarchyIndex:
+        """
+        Rebuild an index from the output of get_arrays, e.g. memory-mapped arrays of a Snapshot
+        """
+        h = HierarchyIndex.__new__(HierarchyIndex)
+        h.nodes = list(nodes)
+        h.ids = {n: i for i, n in enumerate(h.nodes)}
+        h.top = top
+        for name in HierarchyIndex.ARRAYS:
+            setattr(h, name, arrays[name])
+        return h
+
+    def add_node(self, n) -> int:
+        i = self.ids.get(n)
+        if i is None:
+            i = len(self.nodes)
+            self.ids[n] = i
+            self.nodes.append(n)
+        return i
+
+    def __contains__(self, n) -> bool:
+        return n in self.ids
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def get_id(self, n) -> int:
+        return self.ids.get(n, -1)
+
+    @staticmethod
+    def __pack(dicts: list):
+        # CSR layout: ids sorted per row, values in a parallel array
+        ptr = np.zeros(len(dicts) + 1, dtype=np.int64)
+        ptr[1:] = np.cumsum([len(d) for d in dicts])
+        idx = np.zeros(ptr[-1], dtype=np.int32)
+        val = np.zeros(ptr[-1], dtype=np.int32)
+        for i, d in enumerate(dicts):
+            keys = sorted(d)
+            idx[ptr[i]:ptr[i + 1]] = keys
+            val[ptr[i]:ptr[i + 1]] = [d[k] for k in keys]
+        return ptr, idx, val
+
+    @staticmethod
+    def __topological_order(parents: list):
+        # Kahn's order from the roots down, every parent comes before its children
+        children = [[] for _ in parents]
+        pending = [len(p) for p in parents]
+        for i, ps in enumerate(parents):
+            for p in ps:
+                children[p].append(i)
+        order = []
+        queue = deque(i for i, n in enumerate(pending) if n == 0)
+        while queue:
+            i = queue.popleft()
+            order.append(i)
+            for c in children[i]:
+                pending[c] -= 1
+                if pending[c] == 0:
+                    queue.append(c)
+        # members of subClassOf cycles, and everything below them, are never released
+        cyclic = [i for i, n in enumerate(pending) if n > 0]
+
+        return order, cyclic
+
+    def __closure(self, parents: list, order: list, cyclic: list, only: set=None,
+                  previous: HierarchyIndex=None) -> list:
+        """
+        Minimum distance from every node to each of its ancestors
+        Along the topological order a node extends its parents' tables by one step. Nodes on cycles
+        run their own breadth first search, each ancestor entering the frontier only once.
+        When only is given, the other nodes are left as None and their tables are read from previous.
+        """
+        ancestors = [None] * len(parents)
+        if only is not None:
+            order = [i for i in order if i in only]
+            cyclic = [i for i in cyclic if i in only]
+        for i in order:
+            anc = dict.fromkeys(parents[i], 1)
+            for p in parents[i]:
+                if ancestors[p] is None:
+                    lo, hi = previous.ancestor_ptr[p], previous.ancestor_ptr[p + 1]
+                    ancestors[p] = dict(zip(previous.ancestor_idx[lo:hi].tolist(),
+                                            previous.ancestor_dist[lo:hi].tolist()))
+                for a, d in ancestors[p].items():
+                    if anc.get(a, d + 1) >= d + 1:
+                        anc[a] = d + 1
+            ancestors[i] = anc
+        for i in cyclic:
+            anc = {}
+            frontier, d = list(parents[i]), 1
+            while frontier:
+                step = []
+                for p in frontier:
+                    if p not in anc and p != i:
+                        anc[p] = d
+                        step.extend(parents[p])
+                frontier, d = step, d + 1
+            ancestors[i] = anc
+
+        if self.top >= 0:
+            # the distance to the top is the node depth, as in MyOWLOntology.dist(c, top)
+            for i in (order + cyclic if only is not None else range(len(ancestors))):
+                if i != self.top:
+                    ancestors[i][self.top] = int(self.depth[i])
+        return ancestors
+
+    def __depths(self, parents: list, order: list, cyclic: list):
+        """
+        Shortest and longest path of every node up to the top, in one sweep over the topological order
+        Nodes without parents hang from the top. depth reproduces the breadth first search of
+        MyOWLOntology.dist(c, top): the shortest distance when the top is reachable through explicit
+        edges, the longest path otherwise. Below the nodes of the order, shortest paths are relaxed
+        through the cyclic nodes and every subClassOf cycle shares one longest path, so depths do not
+        depend on node ids.
+        """
+        n = len(parents)
+        unreachable = n + 1
+        root_depth = 1 if self.top >= 0 else 0
+        min_depth, max_depth, top_depth = [-1] * n, [-1] * n, [unreachable] * n
+        for i in order:
+            if i == self.top:
+                min_depth[i] = max_depth[i] = top_depth[i] = 0
+                continue
+            ps = [p for p in parents[i] if max_depth[p] >= 0]
+            if len(ps) == 0:
+                min_depth[i] = max_depth[i] = root_depth
+                continue
+            min_depth[i] = 1 + min(min_depth[p] for p in ps)
+            max_depth[i] = 1 + max(max_depth[p] for p in ps)
+            top_depth[i] = min(unreachable, 1 + min(top_depth[p] for p in ps))
+        if len(cyclic) > 0:
+            HierarchyIndex.__cyclic_depths(parents, cyclic, root_depth, unreachable, min_depth, max_depth, top_depth)
+        depth = [t if t != unreachable else m for t, m in zip(top_depth, max_depth)]
+
+        return np.array(min_depth, dtype=np.int32), np.array(max_depth, dtype=np.int32), \
+            np.array(depth, dtype=np.int32)
+
+    @staticmethod
+    def __cyclic_depths(parents: list, cyclic: list, root_depth: int, unreachable: int,
+                        min_depth: list, max_depth: list, top_depth: list):
+        # shortest paths: breadth first relaxation downwards, seeded by the parents already swept
+        members = set(cyclic)
+        children = {i: [] for i in cyclic}
+        for i in cyclic:
+            for p in parents[i]:
+                if p in members:
+                    children[p].append(i)
+        for depths, default in ((min_depth, root_depth), (top_depth, unreachable)):
+            best = {i: min([depths[p] + 1 for p in parents[i] if p not in members], default=default)
+                    for i in cyclic}
+            queue = [(d, i) for i, d in best.items()]
+            heapq.heapify(queue)
+            while queue:
+                d, i = heapq.heappop(queue)
+                if d > best[i]:
+                    continue
+                for c in children[i]:
+                    if d + 1 < best[c]:
+                        best[c] = d + 1
+                        heapq.heappush(queue, (d + 1, c))
+            for i, d in best.items():
+                depths[i] = min(d, unreachable)
+
+        # longest paths: over the condensation, every member of a component gets the same depth
+        for component in HierarchyIndex.__components(parents, cyclic, members):
+            inside = set(component)
+            outside = [max_depth[p] for i in component for p in parents[i] if p not in inside]
+            d = 1 + max(outside) if len(outside) > 0 else root_depth
+            for i in component:
+                max_depth[i] = d
+
+    @staticmethod
+    def __components(parents: list, nodes: list, members: set) -> list:
+        """
+        Strongly connected components of the parent graph restricted to members, parents first
+        Iterative Tarjan; components come out after every component they point to, i.e. after
+        their ancestors.
+        """
+        index, low, on_stack = {}, {}, set()
+        stack, components = [], []
+        for root in nodes:
+            if root in index:
+                continue
+            work = [(root, iter(sorted(p for p in parents[root] if p in members)))]
+            index[root] = low[root] = len(index)
+            stack.append(root)
+            on_stack.add(root)
+            while work:
+                i, it = work[-1]
+                p = next(it, None)
+                if p is not None:
+                    if p not in index:
+                        index[p] = low[p] = len(index)
+                        stack.append(p)
+                        on_stack.add(p)
+                        work.append((p, iter(sorted(q for q in parents[p] if q in members))))
+                    elif p in on_stack:
+                        low[i] = min(low[i], index[p])
+                    continue
+                work.pop()
+                if len(work) > 0:
+                    low[work[-1][0]] = min(low[work[-1][0]], low[i])
+                if low[i] == index[i]:
+                    component = []
+                    while True:
+                        j = stack.pop()
+                        on_stack.discard(j)
+                        component.append(j)
+                        if j == i:
+                            break
+                    components.append(component)
+
+        return components
+
+    def update(self, nodes: list, added: list, removed: list):
+        """
+        Index of the hierarchy after adding nodes and (sub, super) edges and removing edges
+        Ids of existing nodes are kept and new nodes are appended. Depths are swept again, which is cheap,
+        but only the nodes below a changed edge get a new ancestor table; the others are copied. This
+        index is left untouched.
+        :param nodes: entities to add, existing ones are ignored
+        :param added: (sub, super) pairs
+        :param removed: (sub, super) pairs
+
+        :return: (HierarchyIndex, ids whose ancestors or depth may have changed)
+        """
+        h = HierarchyIndex.__new__(HierarchyIndex)
+        h.nodes, h.ids, h.top = list(self.nodes), dict(self.ids), self.top
+        n_old = len(self.nodes)
+        ptr, idx = self.parent_ptr.tolist(), self.parent_idx.tolist()
+        parents = [set(idx[ptr[i]:ptr[i + 1]]) for i in range(n_old)]
+        changed = set()
+        for s, o in removed:
+            i, j = h.ids.get(s), h.ids.get(o)
+            if i is not None and j is not None and j in parents[i]:
+                parents[i].discard(j)
+                changed.add(i)
+        for n in nodes:
+            h.add_node(n)
+        for s, o in added:
+            i, j = h.add_node(s), h.add_node(o)
+            parents.extend(set() for _ in range(len(h.nodes) - len(parents)))
+            if i != j and j not in parents[i]:
+                parents[i].add(j)
+                changed.add(i)
+        parents.extend(set() for _ in range(len(h.nodes) - len(parents)))
+        changed.update(range(n_old, len(h.nodes)))
+
+        children = [[] for _ in parents]
+        for i, ps in enumerate(parents):
+            for p in ps:
+                children[p].append(i)
+        affected = set(changed)
+        stack = list(changed)
+        while stack:
+            for c in children[stack.pop()]:
+                if c not in affected:
+                    affected.add(c)
+                    stack.append(c)
+
+        h.parent_ptr, h.parent_idx, _ = h.__pack([dict.fromkeys(p, 1) for p in parents])
+        order, cyclic = h.__topological_order(parents)
+        h.min_depth, h.max_depth, h.depth = h.__depths(parents, order, cyclic)
+        ancestors = h.__closure(parents, order, cyclic, affected, self)
+
+        ptr, idx, dist = self.ancestor_ptr, self.ancestor_idx, self.ancestor_dist
+        sizes = [len(ancestors[i]) if i in affected else int(ptr[i + 1] - ptr[i]) for i in range(len(h.nodes))]
+        h.ancestor_ptr = np.zeros(len(h.nodes) + 1, dtype=np.int64)
+        h.ancestor_ptr[1:] = np.cumsum(sizes)
+        h.ancestor_idx = np.zeros(h.ancestor_ptr[-1], dtype=np.int32)
+        h.ancestor_dist = np.zeros(h.ancestor_ptr[-1], dtype=np.int32)
+        for i in range(len(h.nodes)):
+            lo, hi = h.ancestor_ptr[i], h.ancestor_ptr[i + 1]
+            if i in affected:
+                keys = sorted(ancestors[i])
+                h.ancestor_idx[lo:hi] = keys
+                h.ancestor_dist[lo:hi] = [ancestors[i][k] for k in keys]
+            else:
+                h.ancestor_idx[lo:hi] = idx[ptr[i]:ptr[i + 1]]
+                h.ancestor_dist[lo:hi] = dist[ptr[i]:ptr[i + 1]]
+
+        return h, np.array(sorted(affected), dtype=np.int32)
+
+    def get_descendant_ids(self, ids) -> np.ndarray:
+        """
+        Ids subsumed by any of ids, the ids themselves included
+        """
+        ids = np.asarray(ids, dtype=np.int32)
+        rows = np.repeat(np.arange(len(self.nodes), dtype=np.int32), np.diff(self.ancestor_ptr))
+        return np.union1d(ids, rows[np.isin(self.ancestor_idx, ids)])
+
+    def get_depth(self, n) -> int:
+        i = self.ids.get(n)
+        if i is None:
+            return -1
+        return int(self.depth[i])
+
+    def parent_ids(self, i: int) -> np.ndarray:
+        return self.parent_idx[self.parent_ptr[i]:self.parent_ptr[i + 1]]
+
+    def ancestor_ids(self, i: int) -> np.ndarray:
+        return self.ancestor_idx[self.ancestor_ptr[i]:self.ancestor_ptr[i + 1]]
+
+    def ancestor_distances(self, i: int) -> np.ndarray:
+        return self.ancestor_dist[self.ancestor_ptr[i]:self.ancestor_ptr[i + 1]]
+
+    def distance(self, i: int, j: int) -> int:
+        """
+        Minimum number of edges from i up to j, both given as ids, or -1 when j does not subsume i
+        """
+        if i == j:
+            return 0
+        lo, hi = self.ancestor_ptr[i], self.ancestor_ptr[i + 1]
+        k = lo + np.searchsorted(self.ancestor_idx[lo:hi], j)
+        if k < hi and self.ancestor_idx[k] == j:
+            return int(self.ancestor_dist[k])
+        return -1
+
+    def get_distance(self, sub, sup) -> int:
+        i, j = self.ids.get(sub), self.ids.get(sup)
+        if i is None or j is None:
+            return -1
+        return self.distance(i, j)
+
+    def get_parents(self, n) -> list:
+        i = self.ids.get(n)
+        if i is None:
+            return []
+        return [self.nodes[p] for p in self.parent_ids(i).tolist()]
+
+    def get_ancestors(self, n, include_top=True) -> list:
+        i = self.ids.get(n)
+        if i is None:
+            return []
+        return [self.nodes[a] for a in self.ancestor_ids(i).tolist() if include_top or a != self.top]
+
+    def is_ancestor(self, a: int, b: int) -> bool:
+        """
+        Check whether b strictly subsumes a, both given as ids
+        """
+        anc = self.ancestor_ids(a)
+        k = np.searchsorted(anc, b)
+        return k < len(anc) and anc[k] == b
+
+    def subsumes(self, sup, sub) -> bool:
+        i, j = self.ids.get(sub), self.ids.get(sup)
+        if i is None or j is None:
+            return False
+        return i == j or self.is_ancestor(i, j)
+
+
+class ReachabilityIndex():
+    def __init__(self, edges: list):
+        """
+        Nodes reachable through one or more directed edges, memoized per strongly connected component
+        :param edges: (source, target) pairs
+
+        :return: None
+        """
+        self.successors = {}  # node: list of nodes
+        for s, o in edges:
+            self.successors.setdefault(s, {})[o] = None
+        self.successors = {s: list(os) for s, os in self.successors.items()}
+        self.reach = {}  # node: frozenset of reachable nodes, shared by every member of a component
+
+    def __len__(self) -> int:
+        return len(self.successors)
+
+    def update(self, successors: dict) -> set:
+        """
+        Replace the outgoing edges of some nodes, forgetting only the memoized sets that can change
+        :param successors: node: iterable of targets, empty to remove every edge of the node
+
+        :return: nodes whose memoized set was dropped
+        """
+        changed = set(successors)
+        for n, targets in successors.items():
+            targets = list(dict.fromkeys(targets))
+            if targets:
+                self.successors[n] = targets
+            else:
+                self.successors.pop(n, None)
+        # a set can only change if its node reaches, or is, a node with new edges
+        dropped = set(n for n, r in self.reach.items() if n in changed or not changed.isdisjoint(r))
+        for n in dropped:
+            del self.reach[n]
+        return dropped
+
+    def get_reachable(self, n) -> frozenset:
+        r = self.reach.get(n)
+        if r is None:
+            self.__visit(n)
+            r = self.reach[n]
+        return r
+
+    def __visit(self, root):
+        # iterative Tarjan, components are closed in reverse topological order so their
+        # successors are always resolved first
+        succ, reach = self.successors, self.reach
+        index, low = {root: 0}, {root: 0}
+        stack, on_stack = [root], {root}
+        work = [(root, iter(succ.get(root, ())))]
+        while work:
+            v, it = work[-1]
+            for w in it:
+                if w in reach:
+                    continue
+                if w not in index:
+                    index[w] = low[w] = len(index)
+                    stack.append(w)
+                    on_stack.add(w)
+                    work.append((w, iter(succ.get(w, ()))))
+                    break
+                if w in on_stack:
+                    low[v] = min(low[v], index[w])
+            else:
+                work.pop()
+                if work:
+                    u = work[-1][0]
+                    low[u] = min(low[u], low[v])
+                if low[v] == index[v]:
+                    component = []
+                    while True:
+                        w = stack.pop()
+                        on_stack.discard(w)
+                        component.append(w)
+                        if w == v:
+                            break
+                    members = set(component)
+                    r = set()
+                    # a node only reaches itself through a cycle
+                    if len(component) > 1 or v in succ.get(v, ()):
+                        r.update(members)
+                    for m in component:
+                        for w in succ.get(m, ()):
+                            if w not in members:
+                                r.add(w)
+                                r.update(reach[w])
+                    r = frozenset(r)
+                    for m in component:
+                        reach[m] = r
+
+
+class LCSEngine():
+    def __init__(self, hierarchy: HierarchyIndex, cache_size: int=100000):
+        """
+        Least common subsumer queries on top of a HierarchyIndex
+        :param hierarchy: index providing the ancestor, distance and depth arrays
+        :param cache_size: maximum number of pairs kept in the LRU cache, 0 disables it
+
+        :return: None
+        """
+        self.h = hierarchy
+        self.cache_size = cache_size
+        self.cache = OrderedDict()  # (smaller id, larger id): (lcs id, distance from smaller, distance from larger)
+        # per pair queries touch a few dozen ancestors, plain arrays avoid the numpy call overhead
+        self.ptr = hierarchy.ancestor_ptr.tolist()
+        self.idx = array('i', hierarchy.ancestor_idx.astype(np.int32).tobytes())
+        self.dist = array('i', hierarchy.ancestor_dist.astype(np.int32).tobytes())
+        self.depth = array('i', hierarchy.depth.astype(np.int32).tobytes())
+
+    def update(self, hierarchy: HierarchyIndex, affected) -> LCSEngine:
+        """
+        Engine over an updated hierarchy, see HierarchyIndex.update
+        Cached pairs survive when neither side is affected, their ancestors and depths are unchanged.
+        """
+        engine = LCSEngine(hierarchy, self.cache_size)
+        affected = set(np.asarray(affected).tolist())
+        engine.cache = OrderedDict((k, v) for k, v in self.cache.items()
+                                   if k[0] not in affected and k[1] not in affected)
+        return engine
+
+    def __search(self, i: int, j: int):
+        ptr, idx, dist, depth = self.ptr, self.idx, self.dist, self.depth
+        anc = dict(zip(idx[ptr[i]:ptr[i + 1]], dist[ptr[i]:ptr[i + 1]]))
+        anc[i] = 0
+        best = None
+        if j in anc:
+            best = (-depth[j], anc[j], j, anc[j], 0)
+        for a, d in zip(idx[ptr[j]:ptr[j + 1]], dist[ptr[j]:ptr[j + 1]]):
+            da = anc.get(a)
+            if da is not None:
+                # deepest first, then the shortest combined path, then the smallest id
+                cand = (-depth[a], da + d, a, da, d)
+                if best is None or cand < best:
+                    best = cand
+        if best is None:
+            return -1, -1, -1
+        return best[2], best[3], best[4]
+
+    def get_LCS_ids(self, i: int, j: int):
+        """
+        Deepest common subsumer of the ids i and j, ties broken by the shorter path, then by the smaller id
+        :return: (lcs id, distance from i to lcs, distance from j to lcs), lcs id is -1 when nothing is shared
+        """
+        if i == j:
+            return i, 0, 0
+        swap = i > j
+        key = (j, i) if swap else (i, j)
+        res = self.cache.get(key)
+        if res is None:
+            res = self.__search(key[0], key[1])
+            if self.cache_size > 0:
+                self.cache[key] = res
+                if len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+        else:
+            self.cache.move_to_end(key)
+        if swap:
+            return res[0], res[2], res[1]
+        return res
+
+    def __columns(self, ids: np.ndarray):
+        # ancestors of a batch regrouped by ancestor: id -> (rows of the batch, distance from each row)
+        ptr = self.h.ancestor_ptr
+        counts = ptr[ids + 1] - ptr[ids]
+        rows = np.concatenate((np.arange(len(ids)), np.repeat(np.arange(len(ids)), counts)))
+        cols = np.concatenate([ids] + [self.h.ancestor_idx[ptr[i]:ptr[i + 1]] for i in ids.tolist()])
+        dist = np.concatenate([np.zeros(len(ids), dtype=np.int32)] +
+                              [self.h.ancestor_dist[ptr[i]:ptr[i + 1]] for i in ids.tolist()])
+        order = np.argsort(cols, kind='stable')
+        cols, rows, dist = cols[order], rows[order], dist[order]
+        keys, starts = np.unique(cols, return_index=True)
+        ends = np.append(starts[1:], len(cols))
+        return {int(k): (rows[s:e], dist[s:e]) for k, s, e in zip(keys, starts, ends)}
+
+    def get_LCS_matrix(self, ids_a, ids_b):
+        """
+        Least common subsumer of every pair of ids_a x ids_b, same choice as get_LCS_ids
+        :param ids_a: ids of the first batch
+        :param ids_b: ids of the second batch
+
+        :return: (lcs ids, depth of the lcs, distance from a to lcs + distance from b to lcs), arrays of
+        shape (len(ids_a), len(ids_b)), lcs id and depth are -1 when nothing is shared
+        """
+        ids_a, ids_b = np.asarray(ids_a, dtype=np.int64), np.asarray(ids_b, dtype=np.int64)
+        shape = (len(ids_a), len(ids_b))
+        lcs = np.full(shape, -1, dtype=np.int64)
+        depth = np.full(shape, -1, dtype=np.int64)
+        cost = np.zeros(shape, dtype=np.int64)
+        if len(ids_a) == 0 or len(ids_b) == 0:
+            return lcs, depth, cost
+        cols_a, cols_b = self.__columns(ids_a), self.__columns(ids_b)
+        common = np.array(sorted(cols_a.keys() & cols_b.keys()), dtype=np.int64)
+        # deepest ancestors first, a pair only moves to a shallower one it shares for the first time
+        for k in common[np.lexsort((common, -self.h.depth[common].astype(np.int64)))].tolist():
+            rows_a, dist_a = cols_a[k]
+            rows_b, dist_b = cols_b[k]
+            block = np.ix_(rows_a, rows_b)
+            c = dist_a[:, None].astype(np.int64) + dist_b[None, :]
+            d = int(self.h.depth[k])
+            better = (depth[block] < d) | ((depth[block] == d) & (c < cost[block]))
+            if not better.any():
+                continue
+            lcs[block] = np.where(better, k, lcs[block])
+            depth[block] = np.where(better, d, depth[block])
+            cost[block] = np.where(better, c, cost[block])
+        return lcs, depth, cost
+
+    def get_LCS(self, a, b):
+        i, j = self.h.get_id(a), self.h.get_id(b)
+        if i < 0 or j < 0:
+            return None
+        lcs = self.get_LCS_ids(i, j)[0]
+        if lcs < 0:
+            return None
+        return self.h.nodes[lcs]
+
+
+class Snapshot():
+    VERSION = 3
+    DERIVED_VERSION = 1  # layout of the caches written by MyOWLOntology.save_derived_cache
+
+    def __init__(self, folder: str):
+        """
+        Folder of .npy arrays and term lists written once per ontology content, arrays are memory-mapped on read
+        :param folder: location of the snapshot, usually named by Snapshot.fingerprint
+
+        :return: None
+        """
+        self.folder = folder
+
+    @staticmethod
+    def fingerprint(files: list, members: list=(), options: dict=None) -> str:
+        """
+        :param files: files on disk whose bytes identify the ontology, archives are hashed compressed
+        :param members: names of the archive members that are read, if any
+        :param options: loading options the snapshot depends on, e.g. compiled and quadstore
+        """
+        sha = hashlib.sha1(str(Snapshot.VERSION).encode())
+        for m in members:
+            sha.update(m.encode('utf-8') + b'\0')
+        for k, v in sorted((options or {}).items()):
+            sha.update(('%s=%r' % (k, v)).encode('utf-8') + b'\0')
+        for f in files:
+            with open(f, 'rb') as stream:
+                block = stream.read(1 << 20)
+                while block:
+                    sha.update(block)
+                    block = stream.read(1 << 20)
+        return sha.hexdigest()
+
+    def exists(self) -> bool:
+        return os.path.isdir(self.folder)
+
+    def derived(self) -> Snapshot:
+        """
+        Snapshot nested in this one for the caches filled while the ontology is used, rewritten as they grow
+        """
+        return Snapshot(os.path.join(self.folder, 'derived.%d' % Snapshot.DERIVED_VERSION))
+
+    @staticmethod
+    def encode_term(t) -> str:
+        if isinstance(t, BNode):
+            return '_:' + str(t)
+        return '<' + str(t) + '>'
+
+    @staticmethod
+    def decode_term(line: str):
+        if line.startswith('_:'):
+            return BNode(line[2:])
+        return URIRef(line[1:-1])
+
+    def write(self, terms: dict, arrays: dict):
+        """
+        :param terms: name: list of rdflib terms, stored one per line
+        :param arrays: name: numpy array
+        """
+        tmp = self.folder + '.tmp'
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        for name, ts in terms.items():
+            with open(os.path.join(tmp, name + '.txt'), 'wt', encoding='utf-8') as f:
+                f.writelines(Snapshot.encode_term(t) + '\n' for t in ts)
+        for name, a in arrays.items():
+            np.save(os.path.join(tmp, name + '.npy'), np.ascontiguousarray(a))
+        # the folder only appears once complete, a crashed write leaves just the .tmp folder
+        if os.path.isdir(self.folder):
+            # arrays still memory-mapped from the previous version stay readable after the unlink
+            old = self.folder + '.old'
+            shutil.rmtree(old, ignore_errors=True)
+            os.replace(self.folder, old)
+            os.replace(tmp, self.folder)
+            shutil.rmtree(old, ignore_errors=True)
+        else:
+            os.replace(tmp, self.folder)
+
+    def read(self):
+        """
+        :return: (name: list of rdflib terms, name: read-only memory-mapped array)
+        """
+        terms, arrays = {}, {}
+        for fname in os.listdir(self.folder):
+            name, ext = os.path.splitext(fname)
+            path = os.path.join(self.folder, fname)
+            if ext == '.txt':
+                with open(path, 'rt', encoding='utf-8') as f:
+                    terms[name] = [Snapshot.decode_term(line) for line in f.read().splitlines()]
+            elif ext == '.npy':
+                arrays[name] = np.load(path, mmap_mode='r')
+        return terms, arrays
@@ -0,0 +1,537 @@
+from __future__ import annotations
+import os
+import re
+import sqlite3
+import multiprocessing
+from array import array
+from bisect import bisect_left, bisect_right
+import numpy as np
+import rdflib
+from rdflib import BNode, Graph, URIRef
+import owlready2
+import utils
+
+
+class TripleStore():
+    COMPACT_RATIO = 8  # the delta overlay is folded into the arrays past 1 / COMPACT_RATIO of the base triples
+
+    def __init__(self, terms: list, triples: np.ndarray):
+        """
+        Triples stored as integer ids, answering the rdflib.Graph patterns MyOWLOntology uses
+        Only resources and blank nodes are kept, literal values are never read by the similarity measures.
+        Deltas do not rebuild the arrays: removed triples are tombstoned and added ones kept in a small
+        overlay indexed by subject and predicate, both folded in once they grow past a fraction of the store.
+        :param terms: id: rdflib term
+        :param triples: (n, 3) array of subject, predicate and object ids, duplicates are removed
+
+        :return: None
+        """
+        self.terms = terms
+        self.ids = {t: i for i, t in enumerate(terms)}
+        self.__build(triples)
+
+    def __build(self, triples: np.ndarray):
+        spo = np.unique(np.asarray(triples, dtype=np.int32).reshape(-1, 3), axis=0)
+        # subject order: rows of subject i are spo_ptr[i]:spo_ptr[i + 1], sorted by predicate then object
+        ptr = np.zeros(len(self.terms) + 1, dtype=np.int64)
+        ptr[1:] = np.cumsum(np.bincount(spo[:, 0], minlength=len(self.terms)))
+        self.spo_ptr = array('q', ptr.tobytes())
+        self.spo_p = array('i', np.ascontiguousarray(spo[:, 1]).tobytes())
+        self.spo_o = array('i', np.ascontiguousarray(spo[:, 2]).tobytes())
+        # predicate order: rows of predicate p are blocks[p], sorted by object then subject
+        pos = spo[np.lexsort((spo[:, 0], spo[:, 2], spo[:, 1]))]
+        self.pos_o = array('i', np.ascontiguousarray(pos[:, 2]).tobytes())
+        self.pos_s = array('i', np.ascontiguousarray(pos[:, 0]).tobytes())
+        preds, starts = np.unique(pos[:, 1], return_index=True)
+        ends = np.append(starts[1:], len(pos))
+        self.blocks = {int(p): (int(lo), int(hi)) for p, lo, hi in zip(preds, starts, ends)}  # predicate id: rows
+        self.removed = set()  # (s, p, o) ids of base triples deleted since the arrays were built
+        self.added_s = {}  # subject id: set of (p, o) ids added since the arrays were built
+        self.added_p = {}  # predicate id: set of (s, o) ids, the same triples by predicate
+        self.n_added = 0
+
+    def __len__(self) -> int:
+        return len(self.spo_p) - len(self.removed) + self.n_added
+
+    def __iter__(self):
+        return self.triples((None, None, None))
+
+    def __contains__(self, triple) -> bool:
+        for _ in self.triples(triple):
+            return True
+        return False
+
+    def __base_rows(self, s: int, p: int, o: int):
+        # (subject, predicate, object) id triples of a pattern in the arrays, -1 stands for an unbound position
+        if s >= 0:
+            if s + 1 >= len(self.spo_ptr):
+                return []
+            lo, hi = self.spo_ptr[s], self.spo_ptr[s + 1]
+            if p >= 0:
+                lo, hi = bisect_left(self.spo_p, p, lo, hi), bisect_right(self.spo_p, p, lo, hi)
+                if o >= 0:
+                    k = bisect_left(self.spo_o, o, lo, hi)
+                    return [(s, p, o)] if k < hi and self.spo_o[k] == o else []
+                return [(s, p, x) for x in self.spo_o[lo:hi]]
+            return [(s, y, x) for y, x in zip(self.spo_p[lo:hi], self.spo_o[lo:hi]) if o < 0 or x == o]
+        if p >= 0:
+            blocks = [(p, self.blocks.get(p, (0, 0)))]
+        else:
+            blocks = self.blocks.items()
+        rows = []
+        for q, (lo, hi) in blocks:
+            if o >= 0:
+                lo, hi = bisect_left(self.pos_o, o, lo, hi), bisect_right(self.pos_o, o, lo, hi)
+            rows.extend((x, q, y) for x, y in zip(self.pos_s[lo:hi], self.pos_o[lo:hi]))
+        return rows
+
+    def __rows(self, s: int, p: int, o: int):
+        rows = self.__base_rows(s, p, o)
+        if len(self.removed) > 0:
+            rows = [r for r in rows if r not in self.removed]
+        if self.n_added > 0:
+            if s >= 0:
+                rows.extend((s, y, x) for y, x in self.added_s.get(s, ()) if (p < 0 or y == p) and (o < 0 or x == o))
+            else:
+                for q in ([p] if p >= 0 else list(self.added_p)):
+                    rows.extend((x, q, y) for x, y in self.added_p.get(q, ()) if o < 0 or y == o)
+        return rows
+
+    def get_id_triples(self) -> np.ndarray:
+        ptr = np.frombuffer(self.spo_ptr, dtype=np.int64)
+        subjects = np.repeat(np.arange(len(ptr) - 1, dtype=np.int32), np.diff(ptr))
+        rows = np.stack((subjects, np.frombuffer(self.spo_p, dtype=np.int32),
+                         np.frombuffer(self.spo_o, dtype=np.int32)), axis=1)
+        if len(self.removed) > 0:
+            # one 12 byte key per triple, compared as a whole
+            key = np.dtype((np.void, 12))
+            drop = np.array(list(self.removed), dtype=np.int32)
+            rows = rows[~np.isin(np.ascontiguousarray(rows).view(key).ravel(),
+                                 np.ascontiguousarray(drop).view(key).ravel())]
+        if self.n_added > 0:
+            new = np.array([(s, p, o) for s, pos in self.added_s.items() for p, o in pos], dtype=np.int32)
+            rows = np.concatenate((rows, new.reshape(-1, 3)))
+        return rows
+
+    def triples(self, pattern: tuple):
+        ids = []
+        for t in pattern:
+            if t is None:
+                ids.append(-1)
+            else:
+                i = self.ids.get(t)
+                if i is None:
+                    return
+                ids.append(i)
+        terms = self.terms
+        for s, p, o in self.__rows(*ids):
+            yield terms[s], terms[p], terms[o]
+
+    def objects(self, subject=None, predicate=None):
+        for _, _, o in self.triples((subject, predicate, None)):
+            yield o
+
+    def subjects(self, predicate=None, object=None):
+        for s, _, _ in self.triples((None, predicate, object)):
+            yield s
+
+    def predicates(self, subject=None, object=None):
+        if subject is None and object is None and len(self.removed) == 0 and self.n_added == 0:
+            return (self.terms[p] for p in self.blocks)
+        return iter(dict.fromkeys(p for _, p, _ in self.triples((subject, None, object))))
+
+    def update(self, added: list, removed: list) -> TripleStore:
+        """
+        Add the resource triples of added and drop those of removed, in place
+        Base triples are tombstoned and new ones go to the overlay; the arrays are only rebuilt once the
+        overlay outgrows 1 / COMPACT_RATIO of them.
+
+        :return: this store
+        """
+        for triple in removed:
+            if not all(t in self.ids for t in triple):
+                continue
+            s, p, o = (self.ids[t] for t in triple)
+            if (p, o) in self.added_s.get(s, ()):
+                self.added_s[s].discard((p, o))
+                self.added_p[p].discard((s, o))
+                self.n_added -= 1
+            elif len(self.__base_rows(s, p, o)) > 0:
+                self.removed.add((s, p, o))
+        for triple in added:
+            if not all(isinstance(t, (URIRef, BNode)) for t in triple):
+                continue
+            row = []
+            for t in triple:
+                i = self.ids.get(t)
+                if i is None:
+                    i = self.ids[t] = len(self.terms)
+                    self.terms.append(t)
+                row.append(i)
+            s, p, o = row
+            if (s, p, o) in self.removed:
+                self.removed.discard((s, p, o))
+            elif len(self.__base_rows(s, p, o)) == 0 and (p, o) not in self.added_s.get(s, ()):
+                self.added_s.setdefault(s, set()).add((p, o))
+                self.added_p.setdefault(p, set()).add((s, o))
+                self.n_added += 1
+        if (len(self.removed) + self.n_added) * TripleStore.COMPACT_RATIO > len(self.spo_p):
+            self.compact()
+        return self
+
+    def compact(self):
+        """
+        Fold the tombstones and the overlay into the arrays
+        """
+        self.__build(self.get_id_triples())
+
+    @staticmethod
+    def from_graph(graph) -> TripleStore:
+        """
+        Copy the resource triples of an rdflib.Graph, literals are left out
+        """
+        ids, terms, rows = {}, [], array('i')
+        for triple in graph:
+            if not all(isinstance(t, (URIRef, BNode)) for t in triple):
+                continue
+            for t in triple:
+                i = ids.get(t)
+                if i is None:
+                    i = ids[t] = len(terms)
+                    terms.append(t)
+                rows.append(i)
+        return TripleStore(terms, np.frombuffer(rows, dtype=np.int32).reshape(-1, 3))
+
+    @staticmethod
+    def merge(stores: list) -> TripleStore:
+        ids, terms, parts = {}, [], []
+        for store in stores:
+            remap = np.empty(len(store.terms), dtype=np.int32)
+            for k, t in enumerate(store.terms):
+                i = ids.get(t)
+                if i is None:
+                    i = ids[t] = len(terms)
+                    terms.append(t)
+                remap[k] = i
+            parts.append(remap[store.get_id_triples()])
+        return TripleStore(terms, np.concatenate(parts) if parts else np.zeros((0, 3), dtype=np.int32))
+
+
+class QuadStore():
+    def __init__(self, filename: str):
+        """
+        Triples kept on disk in the SQLite quadstore of owlready2, answering the same patterns as TripleStore
+        Ontologies are parsed by owlready2 straight into the file, a file loaded by an earlier run is not
+        parsed again. Patterns are answered by SQL over the (s, p) and (p, o) indexes of the objs table,
+        literals live in another table and are never read.
+        :param filename: SQLite file, created when missing
+
+        :return: None
+        """
+        self.filename = os.path.abspath(filename)
+        self.db = None
+        self.pid = None
+
+    def load(self, path: str):
+        """
+        :param path: plain file, .gz file or zip archive, in any syntax owlready2 reads (RDF/XML, OWL/XML, N-Triples)
+        """
+        if utils.is_archive(path):
+            archive, _ = utils.split_archive_path(path)
+            sources = ((os.path.join(archive, name), stream) for name, stream in utils.open_archive(path))
+        else:
+            sources = [(path, None)]
+        world = None
+        try:
+            for name, stream in sources:
+                iri = 'file://' + os.path.abspath(name)
+                if self.__is_loaded(iri):
+                    continue
+                if world is None:
+                    # owlready2 rewrites some declarations when it opens a store, so it only opens it to parse
+                    self.__close()
+                    world = owlready2.World(filename=self.filename)
+                if stream is None:
+                    with open(name, 'rb') as f:
+                        world.get_ontology(iri).load(fileobj=f)
+                else:
+                    world.get_ontology(iri).load(fileobj=stream)
+            if world is not None:
+                world.graph.execute('CREATE INDEX IF NOT EXISTS index_objs_po ON objs(p,o)')
+                world.save()
+        finally:
+            if world is not None:
+                world.close()
+
+    def __is_loaded(self, iri: str) -> bool:
+        if not os.path.exists(self.filename):
+            return False
+        # owlready2 renames an ontology after its declared IRI and keeps the file IRI as an alias
+        row = self.__execute('SELECT 1 FROM ontologies o LEFT JOIN ontology_alias a ON a.iri=o.iri '
+                             'WHERE o.last_update>0 AND (o.iri IN (?, ?) OR a.alias IN (?, ?))',
+                             (iri, iri + '#', iri, iri + '#')).fetchall()
+        return len(row) > 0
+
+    def __close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+    def update(self, added: list, removed: list) -> QuadStore:
+        """
+        Write triple deltas to the quadstore, literals are skipped as everywhere else in this store
+        Added triples go to the last ontology of the file, unknown resources and blank nodes get new storids.
+        """
+        self.__close()
+        db = sqlite3.connect(self.filename)
+        try:
+            c = db.execute('SELECT MAX(c) FROM ontologies').fetchone()[0]
+            blanks = {}  # new blank node: storid
+            for triple in removed:
+                key = [self.__get_storid(db, t) for t in triple]
+                if None not in key:
+                    db.execute('DELETE FROM objs WHERE s=? AND p=? AND o=?', key)
+            for triple in added:
+                if not all(isinstance(t, (URIRef, BNode)) for t in triple):
+                    continue
+                key = [self.__get_storid(db, t, blanks) for t in triple]
+                if db.execute('SELECT 1 FROM objs WHERE s=? AND p=? AND o=?', key).fetchone() is None:
+                    db.execute('INSERT INTO objs VALUES (?, ?, ?, ?)', [c] + key)
+            db.commit()
+        finally:
+            db.close()
+        return self
+
+    @staticmethod
+    def __get_storid(db, term, blanks: dict=None):
+        # storid of a term, created in the store counters when blanks is given and the term is new
+        if isinstance(term, BNode):
+            if term[:1] == 'q' and term[1:].isdigit():
+                return -int(term[1:])
+            if blanks is None:
+                return None
+            if term not in blanks:
+                db.execute('UPDATE store SET current_blank=current_blank+1')
+                blanks[term] = -db.execute('SELECT current_blank FROM store').fetchone()[0]
+            return blanks[term]
+        if not isinstance(term, URIRef):
+            return None
+        row = db.execute('SELECT storid FROM resources WHERE iri=?', (str(term),)).fetchone()
+        if row is not None:
+            return row[0]
+        if blanks is None:
+            return None
+        db.execute('UPDATE store SET current_resource=current_resource+1')
+        storid = db.execute('SELECT current_resource FROM store').fetchone()[0]
+        db.execute('INSERT INTO resources VALUES (?, ?)', (storid, str(term)))
+        return storid
+
+    def __execute(self, sql: str, args: tuple=()):
+        # sqlite connections must not cross a fork, every process opens its own read-only one
+        if self.db is None or self.pid != os.getpid():
+            self.db = sqlite3.connect('file:%s?mode=ro' % self.filename, uri=True, check_same_thread=False)
+            self.pid = os.getpid()
+        return self.db.execute(sql, args)
+
+    def __storid(self, term):
+        if isinstance(term, BNode):
+            return -int(term[1:]) if term[:1] == 'q' and term[1:].isdigit() else None
+        if not isinstance(term, URIRef):
+            return None
+        row = self.__execute('SELECT storid FROM resources WHERE iri=?', (str(term),)).fetchone()
+        return None if row is None else row[0]
+
+    @staticmethod
+    def __term(storid: int, iri: str):
+        # owlready2 numbers blank nodes with negative storids
+        return URIRef(iri) if storid > 0 else BNode('q%d' % -storid)
+
+    def __len__(self) -> int:
+        return self.__execute('SELECT COUNT(*) FROM (SELECT DISTINCT s, p, o FROM objs)').fetchone()[0]
+
+    def __iter__(self):
+        return self.triples((None, None, None))
+
+    def __contains__(self, triple) -> bool:
+        for _ in self.triples(triple):
+            return True
+        return False
+
+    def triples(self, pattern: tuple):
+        where, args = [], []
+        for column, t in zip('spo', pattern):
+            if t is None:
+                continue
+            storid = self.__storid(t)
+            if storid is None:
+                return
+            where.append('o.%s=?' % column)
+            args.append(storid)
+        sql = 'SELECT DISTINCT o.s, o.p, o.o, rs.iri, rp.iri, ro.iri FROM objs o ' \
+              'LEFT JOIN resources rs ON rs.storid=o.s LEFT JOIN resources rp ON rp.storid=o.p ' \
+              'LEFT JOIN resources ro ON ro.storid=o.o'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        term = self.__term
+        for s, p, o, s_iri, p_iri, o_iri in self.__execute(sql, tuple(args)):
+            yield term(s, s_iri), term(p, p_iri), term(o, o_iri)
+
+    def objects(self, subject=None, predicate=None):
+        for _, _, o in self.triples((subject, predicate, None)):
+            yield o
+
+    def subjects(self, predicate=None, object=None):
+        for s, _, _ in self.triples((None, predicate, object)):
+            yield s
+
+    def predicates(self, subject=None, object=None):
+        if subject is None and object is None:
+            sql = 'SELECT DISTINCT o.p, r.iri FROM objs o JOIN resources r ON r.storid=o.p'
+            return (URIRef(iri) for _, iri in self.__execute(sql).fetchall())
+        return iter(dict.fromkeys(p for _, p, _ in self.triples((subject, None, object))))
+
+
+def update_store(store, added: list, removed: list):
+    """
+    Apply triple deltas to an rdflib.Graph, a TripleStore or a QuadStore
+    :return: the updated store, the same object
+    """
+    if isinstance(store, (TripleStore, QuadStore)):
+        return store.update(added, removed)
+    for triple in removed:
+        store.remove(triple)
+    for triple in added:
+        store.add(triple)
+    return store
+
+
+def parse_graph(graph: Graph, path: str) -> Graph:
+    """
+    Parse an ontology file into graph, archive members are decompressed while the parser reads them
+    """
+    if not utils.is_archive(path):
+        graph.parse(path)
+        return graph
+    for name, stream in utils.open_archive(path):
+        graph.parse(source=stream, format=rdflib.util.guess_format(name) or 'xml')
+    return graph
+
+
+def read_graph_store(path: str) -> TripleStore:
+    return TripleStore.from_graph(parse_graph(Graph(), path))
+
+
+def compile_graph(path: str) -> TripleStore:
+    """
+    Parse an ontology file in a worker process and keep only its TripleStore
+    The rdflib.Graph lives and dies in the worker, so its memory goes back to the system instead of
+    staying fragmented in this process.
+    """
+    with multiprocessing.Pool(1) as pool:
+        return pool.apply(read_graph_store, (path,))
+
+
+# one N-Triples / N-Quads statement, the graph label of a quad is ignored
+# a blank node label may hold dots but not end with one, the dot closing the statement can follow it directly
+NT_TERM = r'<[^>]*>|_:[^\s.]+(?:\.+[^\s.]+)*'
+NT_LINE = re.compile(r'\s*(' + NT_TERM + r')\s+(<[^>]*>)\s+(' + NT_TERM + r'|"(?:[^"\\]|\\.)*"(?:@[\w-]+|\^\^<[^>]*>)?)'
+                     r'(?:\s+(?:' + NT_TERM + r'))?\s*\.\s*(?:#.*)?$')
+NT_ESCAPE = re.compile(r'\\u([0-9A-Fa-f]{4})|\\U([0-9A-Fa-f]{8})')
+
+
+def is_ntriples(path: str) -> bool:
+    archive, member = utils.split_archive_path(path)
+    name = member or archive
+    if name.lower().endswith('.gz'):
+        name = name[:-3]
+    return name.lower().endswith(('.nt', '.nq'))
+
+
+def parse_ntriples_term(token: str):
+    if token.startswith('_:'):
+        return BNode(token[2:])
+    iri = token[1:-1]
+    if '\\' in iri:
+        iri = NT_ESCAPE.sub(lambda m: chr(int(m.group(1) or m.group(2), 16)), iri)
+    return URIRef(iri)
+
+
+def read_ntriples_lines(lines) -> tuple:
+    """
+    :param lines: iterable of N-Triples or N-Quads lines, bytes or str
+    :return: (list of term tokens, (n, 3) int32 array of token ids, number of malformed lines skipped),
+    statements with a literal object are skipped too but not counted
+    """
+    ids, tokens, rows = {}, [], array('i')
+    skipped = 0
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        m = NT_LINE.match(line)
+        if m is None:
+            stripped = line.strip()
+            if len(stripped) > 0 and not stripped.startswith('#'):
+                skipped += 1
+            continue
+        if m.group(3)[0] == '"':
+            continue
+        for tok in m.group(1, 2, 3):
+            i = ids.get(tok)
+            if i is None:
+                i = ids[tok] = len(tokens)
+                tokens.append(tok)
+            rows.append(i)
+    return tokens, np.frombuffer(rows, dtype=np.int32).reshape(-1, 3), skipped
+
+
+def read_ntriples_range(args: tuple) -> tuple:
+    # lines starting in [start, end), a line cut by start belongs to the previous range
+    path, start, end = args
+    with open(path, 'rb') as f:
+        if start > 0:
+            f.seek(start - 1)
+            f.readline()
+        def lines():
+            pos = f.tell()
+            while pos < end:
+                line = f.readline()
+                if not line:
+                    break
+                pos += len(line)
+                yield line
+        return read_ntriples_lines(lines())
+
+
+def load_ntriples(path: str, processes: int=1) -> TripleStore:
+    """
+    Stream an N-Triples or N-Quads file into a TripleStore without building an rdflib.Graph
+    :param path: plain file, .gz file or zip archive member
+    :param processes: number of worker processes, each parses one byte range of a plain file
+
+    :return: TripleStore
+    """
+    if utils.is_archive(path):
+        # compressed streams can only be read from the start
+        parts = [read_ntriples_lines(stream) for _, stream in utils.open_archive(path)]
+    elif processes > 1:
+        size = os.path.getsize(path)
+        step = size // processes + 1
+        ranges = [(path, lo, min(size, lo + step)) for lo in range(0, size, step)]
+        with multiprocessing.Pool(processes) as pool:
+            parts = pool.map(read_ntriples_range, ranges)
+    else:
+        parts = [read_ntriples_range((path, 0, os.path.getsize(path)))]
+
+    skipped = sum(n for _, _, n in parts)
+    if skipped > 0:
+        print('Skipped ' + str(skipped) + ' malformed lines of ' + path)
+    # the chunks share their terms through one sort of all their tokens, each chunk is then remapped
+    # by a lookup array instead of a dict access per token
+    tokens = np.array([tok for part, _, _ in parts for tok in part], dtype=object)
+    unique, inverse = np.unique(tokens, return_inverse=True)
+    terms = [parse_ntriples_term(tok) for tok in unique.tolist()]
+    rows, offset = [], 0
+    for part, triples, _ in parts:
+        rows.append(inverse[offset:offset + len(part)].astype(np.int32)[triples])
+        offset += len(part)
+    return TripleStore(terms, np.concatenate(rows) if rows else np.zeros((0, 3), dtype=np.int32))
@@ -0,0 +1,15 @@
+import os
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+ONTOLOGIES = os.path.join(ROOT, 'ontologies')
+MLS = os.path.join(ONTOLOGIES, 'mls.zip')
+ANONYMOUS = os.path.join(ONTOLOGIES, 'OntologyID(Anonymous-720361).zip')
+
+
+@pytest.fixture(params=[MLS, ANONYMOUS], ids=['mls', 'anonymous'])
+def ontology_file(request):
+    return request.param
@@ -0,0 +1,46 @@
+import itertools
+import random
+import numpy as np
+import pytest
+from myontology import AnnSim, AnnotationComparison
+
+
+def random_comparisons(rnd: random.Random, terms: list) -> dict:
+    comparisons = {}
+    for a, b in itertools.combinations_with_replacement(terms, 2):
+        comparisons[AnnotationComparison(a, b)] = 1.0 if a == b else round(rnd.random(), 3)
+    return comparisons
+
+
+def random_pairs(rnd: random.Random, terms: list, n: int) -> list:
+    return [(rnd.sample(terms, rnd.randint(1, 4)), rnd.sample(terms, rnd.randint(1, 4))) for _ in range(n)]
+
+
+def test_group_similarities_match_single_pairs():
+    rnd = random.Random(5)
+    terms = ['t%d' % i for i in range(12)]
+    sim = AnnSim(random_comparisons(rnd, terms))
+    pairs = random_pairs(rnd, terms, 60)
+    groups = sim.group_similarities(pairs)
+    for k, (a, b) in enumerate(pairs):
+        assert groups['hungarian'][k] == pytest.approx(AnnSim(sim.map_comparisons).matching(a, b, None, None), abs=1e-12)
+        assert groups['bma'][k] == pytest.approx(AnnSim(sim.map_comparisons).maximum_matching(a, b, None, None),
+                                                 abs=1e-12)
+    assert np.allclose(sim.matching_batch(pairs), groups['hungarian'])
+
+
+def test_missing_comparison_leaves_nan():
+    rnd = random.Random(6)
+    terms = ['t%d' % i for i in range(6)]
+    comparisons = random_comparisons(rnd, terms)
+    del comparisons[AnnotationComparison('t0', 't1')]
+    sim = AnnSim(comparisons)
+    pairs = [(['t0', 't2'], ['t1', 't3']), (['t2', 't4'], ['t3', 't5']), (['t0'], ['t0'])]
+    groups = sim.group_similarities(pairs)
+    for name in AnnSim.AGGREGATORS:
+        assert np.isnan(groups[name][0])
+        assert not np.isnan(groups[name][1])
+        assert groups[name][2] == 1.0
+    batch = sim.matching_batch(pairs)
+    assert np.isnan(batch[0])
+    assert batch[1] == pytest.approx(AnnSim(comparisons).matching(pairs[1][0], pairs[1][1], None, None), abs=1e-12)
@@ -0,0 +1,47 @@
+import random
+import pytest
+from rdflib import BNode, Graph, Literal, URIRef
+from myontology import MyOWLOntology
+from ontostore import TripleStore, compile_graph, parse_graph
+from test_parity import check_ontology, load_baseline
+
+
+def test_compiled_store_matches_graph(ontology_file):
+    g = parse_graph(Graph(), ontology_file)
+    store = compile_graph(ontology_file)
+    expected = {t for t in g if not isinstance(t[2], Literal)}
+    assert len(store) == len(expected)
+    named = lambda triples: {t for t in triples if not any(isinstance(x, BNode) for x in t)}
+    assert named(store) == named(expected)
+
+
+def test_compiled_ontology_matches_baseline(ontology_file):
+    o = MyOWLOntology(ontology_file, compiled=True)
+    check_ontology(o, load_baseline(ontology_file))
+
+
+@pytest.mark.parametrize('ratio', [1 << 30, 8, 1], ids=['overlay', 'default', 'compacted'])
+def test_store_update_matches_rebuild(ontology_file, monkeypatch, ratio):
+    monkeypatch.setattr(TripleStore, 'COMPACT_RATIO', ratio)
+    store = compile_graph(ontology_file)
+    expected = set(store)
+    rnd = random.Random(ratio)
+    terms = sorted(set(t for triple in expected for t in triple if isinstance(t, URIRef)))
+    for step in range(5):
+        removed = rnd.sample(sorted(expected), 20) + [(URIRef('urn:x'), URIRef('urn:p'), URIRef('urn:y'))]
+        added = [(rnd.choice(terms), rnd.choice(terms), URIRef('urn:new%d' % rnd.randrange(30))) for _ in range(20)]
+        # triples removed and added again, and literals that are never stored
+        added += removed[:5] + [(terms[0], terms[1], Literal('x'))]
+        assert store.update(added, removed) is store
+        expected = (expected - set(removed)) | set(t for t in added if not isinstance(t[2], Literal))
+        assert set(store) == expected
+        assert len(store) == len(expected)
+        s, p, o = rnd.choice(sorted(expected))
+        assert set(store.triples((s, None, None))) == set(t for t in expected if t[0] == s)
+        assert set(store.triples((None, p, None))) == set(t for t in expected if t[1] == p)
+        assert set(store.triples((None, p, o))) == set(t for t in expected if t[1] == p and t[2] == o)
+        assert set(store.triples((None, None, o))) == set(t for t in expected if t[2] == o)
+        assert (s, p, o) in store
+        assert set(store.predicates()) == set(t[1] for t in expected)
+    rebuilt = TripleStore.merge([store])
+    assert set(rebuilt) == expected
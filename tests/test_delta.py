@@ -0,0 +1,120 @@
+import random
+import pytest
+from rdflib import BNode, Graph, Literal, URIRef
+from rdflib import OWL, RDF, RDFS
+from conftest import MLS
+from myontology import MyOWLOntology
+
+EX = 'http://example.org/onto#'
+
+
+def restriction(g: Graph, cls, p, filler):
+    bn = BNode()
+    g.add((cls, RDFS.subClassOf, bn))
+    g.add((bn, RDF.type, OWL.Restriction))
+    g.add((bn, OWL.onProperty, p))
+    g.add((bn, OWL.someValuesFrom, filler))
+
+
+def write_link_ontology(path) -> None:
+    # A and B reach X and Y through r, X and Y are unrelated until the delta
+    g = Graph()
+    r = URIRef(EX + 'r')
+    g.add((r, RDF.type, OWL.ObjectProperty))
+    for name in ['A', 'B', 'X', 'Y', 'Top']:
+        g.add((URIRef(EX + name), RDF.type, OWL.Class))
+    for name in ['A', 'B']:
+        g.add((URIRef(EX + name), RDFS.subClassOf, URIRef(EX + 'Top')))
+    restriction(g, URIRef(EX + 'A'), r, URIRef(EX + 'X'))
+    restriction(g, URIRef(EX + 'B'), r, URIRef(EX + 'Y'))
+    g.serialize(str(path), format='xml', encoding='utf-8')
+
+
+def fresh_copy(o: MyOWLOntology, path) -> MyOWLOntology:
+    g = Graph()
+    for triple in o.o:
+        g.add(triple)
+    g.serialize(str(path), format='nt', encoding='utf-8')
+    return MyOWLOntology(str(path))
+
+
+@pytest.mark.parametrize('cache', [64 << 20, 0], ids=['memo', 'no-memo'])
+def test_link_memo_follows_delta(tmp_path, cache):
+    write_link_ontology(tmp_path / 'links.owl')
+    o = MyOWLOntology(str(tmp_path / 'links.owl'), similarity_cache=cache)
+    a, b = o.get_OWL_concept(EX + 'A'), o.get_OWL_concept(EX + 'B')
+    before = a.similarity(b)
+    o.apply_delta([(URIRef(EX + 'X'), RDFS.subClassOf, URIRef(EX + 'Y'))])
+    ref = fresh_copy(o, tmp_path / 'ref.nt')
+    after = ref.get_OWL_concept(EX + 'A').similarity(ref.get_OWL_concept(EX + 'B'))
+    assert after != before
+    assert a.similarity(b) == pytest.approx(after, abs=1e-12)
+
+
+def random_delta(o: MyOWLOntology, sample: list, seed: int):
+    rnd = random.Random(seed)
+    cls = sorted(str(c) for c in o._concepts if c != OWL.Thing)
+    rels = sorted(o.relations)
+    named = sorted((s, x) for s, _, x in o.o.triples((None, RDFS.subClassOf, None))
+                   if isinstance(s, URIRef) and isinstance(x, URIRef))
+    removed = [(s, RDFS.subClassOf, x) for s, x in rnd.sample(named, min(10, len(named)))]
+    added = []
+    for i in range(3):
+        n = URIRef(EX + 'new%d' % i)
+        added += [(n, RDF.type, OWL.Class), (n, RDFS.subClassOf, URIRef(rnd.choice(cls)))]
+    for _ in range(10):
+        x, y = rnd.sample(sample, 2)
+        added.append((URIRef(x), RDFS.subClassOf, URIRef(y)))
+    for _ in range(4):
+        restriction_triples = Graph()
+        restriction(restriction_triples, URIRef(rnd.choice(sample)), URIRef(rnd.choice(rels)), URIRef(rnd.choice(cls)))
+        added += list(restriction_triples)
+    return added, removed
+
+
+@pytest.mark.parametrize('compiled', [False, True], ids=['graph', 'compiled'])
+@pytest.mark.parametrize('cache', [64 << 20, 0], ids=['memo', 'no-memo'])
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_apply_delta_matches_fresh_load(tmp_path, cache, seed, compiled):
+    o = MyOWLOntology(MLS, similarity_cache=cache, compiled=compiled)
+    rnd = random.Random(seed)
+    sample = rnd.sample(sorted(str(c) for c in o._concepts if c != OWL.Thing), 25)
+    # every cache is warm before the delta
+    o.set_OWL_links_concepts([o.get_OWL_concept(u) for u in sample])
+    for x in sample:
+        for y in sample:
+            o.get_OWL_concept(x).similarity(o.get_OWL_concept(y))
+    added, removed = random_delta(o, sample, seed)
+    o.apply_delta(added, removed)
+    ref = fresh_copy(o, tmp_path / 'ref.nt')
+
+    sample += [EX + 'new%d' % i for i in range(3)]
+    for x in sample:
+        cx, rx = o.get_OWL_concept(x), ref.get_OWL_concept(x)
+        assert o.prof(cx.cl) == ref.prof(rx.cl)
+        assert sorted(map(str, cx.get_neighbors())) == sorted(map(str, rx.get_neighbors()))
+        for y in sample:
+            cy, ry = o.get_OWL_concept(y), ref.get_OWL_concept(y)
+            assert o.taxonomic_class_similarity(cx, cy) == pytest.approx(ref.taxonomic_class_similarity(rx, ry), abs=1e-12)
+            assert cx.similarity(cy) == pytest.approx(rx.similarity(ry), abs=1e-12), (x, y)
+
+
+def test_instance_delta_keeps_schema_caches(tmp_path):
+    write_link_ontology(tmp_path / 'links.owl')
+    o = MyOWLOntology(str(tmp_path / 'links.owl'))
+    a, b = o.get_OWL_concept(EX + 'A'), o.get_OWL_concept(EX + 'B')
+    a.similarity(b)
+    outside = URIRef(EX + 'Outside')
+    o.ancestors[outside] = {OWL.Thing}
+    o.concept_profs[outside] = 1
+    before = o.similarities.get_stats()['concept']['entries']
+
+    o.apply_delta([(URIRef(EX + 'ind'), RDF.type, URIRef(EX + 'A'))])
+    assert o.entities.is_individual(URIRef(EX + 'ind'))
+    assert o.ancestors[outside] == {OWL.Thing}
+    assert o.concept_profs[outside] == 1
+    assert o.similarities.get_stats()['concept']['entries'] == before
+
+    o.apply_delta([(URIRef(EX + 'Z'), RDF.type, OWL.Class)])
+    assert outside not in o.ancestors
+    assert outside not in o.concept_profs
@@ -0,0 +1,59 @@
+from rdflib import BNode, Graph, URIRef
+from rdflib import OWL, RDF, RDFS
+from myontology import MyOWLOntology
+from ontoindex import EntityTable
+
+EX = 'http://example.org/onto#'
+
+
+def write_entity_ontology(path) -> None:
+    g = Graph()
+    g.add((URIRef(EX), RDF.type, OWL.Ontology))
+    g.add((URIRef(EX + 'r'), RDF.type, OWL.ObjectProperty))
+    g.add((URIRef(EX + 'Person'), RDF.type, OWL.Class))
+    g.add((URIRef(EX + 'Student'), RDFS.subClassOf, URIRef(EX + 'Person')))
+    g.add((URIRef(EX + 'alice'), RDF.type, URIRef(EX + 'Student')))
+    g.add((URIRef(EX + 'bob'), RDF.type, OWL.NamedIndividual))
+    # punned: typed like an individual but declared a class
+    g.add((URIRef(EX + 'Course'), RDF.type, URIRef(EX + 'Person')))
+    g.add((URIRef(EX + 'Course'), RDF.type, OWL.Class))
+    bn = BNode()
+    g.add((URIRef(EX + 'Student'), RDFS.subClassOf, bn))
+    g.add((bn, RDF.type, OWL.Restriction))
+    g.add((bn, OWL.onProperty, URIRef(EX + 'r')))
+    g.add((bn, OWL.someValuesFrom, URIRef(EX + 'Course')))
+    g.serialize(str(path), format='xml', encoding='utf-8')
+
+
+def check_entities(o: MyOWLOntology) -> None:
+    assert sorted(o.individuals) == [EX + 'alice', EX + 'bob']
+    assert sorted(o._individuals) == [URIRef(EX + 'alice'), URIRef(EX + 'bob')]
+    assert o.entities.get_kind(URIRef(EX + 'alice')) == EntityTable.INDIVIDUAL
+    assert o.entities.get_kind(URIRef(EX + 'Course')) == EntityTable.CONCEPT
+    assert o.entities.get_kind(URIRef(EX + 'r')) == EntityTable.RELATION
+    assert URIRef(EX) not in o._individuals
+    assert len(o._bnodes) == 1
+
+
+def test_entities_are_classified(tmp_path):
+    write_entity_ontology(tmp_path / 'entities.owl')
+    o = MyOWLOntology(str(tmp_path / 'entities.owl'))
+    check_entities(o)
+    assert {URIRef(EX + 'Person'), URIRef(EX + 'Student'), URIRef(EX + 'Course')} <= set(o._concepts)
+    assert o.hierarchy.get_distance(URIRef(EX + 'Student'), URIRef(EX + 'Person')) == 1
+
+
+def test_entities_survive_snapshots(tmp_path):
+    write_entity_ontology(tmp_path / 'entities.owl')
+    MyOWLOntology(str(tmp_path / 'entities.owl'), snapshot_dir=str(tmp_path / 'snapshots'))
+    o = MyOWLOntology(str(tmp_path / 'entities.owl'), snapshot_dir=str(tmp_path / 'snapshots'))
+    assert o.from_snapshot
+    check_entities(o)
+
+
+def test_delta_registers_individuals(tmp_path):
+    write_entity_ontology(tmp_path / 'entities.owl')
+    o = MyOWLOntology(str(tmp_path / 'entities.owl'))
+    o.apply_delta([(URIRef(EX + 'carol'), RDF.type, URIRef(EX + 'Person'))])
+    assert o.entities.is_individual(URIRef(EX + 'carol'))
+    assert EX + 'carol' in o.individuals
@@ -0,0 +1,81 @@
+import random
+import numpy as np
+import pytest
+from rdflib import URIRef, OWL
+from ontoindex import HierarchyIndex
+from myontology import MyOWLOntology, OWLConcept
+from conftest import MLS
+
+TOP = 'top'
+
+
+def random_edges(rnd: random.Random, nodes: list, n: int, cycles: bool) -> list:
+    edges = []
+    while len(edges) < n:
+        a, b = rnd.sample(range(len(nodes)), 2)
+        if not cycles and a < b:
+            a, b = b, a
+        edges.append((nodes[a], nodes[b]))
+    return edges
+
+
+def tables(h: HierarchyIndex) -> dict:
+    # ancestors and depths by entity, independent of the ids
+    return {n: (int(h.min_depth[i]), int(h.max_depth[i]), int(h.depth[i]),
+                dict(zip((h.nodes[a] for a in h.ancestor_ids(i).tolist()), h.ancestor_distances(i).tolist())))
+            for i, n in enumerate(h.nodes)}
+
+
+@pytest.mark.parametrize('cycles', [False, True], ids=['dag', 'cyclic'])
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_update_matches_rebuild(seed, cycles):
+    rnd = random.Random(seed)
+    nodes = ['c%d' % i for i in range(60)]
+    edges = random_edges(rnd, nodes, 90, cycles)
+    h = HierarchyIndex(nodes, edges + [(n, TOP) for n in nodes[:3]], top=TOP)
+
+    new = ['n%d' % i for i in range(5)]
+    removed = rnd.sample(edges, 15)
+    added = random_edges(rnd, nodes + new, 20, cycles)
+    updated, affected = h.update(new, added, removed)
+
+    kept = [e for e in edges if e not in removed] + added + [(n, TOP) for n in nodes[:3]]
+    shuffled = nodes + new
+    rnd.shuffle(shuffled)
+    rebuilt = HierarchyIndex(shuffled, kept, top=TOP)
+    assert tables(updated) == tables(rebuilt)
+    before = tables(h)
+    after = tables(updated)
+    assert {n for n in before if before[n] != after[n]} <= {updated.nodes[i] for i in affected.tolist()}
+
+
+def test_depths_ignore_node_order():
+    # a cycle reached from two sides, whatever the ids its members keep one depth
+    edges = [('a', TOP), ('b', 'a'), ('x', 'b'), ('y', 'x'), ('x', 'y'), ('y', 'z'), ('z', 'w')]
+    nodes = ['a', 'b', 'x', 'y', 'z', 'w']
+    first = tables(HierarchyIndex(nodes, edges, top=TOP))
+    assert tables(HierarchyIndex(nodes[::-1], edges, top=TOP)) == first
+    assert first['x'][:3] == (3, 3, 3)
+    assert first['y'][:3] == (3, 3, 4)
+    assert first['w'][:3] == (1, 1, 1)
+
+
+def test_distances():
+    h = HierarchyIndex(['a', 'b', 'c', 'd'], [('b', 'a'), ('c', 'b'), ('d', 'a'), ('c', 'd')], top=TOP)
+    assert h.get_distance('c', 'a') == 2
+    assert h.get_distance('a', 'c') == -1
+    assert h.get_depth('c') == 3
+    assert h.subsumes('a', 'c') and not h.subsumes('c', 'a')
+    assert np.array_equal(h.get_descendant_ids([h.get_id('b')]), sorted([h.get_id('b'), h.get_id('c')]))
+
+
+def test_taxonomic_similarity_matrix_matches_dps():
+    o = MyOWLOntology(MLS)
+    rnd = random.Random(0)
+    concepts = [o.get_OWL_concept(c.n3()[1:-1]) for c in rnd.sample(o._concepts, 20) + [OWL.Thing]]
+    # a class without triples in the ontology takes the pairwise path
+    concepts.append(OWLConcept(URIRef('http://www.w3.org/ns/mls#Missing'), o))
+    sim = o.taxonomic_similarity_matrix(concepts, concepts[::-1])
+    for i, a in enumerate(concepts):
+        for j, b in enumerate(concepts[::-1]):
+            assert sim[i, j] == pytest.approx(o.dps(a, b)), (a, b)
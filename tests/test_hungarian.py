@@ -0,0 +1,40 @@
+import itertools
+import numpy as np
+import pytest
+from myontology import HungarianAlgorithm
+
+SHAPES = [(1, 1), (1, 4), (3, 3), (4, 2), (2, 5), (5, 5), (6, 4)]
+
+
+def brute_force(cost: np.ndarray) -> float:
+    rows, cols = cost.shape
+    if rows <= cols:
+        return min(cost[range(rows), list(p)].sum() for p in itertools.permutations(range(cols), rows))
+    return brute_force(cost.T)
+
+
+def assignment_cost(cost: np.ndarray, assignment: np.ndarray) -> float:
+    rows, cols = cost.shape
+    assigned = [(i, j) for i, j in enumerate(assignment.tolist()) if j >= 0]
+    assert len(assigned) == min(rows, cols)
+    assert len(set(j for _, j in assigned)) == len(assigned)
+    return sum(cost[i, j] for i, j in assigned)
+
+
+@pytest.mark.parametrize('shape', SHAPES)
+def test_execute_matches_brute_force(shape):
+    rnd = np.random.default_rng(sum(shape))
+    for costs in [rnd.random(shape), rnd.integers(0, 3, shape).astype(float)]:
+        assignment = HungarianAlgorithm(costs).execute()
+        assert assignment_cost(costs, assignment) == pytest.approx(brute_force(costs), abs=1e-12)
+
+
+@pytest.mark.parametrize('shape', SHAPES)
+def test_execute_batch_matches_execute(shape):
+    rnd = np.random.default_rng(100 + sum(shape))
+    costs = np.concatenate([rnd.random((20,) + shape), rnd.integers(0, 3, (20,) + shape).astype(float)])
+    batch = HungarianAlgorithm.execute_batch(costs)
+    assert batch.shape == (len(costs), shape[0])
+    for cost, assignment in zip(costs, batch):
+        single = HungarianAlgorithm(cost).execute()
+        assert assignment_cost(cost, assignment) == pytest.approx(assignment_cost(cost, single), abs=1e-12)
@@ -0,0 +1,20 @@
+import random
+import pytest
+from myontology import MyOWLOntology
+from conftest import MLS
+
+
+@pytest.mark.parametrize('extension', ['nt', 'owl'])
+def test_module_keeps_seed_similarities(tmp_path, extension):
+    o = MyOWLOntology(MLS)
+    seeds = random.Random(0).sample(o._concepts, 12)
+    module_file = str(tmp_path / ('module.' + extension))
+    o.extract_module(seeds, module_file)
+    m = MyOWLOntology(module_file)
+    assert len(m._concepts) < len(o._concepts)
+    for a in seeds:
+        for b in seeds:
+            x, y = o.get_OWL_concept(a.n3()[1:-1]), o.get_OWL_concept(b.n3()[1:-1])
+            mx, my = m.get_OWL_concept(a.n3()[1:-1]), m.get_OWL_concept(b.n3()[1:-1])
+            assert m.dps(mx, my) == pytest.approx(o.dps(x, y)), (a, b)
+            assert mx.taxonomic_similarity(my) == pytest.approx(x.taxonomic_similarity(y)), (a, b)
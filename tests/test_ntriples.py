@@ -0,0 +1,56 @@
+from rdflib import BNode, Graph, Literal, URIRef
+from conftest import ANONYMOUS
+from ontostore import load_ntriples, read_ntriples_lines
+import utils
+
+P = '<http://example.org/p>'
+
+
+def test_blank_nodes_before_the_closing_dot():
+    tokens, rows, skipped = read_ntriples_lines(['_:b1 ' + P + ' _:b2.', '_:b.1 ' + P + ' _:b..2 .\n',
+                                                 '<http://example.org/a> ' + P + ' _:b3 <http://example.org/g>.'])
+    assert skipped == 0
+    assert [[tokens[i] for i in row] for row in rows.tolist()] == [['_:b1', P, '_:b2'], ['_:b.1', P, '_:b..2'],
+                                                                   ['<http://example.org/a>', P, '_:b3']]
+
+
+def test_skipped_lines_are_counted():
+    lines = ['# comment', '', '<http://example.org/a> ' + P + ' "literal"@en .',
+             '<http://example.org/a> ' + P + ' <http://example.org/b> . # trailing comment',
+             '<http://example.org/a> ' + P, 'garbage']
+    tokens, rows, skipped = read_ntriples_lines(lines)
+    assert len(rows) == 1
+    assert skipped == 2
+
+
+def test_load_matches_rdflib(tmp_path, capsys):
+    g = Graph()
+    for _, stream in utils.open_archive(ANONYMOUS):
+        g.parse(stream, format='xml')
+    path = str(tmp_path / 'anonymous.nt')
+    g.serialize(path, format='nt', encoding='utf-8')
+    store = load_ntriples(path)
+    assert 'malformed' not in capsys.readouterr().out
+    expected = {t for t in g if not isinstance(t[2], Literal)}
+    assert len(store) == len(expected)
+    named = lambda triples: {t for t in triples if not any(isinstance(x, BNode) for x in t)}
+    assert named(store) == named(expected)
+    assert sum(1 for t in store if isinstance(t[0], BNode)) == sum(1 for t in expected if isinstance(t[0], BNode))
+
+    with open(path, 'a') as f:
+        f.write('<http://example.org/a> <http://example.org/p>\n')
+    assert len(load_ntriples(path)) == len(expected)
+    assert 'Skipped 1 malformed lines' in capsys.readouterr().out
+
+
+def test_chunks_merge_like_one_pass(tmp_path):
+    g = Graph()
+    for _, stream in utils.open_archive(ANONYMOUS):
+        g.parse(stream, format='xml')
+    path = str(tmp_path / 'anonymous.nt')
+    g.serialize(path, format='nt', encoding='utf-8')
+    single = load_ntriples(path)
+    for processes in [2, 5]:
+        merged = load_ntriples(path, processes)
+        assert set(merged) == set(single)
+        assert len(merged.terms) == len(single.terms)
@@ -0,0 +1,43 @@
+import json
+import os
+import pytest
+from rdflib import URIRef
+from conftest import MLS, ANONYMOUS
+from myontology import MyOWLOntology
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+# figures recorded with the original, unindexed MyOWLOntology on the same ontologies
+BASELINES = {MLS: 'mls.json', ANONYMOUS: 'anonymous.json'}
+
+
+def load_baseline(ontology_file: str) -> dict:
+    with open(os.path.join(DATA, BASELINES[ontology_file])) as f:
+        return json.load(f)
+
+
+def check_ontology(o: MyOWLOntology, expected: dict) -> None:
+    for u, anc in expected['ancestors'].items():
+        assert sorted(str(a) for a in o.get_super_classes(URIRef(u))) == anc, u
+    for u, depth in expected['prof'].items():
+        assert o.prof(URIRef(u)) == depth, u
+    for pair, value in expected['dps'].items():
+        a, b = pair.split(' ')
+        assert o.dps(o.get_OWL_concept(a), o.get_OWL_concept(b)) == pytest.approx(value, abs=1e-12), pair
+    for u, links in expected['links'].items():
+        assert sorted(str(l) for l in o.get_concept_OWL_link(o.get_OWL_concept(u))) == links, u
+    for pair, value in expected['similarity'].items():
+        a, b = pair.split(' ')
+        assert o.get_OWL_concept(a).similarity(o.get_OWL_concept(b)) == pytest.approx(value, abs=1e-12), pair
+    for pair, value in expected['property_similarity'].items():
+        a, b = pair.split(' ')
+        assert o.taxonomic_property_similarity(URIRef(a), URIRef(b)) == pytest.approx(value, abs=1e-12), pair
+    for u, depth in expected['property_prof'].items():
+        assert o.prof(URIRef(u)) == depth, u
+
+
+def test_matches_baseline(ontology_file):
+    check_ontology(MyOWLOntology(ontology_file), load_baseline(ontology_file))
+
+
+def test_matches_baseline_without_memo(ontology_file):
+    check_ontology(MyOWLOntology(ontology_file, similarity_cache=0), load_baseline(ontology_file))
@@ -0,0 +1,21 @@
+import pytest
+from rdflib import RDFS
+from conftest import MLS
+from myontology import MyOWLOntology
+from test_parity import check_ontology, load_baseline
+
+pytest.importorskip('owlready2')
+
+
+def test_quadstore_matches_baseline(tmp_path):
+    o = MyOWLOntology(MLS, quadstore=str(tmp_path / 'mls.sqlite3'))
+    check_ontology(o, load_baseline(MLS))
+
+
+def test_snapshot_hit_loads_quadstore(tmp_path):
+    MyOWLOntology(MLS, snapshot_dir=str(tmp_path / 'snapshots'), quadstore=str(tmp_path / 'first.sqlite3'))
+    # the snapshot is found, the new store still has to hold the triples
+    o = MyOWLOntology(MLS, snapshot_dir=str(tmp_path / 'snapshots'), quadstore=str(tmp_path / 'second.sqlite3'))
+    assert o.from_snapshot
+    assert len(list(o.o.triples((None, RDFS.subClassOf, None)))) > 0
+    check_ontology(o, load_baseline(MLS))
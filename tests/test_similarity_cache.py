@@ -0,0 +1,58 @@
+from ontoindex import SimilarityCache
+
+
+def test_symmetric_hits():
+    c = SimilarityCache()
+    assert c.get('concept', 'a', 'b') is None
+    c.put('concept', 'a', 'b', 0.5)
+    assert c.get('concept', 'b', 'a') == 0.5
+    assert c.get('link', 'a', 'b') is None
+    stats = c.get_stats()
+    assert stats['concept'] == {'hits': 1, 'misses': 1, 'evictions': 0, 'entries': 1}
+    assert stats['terms'] == 2
+
+
+def test_lookups_do_not_intern():
+    c = SimilarityCache()
+    for i in range(100):
+        c.get('concept', i, i + 1)
+    assert c.get_stats()['terms'] == 0
+    assert c.get_bytes() == 0
+
+
+def test_budget_counts_terms():
+    pair = SimilarityCache.ENTRY_BYTES + 2 * SimilarityCache.TERM_BYTES
+    c = SimilarityCache(10 * pair)
+    for i in range(1000):
+        c.put('concept', 2 * i, 2 * i + 1, 0.1)
+        assert c.get_bytes() <= 10 * pair
+    assert len(c) == 10
+    # the terms of evicted pairs are forgotten with them
+    assert len(c.ids) == len(c.terms) == len(c.refs) == 20
+    assert c.get_stats()['concept']['evictions'] == 990
+
+
+def test_evict_counts_and_prunes():
+    c = SimilarityCache()
+    c.put('concept', 'a', 'b', 0.1)
+    c.put('concept', 'a', 'c', 0.2)
+    c.put('concept', 'b', 'c', 0.3)
+    c.put('link', 'a', 'b', 0.4)
+    assert c.evict(lambda t: t == 'a', ['concept']) == 2
+    assert c.get('concept', 'a', 'b') is None
+    assert c.get('concept', 'b', 'c') == 0.3
+    assert c.get('link', 'a', 'b') == 0.4
+    assert c.get_stats()['concept']['evictions'] == 2
+    assert c.evict(lambda t: t == 'a') == 1
+    assert 'a' not in c.ids
+    assert sorted(c.ids) == ['b', 'c']
+    # a term seen again gets a fresh id
+    c.put('concept', 'a', 'b', 0.5)
+    assert c.get('concept', 'b', 'a') == 0.5
+
+
+def test_disabled():
+    c = SimilarityCache(0)
+    c.put('concept', 'a', 'b', 0.5)
+    assert c.get('concept', 'a', 'b') is None
+    assert len(c.ids) == 0
@@ -0,0 +1,52 @@
+from rdflib import BNode
+from rdflib.compare import isomorphic
+from myontology import MyOWLOntology
+from conftest import MLS
+from test_parity import check_ontology, load_baseline
+
+
+def test_snapshot_round_trip(tmp_path, ontology_file):
+    first = MyOWLOntology(ontology_file, snapshot_dir=str(tmp_path))
+    assert not first.from_snapshot
+    o = MyOWLOntology(ontology_file, snapshot_dir=str(tmp_path))
+    assert o.from_snapshot
+    check_ontology(o, load_baseline(ontology_file))
+
+
+def test_derived_cache_round_trip(tmp_path, ontology_file):
+    expected = load_baseline(ontology_file)
+    first = MyOWLOntology(ontology_file, snapshot_dir=str(tmp_path))
+    check_ontology(first, expected)
+    first.save_derived_cache()
+    o = MyOWLOntology(ontology_file, snapshot_dir=str(tmp_path))
+    assert o.derived is not None
+    assert o.derived['neighbor_known'].sum() > 0
+    check_ontology(o, expected)
+    # entries computed after the reload are added to the ones read back
+    o.save_derived_cache()
+    again = MyOWLOntology(ontology_file, snapshot_dir=str(tmp_path))
+    assert again.derived['neighbor_known'].sum() == o.derived['neighbor_known'].sum()
+    check_ontology(again, expected)
+
+
+def test_snapshot_reads_triples_on_demand(tmp_path, ontology_file):
+    fresh = MyOWLOntology(ontology_file, snapshot_dir=str(tmp_path))
+    o = MyOWLOntology(ontology_file, snapshot_dir=str(tmp_path))
+    assert o.from_snapshot and len(o.o) == 0
+    seeds = fresh._concepts[:5]
+    # blank nodes are renamed by every parse
+    assert isomorphic(o.extract_module(seeds), fresh.extract_module(seeds))
+    assert len(o.o) == len(fresh.o)
+    for ind in fresh._individuals:
+        types, expected = o.get_types(ind, False), fresh.get_types(ind, False)
+        assert len(types) == len(expected)
+        assert {t for t in types if not isinstance(t, BNode)} == {t for t in expected if not isinstance(t, BNode)}
+        a, b = o.individuals[ind.n3()[1:-1]], fresh.individuals[ind.n3()[1:-1]]
+        assert sorted(map(str, o.get_individual_OWL_link(a))) == sorted(map(str, fresh.get_individual_OWL_link(b)))
+
+
+def test_snapshot_depends_on_loading_options(tmp_path):
+    MyOWLOntology(MLS, snapshot_dir=str(tmp_path))
+    o = MyOWLOntology(MLS, snapshot_dir=str(tmp_path), compiled=True)
+    assert not o.from_snapshot
+    assert len(list(tmp_path.iterdir())) == 2
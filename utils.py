@@ -1,4 +1,6 @@
 import os
+import gzip
+import zipfile
 # from myontology import *
 
 def similarity2csv(v1: list, v2: list=None, sim_type='similarity', file=None, cartesian=True):
@@ -101,4 +103,55 @@ def generate_bigraph(vertices1: list, vertices2: list, edges: list, outdir='/mnt
         bgf.write('{:d}\n'.format(len(edges)))
         for v1, v2, w in edges:
             if w >= 0.0:
-                bgf.write('{}\t{}\t{:.8f}\n'.format(str(v1), str(v2), w))
\ No newline at end of file
+                bgf.write('{}\t{}\t{:.8f}\n'.format(str(v1), str(v2), w))
+
+# ontologies shipped as archives, read without extracting them to disk
+def split_archive_path(path: str):
+    """
+    Split a path into the archive on disk and the member inside it
+    :param path: a plain file, an archive (.zip, .gz) or a member of a zip archive such as 'ontologies/go.zip/go.owl'
+
+    :return: (file on disk, member name or None)
+    """
+    if os.path.exists(path):
+        return path, None
+    head, member = path, []
+    while head and not os.path.isfile(head):
+        head, tail = os.path.split(head)
+        if not tail:
+            break
+        member.insert(0, tail)
+    if head and head.lower().endswith('.zip'):
+        return head, '/'.join(member)
+    return path, None
+
+
+def is_archive(path: str) -> bool:
+    archive, _ = split_archive_path(path)
+    return archive.lower().endswith(('.zip', '.gz'))
+
+
+def open_archive(path: str):
+    """
+    Stream the ontology files stored in an archive, decompressing while they are read
+    :param path: a .gz file, a .zip archive (every member is read) or a member of a zip archive
+
+    :return: generator of (member name, binary file object), each object is closed once the next one is requested
+    """
+    archive, member = split_archive_path(path)
+    if archive.lower().endswith('.gz'):
+        with gzip.open(archive, 'rb') as stream:
+            yield os.path.basename(archive)[:-3], stream
+        return
+    with zipfile.ZipFile(archive) as z:
+        if member:
+            names = [member]
+        else:
+            names = [n for n in z.namelist() if not n.endswith('/') and not n.startswith('__MACOSX/')]
+        for name in names:
+            with z.open(name) as stream:
+                if name.lower().endswith('.gz'):
+                    with gzip.open(stream, 'rb') as inner:
+                        yield name[:-3], inner
+                else:
+                    yield name, stream